@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+"""
+Generate synthetic exchange histories for benchmarks.
+
+Trades are written in the Bitso & QuadrigaCX CSV format, spread over several
+files, along with an exchange rate file covering every day of the history.
+Sells never exceed the units held, so the whole history can be calculated.
+"""
+import argparse
+from datetime import date, datetime, timedelta
+import json
+import os
+import random
+import shutil
+import sys
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'),
+)
+
+# The package is imported from the source tree, once it is on the path
+# pylint: disable=wrong-import-position
+from crypto_taxes.scanner import iter_lines_reversed, map_file
+
+
+HEADER = 'type,major,minor,amount,rate,value,fee,total,timestamp,datetime\n'
+FEE_RATE = 0.005
+
+# Starting prices of the assets in CAD
+ASSET_PRICES = {
+    'btc': 1000.0,
+    'eth': 10.0,
+    'xrp': 0.01,
+    'ltc': 5.0,
+    'bch': 500.0,
+}
+
+# Starting exchange rates of the fiat currencies, per CAD
+FIAT_RATES = {
+    'cad': 1.0,
+    'mxn': 13.9,
+    'usd': 0.77,
+}
+
+
+def parse_mix(mix, known):
+    """
+    Parse a comma separated list of name:weight pairs.
+    """
+    weights = {}
+
+    for part in mix.split(','):
+        name, _, weight = part.partition(':')
+        name = name.strip().lower()
+
+        if name not in known:
+            raise ValueError('Unknown name in mix: {}'.format(name))
+
+        weights[name] = float(weight) if weight else 1.0
+
+    return weights
+
+
+def random_walk(value, volatility, generator):
+    """
+    Take a step of a multiplicative random walk.
+    """
+    return value * (1.0 + generator.gauss(0.0, volatility))
+
+
+def generate_rates(start, days, fiats, generator):
+    """
+    Generate the exchange rate of each fiat currency for each day.
+    """
+    rates = {}
+    current = {fiat: FIAT_RATES[fiat] for fiat in fiats if fiat != 'cad'}
+
+    for day in range(days):
+        for fiat in current:
+            current[fiat] = random_walk(current[fiat], 0.003, generator)
+
+        rates[start + timedelta(days=day)] = dict(current)
+
+    return rates
+
+
+def write_rates(filename, rates):
+    """
+    Write the exchange rate file.
+    """
+    with open(filename, 'wt') as rates_file:
+        rates_file.write('date,currency,rate\n')
+
+        for day, day_rates in sorted(rates.items()):
+            for fiat, rate in sorted(day_rates.items()):
+                rates_file.write('{},{},{:.4f}\n'.format(
+                    day.strftime('%Y/%m/%d'),
+                    fiat,
+                    rate,
+                ))
+
+
+def round_units(value):
+    """
+    Round a value to the 8 decimal places written to the files.
+    """
+    return float('{:.8f}'.format(value))
+
+
+def format_row(trade_type, asset, fiat, amount, rate, timestamp):
+    """
+    Format a trade as a CSV row, with the fee taken from the total.
+    """
+    value = round_units(amount * rate)
+
+    if trade_type == 'buy':
+        fee = amount * FEE_RATE
+        total = amount - fee
+    else:
+        fee = value * FEE_RATE
+        total = value - fee
+
+    return '{},{},{},{:.8f},{:.8f},{:.8f},{:.8f},{:.8f},{},{}\n'.format(
+        trade_type,
+        asset,
+        fiat,
+        amount,
+        rate,
+        value,
+        fee,
+        total,
+        timestamp,
+        datetime.fromtimestamp(timestamp).strftime('%m/%d/%Y %H:%M:%S'),
+    )
+
+
+def generate_trades(args, rates, generator):
+    """
+    Generate the rows of the trades in chronological order, with the file
+    each one belongs to.
+    """
+    assets = parse_mix(args.assets, ASSET_PRICES)
+    fiats = parse_mix(args.fiats, FIAT_RATES)
+    asset_names = list(assets)
+    asset_weights = list(assets.values())
+    fiat_names = list(fiats)
+    fiat_weights = list(fiats.values())
+    prices = {asset: ASSET_PRICES[asset] for asset in assets}
+    holdings = {asset: 0.0 for asset in assets}
+
+    start = datetime(args.start.year, args.start.month, args.start.day)
+    timestamp = start.timestamp()
+    step = args.years * 365 * 24 * 3600 / args.rows
+
+    for _ in range(args.rows):
+        timestamp += generator.expovariate(1.0 / step)
+        asset = generator.choices(asset_names, asset_weights)[0]
+        fiat = generator.choices(fiat_names, fiat_weights)[0]
+        prices[asset] = random_walk(prices[asset], 0.01, generator)
+
+        trade_date = datetime.fromtimestamp(timestamp).date()
+        day_rates = rates.get(trade_date, {})
+        rate = round_units(prices[asset] * day_rates.get(fiat, 1.0))
+        held = holdings[asset]
+
+        if held > 0 and generator.random() >= args.buy_ratio:
+            trade_type = 'sell'
+            amount = round_units(held * generator.uniform(0.05, 0.5))
+            holdings[asset] -= amount
+        else:
+            trade_type = 'buy'
+            amount = round_units(
+                generator.uniform(1.0, 100.0) * 100.0 / prices[asset]
+            )
+            holdings[asset] += round_units(amount * (1 - FEE_RATE))
+
+        row = format_row(
+            trade_type,
+            asset,
+            fiat,
+            amount,
+            rate,
+            round(timestamp, 3),
+        )
+
+        yield generator.randrange(args.files), row
+
+
+def reverse_file(filename):
+    """
+    Reverse the rows of a CSV file, keeping the header first.
+    """
+    reversed_filename = '{}.reversed'.format(filename)
+
+    with map_file(filename) as source, \
+            open(reversed_filename, 'wb') as target:
+        header_end = source.find(b'\n') + 1
+        target.write(source[:header_end])
+
+        for line in iter_lines_reversed(source, header_end, len(source)):
+            target.write(line.rstrip(b'\r\n') + b'\n')
+
+    shutil.move(reversed_filename, filename)
+
+
+def main():
+    """
+    Main entry point from CLI.
+    """
+    args = parse_args()
+    generator = random.Random(args.seed)
+    os.makedirs(args.output, exist_ok=True)
+
+    days = args.years * 366 + 30
+    fiats = parse_mix(args.fiats, FIAT_RATES)
+    rates = generate_rates(args.start, days, fiats, generator)
+    write_rates(os.path.join(args.output, 'exchange-rates.csv'), rates)
+
+    filenames = [
+        os.path.join(args.output, 'trades-{:03d}.csv'.format(index))
+        for index in range(args.files)
+    ]
+    files = [open(filename, 'wt') for filename in filenames]
+
+    try:
+        for trades_file in files:
+            trades_file.write(HEADER)
+
+        for index, row in generate_trades(args, rates, generator):
+            files[index].write(row)
+    finally:
+        for trades_file in files:
+            trades_file.close()
+
+    if args.order == 'descending':
+        for filename in filenames:
+            reverse_file(filename)
+
+    json.dump(
+        {
+            'trades': filenames,
+            'exchange_rates': os.path.join(args.output, 'exchange-rates.csv'),
+            'rows': args.rows,
+            'seed': args.seed,
+        },
+        sys.stdout,
+        indent=2,
+    )
+    print()
+
+
+def parse_args():
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--rows',
+        default=10000,
+        help='The total number of trades to generate',
+        type=int,
+    )
+    parser.add_argument(
+        '--files',
+        default=4,
+        help='The number of trade files to spread the trades over',
+        type=int,
+    )
+    parser.add_argument(
+        '--assets',
+        default='btc:5,eth:3,xrp:2',
+        help='Comma separated assets with their relative weights, from {}'
+        .format(', '.join(sorted(ASSET_PRICES))),
+        type=str,
+    )
+    parser.add_argument(
+        '--fiats',
+        default='cad:7,mxn:3',
+        help='Comma separated fiat currencies with their relative weights, '
+        'from {}'.format(', '.join(sorted(FIAT_RATES))),
+        type=str,
+    )
+    parser.add_argument(
+        '--buy-ratio',
+        default=0.6,
+        help='The fraction of trades that are buys',
+        type=float,
+    )
+    parser.add_argument(
+        '--start',
+        default=date(2015, 1, 1),
+        help='The date of the first trade (yyyy-mm-dd)',
+        type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+    )
+    parser.add_argument(
+        '--years',
+        default=4,
+        help='The number of years the trades are spread over',
+        type=int,
+    )
+    parser.add_argument(
+        '--order',
+        choices=['ascending', 'descending'],
+        default='descending',
+        help='The order of the rows in the files, where the exchange exports '
+        'are newest first',
+    )
+    parser.add_argument(
+        '--seed',
+        default=0,
+        help='The seed of the random generator, for repeatable histories',
+        type=int,
+    )
+    parser.add_argument(
+        'output',
+        help='Directory to write the trade and exchange rate files to',
+        type=str,
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
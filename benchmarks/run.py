@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""
+Benchmark the stages of a calculation.
+
+Each stage is timed on its own: parsing the trade files, ordering and
+merging the parsed trades, validating the exchange rates, the calculation,
+and printing the output. The parsed and ordered trades are kept in trade
+stores between the stages, so that each stage only measures its own work.
+The results are written as JSON, to be compared between versions.
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..',
+    'src',
+)
+sys.path.insert(0, SRC_DIR)
+
+# The package is imported from the source tree, once it is on the path
+# pylint: disable=wrong-import-position
+from crypto_taxes.arguments import add_input_arguments
+from crypto_taxes.calculator import Calculator, CSVReader
+from crypto_taxes.exchange_rates import ExchangeRateTable
+from crypto_taxes.records import TradeStore
+from crypto_taxes.writers import CSVWriter
+from ctc import (
+    find_missing_exchange_rates,
+    iter_trade_files,
+)
+
+
+def time_stage(results, name, rows, function, *args):
+    """
+    Run a stage of the benchmark, recording its wall and CPU time.
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    value = function(*args)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    count = rows(value) if callable(rows) else rows
+
+    results[name] = {
+        'wall_seconds': wall,
+        'cpu_seconds': cpu,
+        'rows': count,
+        'rows_per_second': count / wall if wall else None,
+    }
+    print(
+        '{:<10} {:>10.3f}s {:>12} rows'.format(name, wall, count),
+        file=sys.stderr,
+    )
+
+    return value
+
+
+def parse(filenames):
+    """
+    Parse each of the trade files into a trade store.
+    """
+    csv_reader = CSVReader()
+
+    return {
+        filename: TradeStore(csv_reader.iter_trades(filename))
+        for filename in filenames
+    }
+
+
+def order(stores, asset):
+    """
+    Order and merge the parsed trades of an asset.
+    """
+    csv_reader = CSVReader()
+
+    for filename, store in stores.items():
+        csv_reader.add_store(filename, store)
+
+    return TradeStore(iter_trade_files(list(stores), asset, csv_reader))
+
+
+def validate(trades, exchange_rates, base_currency):
+    """
+    Find the exchange rates missing for the trades.
+    """
+    return find_missing_exchange_rates(
+        iter(trades),
+        exchange_rates,
+        base_currency,
+    )
+
+
+def calculate(trades, exchange_rates, base_currency, asset, tax_year):
+    """
+    Calculate the tax year, replaying the earlier years of the history so
+    that every trade is processed.
+    """
+    calculator = Calculator(iter(trades), exchange_rates, base_currency)
+    results = calculator.calculate_assets(
+        [asset],
+        tax_year,
+        on_year_end=lambda year, results, timestamps: None,
+    )
+
+    return results[asset]
+
+
+def output(result):
+    """
+    Write the result of the calculation, discarding the output.
+    """
+    with open(os.devnull, 'wt') as devnull:
+        writer = CSVWriter(devnull)
+        writer.write_result(result)
+        writer.close()
+
+
+def git_revision():
+    """
+    Get the git revision of the code being benchmarked, if there is one.
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=SRC_DIR,
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """
+    Main entry point from CLI.
+    """
+    args = parse_args()
+    exchange_rates = ExchangeRateTable(args.exchange_rate_fill)
+
+    if args.exchange_rates:
+        exchange_rates = ExchangeRateTable.from_csv(
+            args.exchange_rates,
+            args.exchange_rate_fill,
+        )
+
+    stages = {}
+    stores = time_stage(
+        stages,
+        'parse',
+        lambda value: sum(len(store) for store in value.values()),
+        parse,
+        args.trades,
+    )
+    trades = time_stage(stages, 'sort', len, order, stores, args.asset)
+    tax_year = args.tax_year
+
+    if tax_year is None and len(trades):
+        tax_year = datetime.fromtimestamp(trades.timestamps[-1]).year
+
+    missing = time_stage(
+        stages,
+        'validate',
+        len(trades),
+        validate,
+        trades,
+        exchange_rates,
+        args.base_currency,
+    )
+
+    if missing:
+        print(
+            '{} exchange rates are missing'.format(len(missing)),
+            file=sys.stderr,
+        )
+        raise SystemExit(1)
+
+    result = time_stage(
+        stages,
+        'calculate',
+        len(trades),
+        calculate,
+        trades,
+        exchange_rates,
+        args.base_currency,
+        args.asset,
+        tax_year,
+    )
+    time_stage(stages, 'output', len(result['events']), output, result)
+
+    report = {
+        'revision': git_revision(),
+        'time': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'trades': args.trades,
+            'exchange_rates': args.exchange_rates,
+            'asset': args.asset,
+            'base_currency': args.base_currency,
+            'tax_year': tax_year,
+        },
+        'stages': stages,
+    }
+
+    if args.output:
+        with open(args.output, 'wt') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def parse_args():
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    add_input_arguments(parser)
+    parser.add_argument(
+        '--tax-year',
+        default=None,
+        help='The tax year to calculate, by default the year of the last '
+        'trade',
+        type=int,
+    )
+    parser.add_argument(
+        '--output',
+        default=None,
+        help='Path to write the JSON results to, instead of stdout',
+        type=str,
+    )
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    main()
@@ -16,5 +16,8 @@ setup(
     package_dir={'': 'src'},
     py_modules=[splitext(basename(path))[0] for path in glob('src/*.py')],
     include_package_data=True,
+    extras_require={
+        'numpy': ['numpy'],
+    },
     zip_safe=False
 )
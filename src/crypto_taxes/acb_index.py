@@ -0,0 +1,190 @@
+"""
+Point in time index of the holdings of each asset.
+
+The index keeps the ACB, units held and capital gains of an asset after each
+of its trades, sorted by timestamp, so the holdings as of any date are found
+by a binary search rather than by calculating again. Capital gains are
+cumulative over the whole history, rather than reset each tax year, so the
+gains between two dates are the difference of two lookups.
+"""
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal
+import json
+import os
+
+from .files import atomic_write
+
+
+ZERO = Decimal('0')
+
+
+def to_timestamp(when):
+    """
+    Get the timestamp of a datetime, or return a timestamp as is.
+    """
+    if isinstance(when, datetime):
+        return when.timestamp()
+
+    return when
+
+
+class AssetHistory():
+    """
+    The holdings of a single asset after each of its trades.
+    """
+    def __init__(self, initial_acb=ZERO, initial_units_held=ZERO):
+        self.initial_acb = initial_acb
+        self.initial_units_held = initial_units_held
+        self.timestamps = array('d')
+        self.acbs = []
+        self.units_held = []
+        self.capital_gains = []
+
+    def add(self, timestamp, acb, units_held, capital_gain):
+        """
+        Add the holdings after a trade, which must not be earlier than the
+        trades already added.
+        """
+        total = self.capital_gains[-1] if self.capital_gains else ZERO
+
+        self.timestamps.append(timestamp)
+        self.acbs.append(acb)
+        self.units_held.append(units_held)
+        self.capital_gains.append(total + capital_gain)
+
+    def as_of(self, when):
+        """
+        Get the holdings after all of the trades at or before a time.
+        """
+        position = bisect_right(self.timestamps, to_timestamp(when)) - 1
+
+        if position < 0:
+            return {
+                'acb': self.initial_acb,
+                'units_held': self.initial_units_held,
+                'capital_gains': ZERO,
+            }
+
+        return {
+            'acb': self.acbs[position],
+            'units_held': self.units_held[position],
+            'capital_gains': self.capital_gains[position],
+        }
+
+
+class ACBIndex():
+    """
+    Index of the holdings of each asset over time.
+    """
+    def __init__(self, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.histories = {}
+
+    def start(self, asset, initial_acb=None, initial_units_held=None):
+        """
+        Start the history of an asset, from initial holdings if there was
+        trading before the history.
+        """
+        self.histories[asset] = AssetHistory(
+            initial_acb if initial_acb is not None else ZERO,
+            initial_units_held if initial_units_held is not None else ZERO,
+        )
+
+    def add(self, asset, timestamp, event):
+        """
+        Add the holdings after the event of a trade of an asset.
+        """
+        if asset not in self.histories:
+            self.start(asset)
+
+        self.histories[asset].add(
+            timestamp,
+            event['acb'],
+            event['units_held'],
+            event['capital_gain'],
+        )
+
+    def assets(self):
+        """
+        Get the assets in the index.
+        """
+        return sorted(self.histories)
+
+    def as_of(self, asset, when):
+        """
+        Get the ACB, units held and cumulative capital gains of an asset
+        after all of its trades at or before a datetime or timestamp.
+        """
+        if asset not in self.histories:
+            raise KeyError(asset)
+
+        return self.histories[asset].as_of(when)
+
+    def gains_between(self, asset, start, stop):
+        """
+        Get the capital gains of an asset from the trades after the start
+        and at or before the stop.
+        """
+        return self.as_of(asset, stop)['capital_gains'] \
+            - self.as_of(asset, start)['capital_gains']
+
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        """
+        Load an index from a JSON file, or return None if there is no file,
+        or it was built from different inputs.
+        """
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rt') as index_file:
+            data = json.load(index_file)
+
+        if fingerprint is not None and data['fingerprint'] != fingerprint:
+            return None
+
+        index = cls(data['fingerprint'])
+
+        for asset, values in data['assets'].items():
+            history = AssetHistory(
+                Decimal(values['initial_acb']),
+                Decimal(values['initial_units_held']),
+            )
+            history.timestamps.extend(values['timestamps'])
+            history.acbs = [Decimal(value) for value in values['acbs']]
+            history.units_held = [
+                Decimal(value) for value in values['units_held']
+            ]
+            history.capital_gains = [
+                Decimal(value) for value in values['capital_gains']
+            ]
+            index.histories[asset] = history
+
+        return index
+
+    def save(self, path):
+        """
+        Write the index to a JSON file, replacing it atomically.
+        """
+        data = {
+            'fingerprint': self.fingerprint,
+            'assets': {
+                asset: {
+                    'initial_acb': str(history.initial_acb),
+                    'initial_units_held': str(history.initial_units_held),
+                    'timestamps': list(history.timestamps),
+                    'acbs': [str(value) for value in history.acbs],
+                    'units_held': [
+                        str(value) for value in history.units_held
+                    ],
+                    'capital_gains': [
+                        str(value) for value in history.capital_gains
+                    ],
+                }
+                for asset, history in self.histories.items()
+            },
+        }
+        with atomic_write(path) as index_file:
+            json.dump(data, index_file)
@@ -0,0 +1,262 @@
+"""
+Command line arguments of the calculator.
+"""
+import argparse
+from decimal import Decimal
+
+from .cache import DEFAULT_MAX_SIZE
+from .exchange_rates import FILL_NONE, FILL_POLICIES
+from .writers import WRITERS
+
+
+DEFAULT_BASE_CURRENCY = 'cad'
+DEFAULT_ASSET = 'btc'
+DEFAULT_WORKERS = 4
+
+# The formats that are written to a file of their own, rather than a stream
+FILE_FORMATS = ('parquet', 'sqlite')
+
+
+def parse_assets(args):
+    """
+    Get the list of assets to calculate, or None for every traded asset.
+    """
+    if args.assets is None:
+        return [args.asset]
+
+    if args.assets == 'all':
+        return None
+
+    return [asset.strip().lower() for asset in args.assets.split(',')]
+
+
+def parse_years(value):
+    """
+    Parse a range of years like 2017-2024, or a single year.
+    """
+    first, _, last = value.partition('-')
+
+    try:
+        years = int(first), int(last or first)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'invalid range of years: {!r}'.format(value)
+        )
+
+    if years[0] > years[1]:
+        raise argparse.ArgumentTypeError(
+            'the range of years is reversed: {!r}'.format(value)
+        )
+
+    return years
+
+
+def add_input_arguments(parser):
+    """
+    Add the arguments of the trade files, the exchange rates, the asset and
+    the base currency to a parser, which are shared with the benchmarks.
+    """
+    parser.add_argument(
+        '--base-currency',
+        default=DEFAULT_BASE_CURRENCY,
+        help="The base currency for calculations",
+        type=str,
+    )
+    parser.add_argument(
+        '--exchange-rates',
+        default=None,
+        help="Path to CSV file containing historical exchange rates",
+        type=str,
+    )
+    parser.add_argument(
+        '--exchange-rate-fill',
+        choices=FILL_POLICIES,
+        default=FILL_NONE,
+        help='How to fill dates without an exchange rate, such as weekends '
+        'and holidays: with the rate of the previous date that has one, or '
+        'of the nearest date',
+    )
+    parser.add_argument(
+        '--asset',
+        default=DEFAULT_ASSET,
+        help='The symbol of the crypto asset that was traded',
+        type=str,
+    )
+    parser.add_argument(
+        'trades',
+        help='Path to CSV file(s) containing trade history',
+        type=str,
+        nargs='+',
+    )
+
+
+def parse_args():
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    add_input_arguments(parser)
+    parser.add_argument(
+        '--initial-acb',
+        default=Decimal('0'),
+        help='The initial acb if prior trade history is not available',
+        type=Decimal,
+    )
+    parser.add_argument(
+        '--initial-units-held',
+        default=Decimal('0'),
+        help='The initial units held if prior trade history is not available',
+        type=Decimal,
+    )
+    parser.add_argument(
+        '--assets',
+        default=None,
+        help='Comma separated symbols of the crypto assets to calculate in a '
+        'single pass, or "all" for every asset that was traded',
+        type=str,
+    )
+    parser.add_argument(
+        '--checkpoints',
+        default=None,
+        help='Path to a file of year end checkpoints, used to start the tax '
+        'year without replaying the earlier years',
+        type=str,
+    )
+    parser.add_argument(
+        '--state',
+        default=None,
+        help='Path to a file of the state of the trade files, used to only '
+        'process the trades added to them since the last run',
+        type=str,
+    )
+    parser.add_argument(
+        '--cache',
+        action='store_true',
+        help='Cache the parsed trade files, so that later runs on the same '
+        'files do not parse them again',
+    )
+    parser.add_argument(
+        '--cache-dir',
+        default=None,
+        help='Directory of the cache of parsed trade files used with '
+        '--cache, by default crypto_taxes in the user cache directory',
+        type=str,
+    )
+    parser.add_argument(
+        '--cache-size',
+        default=DEFAULT_MAX_SIZE,
+        help='The maximum size of the cache of parsed trade files, in bytes',
+        type=int,
+    )
+    parser.add_argument(
+        '--jobs',
+        default=1,
+        help='The number of processes used to parse the trade files, with '
+        'large files split into chunks',
+        type=int,
+    )
+    parser.add_argument(
+        '--serve',
+        default=None,
+        help='Run a calculation service with an HTTP/JSON API on the given '
+        '[host:]port, keeping the trades and results in memory',
+        type=str,
+    )
+    parser.add_argument(
+        '--workers',
+        default=DEFAULT_WORKERS,
+        help='The number of worker threads of the calculation service, '
+        'which overlap requests but share a single CPU',
+        type=int,
+    )
+    parser.add_argument(
+        '--as-of',
+        default=None,
+        help='Comma separated yyyy-mm-dd dates to print the ACB, units held '
+        'and capital gains as of the end of, instead of a tax year',
+        type=str,
+    )
+    parser.add_argument(
+        '--gains-between',
+        default=None,
+        help='Two comma separated yyyy-mm-dd dates to print the capital '
+        'gains between, inclusive, instead of a tax year',
+        type=str,
+    )
+    parser.add_argument(
+        '--acb-index',
+        default=None,
+        help='Path to a file of the ACB index used for --as-of and '
+        '--gains-between, reused while the inputs are unchanged',
+        type=str,
+    )
+    parser.add_argument(
+        '--output',
+        default=None,
+        help='Path to write the results to, instead of stdout',
+        type=str,
+    )
+    parser.add_argument(
+        '--format',
+        choices=sorted(list(WRITERS) + ['sqlite']),
+        default='csv',
+        help='The format of the results, where parquet requires PyArrow and '
+        'only holds the events, and sqlite also loads the trades into the '
+        'database',
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Print the time and rows of each stage, the peak memory of the '
+        'process at the end of each stage, and counters of the work done, '
+        'to stderr',
+    )
+    parser.add_argument(
+        '--profile-stats',
+        default=None,
+        help='Path to write a cProfile dump to, for use with pstats',
+        type=str,
+    )
+    parser.add_argument(
+        '--profile-trace',
+        default=None,
+        help='Path to write the stages to in the Chrome trace format',
+        type=str,
+    )
+    parser.add_argument(
+        '--engine',
+        choices=['decimal', 'numpy'],
+        default='decimal',
+        help='The calculation engine, where numpy is a faster vectorized '
+        'engine using floating point amounts of money and units rounded to '
+        '8 decimal places, which does not support --superficial-losses',
+    )
+    parser.add_argument(
+        '--tax-year',
+        default=None,
+        help='The tax year to perform calculations for',
+        type=int,
+    )
+    parser.add_argument(
+        '--superficial-losses',
+        action='store_true',
+        help='Deny the superficial part of losses, where the asset was '
+        'bought within 30 days before or after the sale and still held 30 '
+        'days after, adding it to the ACB',
+    )
+    parser.add_argument(
+        '--dedupe',
+        action='store_true',
+        help='Remove the trades of a file that are also in another file, '
+        'such as from exports of overlapping dates, and print what was '
+        'removed to stderr',
+    )
+    parser.add_argument(
+        '--tax-years',
+        default=None,
+        help='A range of tax years like 2017-2024 to perform calculations '
+        'for in a single run, with each year starting from the holdings at '
+        'the end of the year before',
+        type=parse_years,
+    )
+    return parser.parse_args()
@@ -0,0 +1,232 @@
+"""
+On disk cache of parsed trade files.
+
+The parsed trades of a CSV file are stored in a binary file holding the
+columns of a trade store, which is copied out of a memory map when it is
+loaded, so that reading the same file again does not parse it again. The
+trades of a single asset are cached on their own, so that only the rows of
+that asset are converted. Entries are keyed by the path, size, modification
+time and inode of the CSV file, so that a file is never read to find its
+entry, and the least recently used entries are evicted once the cache grows
+too large.
+"""
+from array import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from .files import atomic_write
+from .records import TradeStore
+
+
+# Changing the parsed format of the trades must change this version
+CACHE_VERSION = 2
+MAGIC = b'CTCT'
+ALIGNMENT = 8
+DEFAULT_MAX_SIZE = 1024 ** 3
+INDEX_FILENAME = 'index.json'
+
+
+def default_cache_dir():
+    """
+    Get the default directory for the cache.
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(cache_home, 'crypto_taxes')
+
+
+def padding(offset):
+    """
+    Get the number of bytes needed to align an offset.
+    """
+    return -offset % ALIGNMENT
+
+
+def write_store(store, fileobj):
+    """
+    Write the columns of a trade store to a binary file.
+
+    The file is a magic number, the length of a JSON header describing the
+    columns, the header, and then the raw column data, each column aligned
+    so that it can be used in place from a memory map.
+    """
+    columns = store.columns()
+    offset = 0
+    layout = []
+
+    for name, column in columns:
+        offset += padding(offset)
+        size = column.itemsize * len(column)
+        layout.append([name, column.typecode, offset, len(column)])
+        offset += size
+
+    header = json.dumps({
+        'byteorder': sys.byteorder,
+        'codes': store.codes,
+        'columns': layout,
+        'decimals': store.overflow(),
+    }).encode()
+
+    prefix = MAGIC + struct.pack('<I', len(header)) + header
+    fileobj.write(prefix + b'\0' * padding(len(prefix)))
+    position = 0
+
+    for (_, column), (_, _, column_offset, _) in zip(columns, layout):
+        fileobj.write(b'\0' * (column_offset - position))
+        fileobj.write(column)
+        position = column_offset + column.itemsize * len(column)
+
+
+def read_store(buffer):
+    """
+    Get a trade store from a buffer written by write_store, copying its
+    columns so that the buffer can be closed.
+    """
+    with memoryview(buffer) as view:
+        if bytes(view[:4]) != MAGIC:
+            raise ValueError('Not a cached trade file')
+
+        header_size = struct.unpack('<I', view[4:8])[0]
+        header = json.loads(bytes(view[8:8 + header_size]).decode())
+
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError('Cached trade file has a different byte order')
+
+        data_start = 8 + header_size
+        data_start += padding(data_start)
+        columns = []
+
+        for name, typecode, offset, length in header['columns']:
+            start = data_start + offset
+            column = array(typecode)
+            column.frombytes(view[start:start + length * column.itemsize])
+            columns.append((name, column))
+
+    return TradeStore.from_columns(
+        header['codes'],
+        columns,
+        header.get('decimals', ()),
+    )
+
+
+class TradeCache():
+    """
+    Cache of parsed trade files, kept in a directory with an index of the
+    entries.
+    """
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory if directory else default_cache_dir()
+        self.max_size = max_size
+        self.index_path = os.path.join(self.directory, INDEX_FILENAME)
+        self.index = {}
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rt') as index_file:
+                self.index = json.load(index_file)
+
+    def key(self, filename, asset=None):
+        """
+        Get the cache key of the trades of a CSV file, for an asset or for
+        every asset, from the path, size, modification time and inode of
+        the file.
+        """
+        stat = os.stat(filename)
+        key = hashlib.sha256()
+
+        for part in (
+                CACHE_VERSION,
+                os.path.abspath(filename),
+                stat.st_size,
+                stat.st_mtime_ns,
+                stat.st_ino,
+                asset,
+        ):
+            key.update(str(part).encode())
+            key.update(b'\n')
+
+        return key.hexdigest()
+
+    def entry_path(self, key):
+        """
+        Get the path of the binary file of a cache entry.
+        """
+        return os.path.join(self.directory, '{}.trades'.format(key))
+
+    def load(self, filename, asset=None):
+        """
+        Get the cached trade store of a CSV file, for an asset or for every
+        asset, or None if it is not cached.
+        """
+        key = self.key(filename, asset)
+        entry = self.index.get(key)
+
+        if entry is None or not os.path.exists(self.entry_path(key)):
+            return None
+
+        with open(self.entry_path(key), 'rb') as entry_file, \
+                mmap.mmap(
+                    entry_file.fileno(),
+                    0,
+                    access=mmap.ACCESS_READ,
+                ) as buffer:
+            store = read_store(buffer)
+
+        entry['used'] = time.time()
+        self.write_index()
+
+        return store
+
+    def save(self, filename, store, asset=None):
+        """
+        Cache the trade store parsed from a CSV file, for an asset or for
+        every asset, evicting the least recently used entries if the cache
+        is too large.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        key = self.key(filename, asset)
+        path = self.entry_path(key)
+
+        with atomic_write(path, 'wb') as entry_file:
+            write_store(store, entry_file)
+
+        self.index[key] = {
+            'asset': asset,
+            'filename': os.path.abspath(filename),
+            'size': os.path.getsize(path),
+            'used': time.time(),
+        }
+        self.evict()
+        self.write_index()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in its
+        maximum size.
+        """
+        total_size = sum(entry['size'] for entry in self.index.values())
+        by_use = sorted(self.index.items(), key=lambda item: item[1]['used'])
+
+        for key, entry in by_use:
+            if total_size <= self.max_size:
+                break
+
+            if os.path.exists(self.entry_path(key)):
+                os.remove(self.entry_path(key))
+
+            total_size -= entry['size']
+            del self.index[key]
+
+    def write_index(self):
+        """
+        Write the index of the entries, replacing it atomically.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        with atomic_write(self.index_path) as index_file:
+            json.dump(self.index, index_file, indent=2, sort_keys=True)
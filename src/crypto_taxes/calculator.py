@@ -1,57 +1,374 @@
 """
 Crypto Tax Calculator.
 """
-from copy import deepcopy
-import csv
 from datetime import date, datetime
 from decimal import Decimal
 
-from .exceptions import InsufficientUnitsError
-from .parsers import get_parser
+from .acb_index import ACBIndex
+from .exceptions import InsufficientUnitsError, MissingExchangeRateError
+from .exchange_rates import ExchangeRateTable
+from .parsers import find_parser
+from .profiling import Profiler
+from .records import ConvertedTrade, Event, Trade, TradeStore
+from .scanner import iter_rows
+from .sorting import (
+    ASCENDING,
+    DEFAULT_RUN_SIZE,
+    DESCENDING,
+    detect_order,
+    external_sort,
+    reverse_runs,
+)
+from .superficial import SuperficialLossWindow
+
+
+# Totals that are reported for each tax year, rather than carried forward
+YEARLY_TOTALS = (
+    'sum_acb_dispositions',
+    'capital_gains',
+    'outlays',
+    'proceeds',
+    'superficial_losses',
+)
 
 
 def is_target_tax_year(trade_date, tax_year):
     """
     Check if the trade date is within the target tax year.
     """
-    year_start = datetime(tax_year, 1, 1, 0, 0, 0)
+    start = datetime(tax_year, 1, 1, 0, 0, 0)
     next_year_start = datetime(tax_year+1, 1, 1, 0, 0, 0)
-    return year_start <= trade_date < next_year_start
+    return start <= trade_date < next_year_start
+
+
+def year_start(year):
+    """
+    Get the timestamp of the start of a year, in local time like the dates
+    of the trades.
+    """
+    return datetime(year, 1, 1).timestamp()
+
+
+def mirror_trade(trade):
+    """
+    Get the other side of a crypto to crypto trade.
+
+    Buying the major with a crypto minor is a disposition of the minor, and
+    selling the major for a crypto minor is an acquisition of the minor. The
+    mirrored trade is priced in units of the minor itself, so that it gets
+    converted to the base currency using the exchange rate of the minor.
+    """
+    mirrored_type = 'sell' if trade['type'] == 'buy' else 'buy'
+
+    return Trade(
+        mirrored_type,
+        trade['minor'],
+        trade['minor'],
+        trade['value'],
+        Decimal('1'),
+        trade['value'],
+        # Commission on a buy is taken in the major, and on a sell is taken
+        # in the minor, so only an acquisition of the minor has commission.
+        trade['total'] if mirrored_type == 'buy' else trade['value'],
+        trade['timestamp'],
+    )
+
+
+def split_trade(trade, assets):
+    """
+    Get the (asset, trade) pairs for each of the given assets in a trade.
+    """
+    pairs = []
+
+    if trade['major'] in assets:
+        pairs.append((trade['major'], trade))
+
+    if trade['minor'] in assets and trade['minor'] != trade['major']:
+        pairs.append((trade['minor'], mirror_trade(trade)))
+
+    return pairs
 
 
 class CSVReader():
     """
     Reads in the CSV files from the exchanges.
+
+    With a trade cache, the trades read from a file for an asset, or for
+    every asset, are kept in a trade store as they are parsed, and the store
+    is cached once the whole file was read. Reads after that are served from
+    the store. Files that were already parsed elsewhere, such as in a pool
+    of processes, can be added as stores too.
+
+    The time spent reading the trades is counted towards the parse stage of
+    the profiler, along with counts of the rows parsed and filtered out.
     """
-    def read_trades(self, filename, target_asset):
+    def __init__(self, cache=None, profiler=None):
+        self.cache = cache
+        self.profiler = profiler if profiler is not None \
+            else Profiler(enabled=False)
+        self.orders = {}
+        self.stores = {}
+        self.asset_stores = {}
+
+    def read_trades(self, filename, target_asset=None):
         """
         Read the trades from the CSV file.
+
+        All trades are returned when no target asset is given.
         """
-        trades = []
+        return list(self.iter_trades(filename, target_asset))
 
-        with open(filename, 'rt') as csvfile:
-            reader = csv.DictReader(csvfile)
-            parser = get_parser(reader)
+    def iter_trades(self, filename, target_asset=None):
+        """
+        Stream the trades from the CSV file, one row at a time.
+        """
+        with self.profiler.stage('parse'):
+            store = self.find_store(filename, target_asset)
 
-            for row in reader:
-                trade = parser.parse_row(row)
+        if store is not None:
+            trades = self.iter_store_trades(store, target_asset)
+        else:
+            trades = self.iter_reader_trades(iter_rows(filename), target_asset)
 
-                if target_asset not in (row['major'], row['minor']):
-                    continue
+            if self.cache is not None:
+                trades = self.iter_caching_trades(
+                    filename,
+                    target_asset,
+                    trades,
+                )
 
-                trades.append(trade)
+        yield from self.profiler.iterate('parse', trades)
 
-        return trades
+    def iter_trades_reversed(self, filename, target_asset=None):
+        """
+        Stream the trades from the CSV file, from the last row to the first.
+        """
+        with self.profiler.stage('parse'):
+            store = self.find_store(filename, target_asset)
+
+        if store is not None:
+            trades = self.iter_store_trades(store, target_asset, True)
+        else:
+            rows = iter_rows(filename, reverse=True)
+            trades = self.iter_reader_trades(rows, target_asset)
+
+            if self.cache is not None:
+                trades = self.iter_caching_trades(
+                    filename,
+                    target_asset,
+                    trades,
+                    reverse=True,
+                )
+
+        yield from self.profiler.iterate('parse', trades)
+
+    def iter_trades_range(self, filename, start, stop, target_asset=None):
+        """
+        Stream the trades from a byte range of the CSV file, which must start
+        and end on row boundaries.
+        """
+        rows = iter_rows(filename, start, stop)
+
+        yield from self.profiler.iterate(
+            'parse',
+            self.iter_reader_trades(rows, target_asset),
+        )
+
+    def iter_reader_trades(self, rows, target_asset=None):
+        """
+        Parse rows of bytes from the scanner into trades, starting from the
+        header row. Rows for other assets are skipped before they are
+        converted. There are no trades when there is no header row.
+        """
+        try:
+            header = next(rows)
+        except StopIteration:
+            return
+
+        parser = find_parser(header, encoded=True)
+        convert = parser.convert
+        matches = parser.matches
+        asset = target_asset.encode() if target_asset is not None else None
+        parsed = 0
+        filtered = 0
+
+        for values in rows:
+            parsed += 1
+
+            if asset is not None and not matches(values, asset):
+                filtered += 1
+                continue
+
+            yield convert(values)
+
+        self.profiler.count('rows parsed', parsed)
+        self.profiler.count('rows filtered by asset', filtered)
+
+    def iter_store_trades(self, store, target_asset=None, reverse=False):
+        """
+        Stream the trades of a CSV file from its trade store.
+        """
+        kept = 0
+
+        for trade in store.iter_trades(target_asset, reverse):
+            kept += 1
+            yield trade
+
+        self.profiler.count('rows filtered by asset', len(store) - kept)
+
+    def add_store(self, filename, store):
+        """
+        Serve the trades of the CSV file from an already parsed trade store.
+        """
+        self.stores[filename] = store
+
+    def find_store(self, filename, target_asset=None):
+        """
+        Get the trade store that the trades of the CSV file for an asset can
+        be read from, loading it from the cache, or None if there is none.
+        """
+        if filename in self.stores:
+            return self.stores[filename]
+
+        if self.cache is None:
+            return None
+
+        if (filename, target_asset) not in self.asset_stores:
+            store = self.cache.load(filename)
+
+            if store is not None:
+                self.stores[filename] = store
+                return store
+
+            if target_asset is None:
+                return None
+
+            store = self.cache.load(filename, target_asset)
+
+            if store is None:
+                return None
+
+            self.asset_stores[filename, target_asset] = store
+
+        return self.asset_stores[filename, target_asset]
+
+    def iter_caching_trades(
+            self,
+            filename,
+            target_asset,
+            trades,
+            reverse=False
+    ):
+        """
+        Pass the trades read from the CSV file through, keeping them in a
+        trade store which is cached once they have all been read. Trades
+        read backwards are stored in the order of the file.
+        """
+        store = TradeStore()
+
+        for trade in trades:
+            store.append(trade)
+            yield trade
+
+        if reverse:
+            store.reverse()
+
+        self.cache.save(filename, store, target_asset)
+
+        if target_asset is None:
+            self.stores[filename] = store
+        else:
+            self.asset_stores[filename, target_asset] = store
+
+    def iter_sorted_trades(
+            self,
+            filename,
+            target_asset=None,
+            run_size=DEFAULT_RUN_SIZE
+    ):
+        """
+        Stream the trades from the CSV file in chronological order.
+
+        Files in reverse chronological order are read backwards, and files
+        that are not ordered at all are sorted externally.
+        """
+        order = self.detect_order(filename, target_asset)
+
+        if order == ASCENDING:
+            return self.iter_trades(filename, target_asset)
+
+        if order == DESCENDING:
+            return reverse_runs(
+                self.iter_trades_reversed(filename, target_asset)
+            )
+
+        return external_sort(
+            self.iter_trades(filename, target_asset),
+            run_size,
+        )
+
+    def detect_order(self, filename, target_asset=None):
+        """
+        Scan the timestamps of the CSV file to find the order of its rows,
+        or of the rows for an asset when they are in a trade store.
+
+        The order is remembered, so that each file is only scanned once.
+        """
+        store = self.find_store(filename, target_asset)
+        key = filename
+
+        if store is not None and filename not in self.stores:
+            key = (filename, target_asset)
+
+        if key in self.orders:
+            return self.orders[key]
+
+        if store is not None:
+            self.orders[key] = detect_order(store.timestamps)
+        else:
+            rows = iter_rows(filename)
+            parser = find_parser(next(rows), encoded=True)
+
+            self.orders[key] = detect_order(
+                parser.parse_timestamp(values) for values in rows
+            )
+
+        return self.orders[key]
 
 
 class Calculator():
     """
     Tax calculator for crypto trades.
+
+    The trades may be a list, or any other iterable such as a generator,
+    which is consumed as the calculations are performed. Trades are never
+    changed by the calculations, so a list of trades can be shared.
+
+    With superficial losses, the part of a loss that is superficial is
+    denied and added to the ACB, and the tabulations have the total of the
+    superficial losses.
+
+    Counts of the trades processed, the currency conversions and the
+    exchange rate lookups are kept by the profiler.
     """
-    def __init__(self, trades=None, exchange_rates=None, base_currency='cad'):
-        self.trades = deepcopy(trades) if trades else []
-        self.exchange_rates = exchange_rates if exchange_rates else {}
+    def __init__(
+            self,
+            trades=None,
+            exchange_rates=None,
+            base_currency='cad',
+            superficial_losses=False,
+            profiler=None
+    ):
+        if isinstance(exchange_rates, dict):
+            exchange_rates = ExchangeRateTable.from_dict(exchange_rates)
+
+        self.trades = trades if trades is not None else []
+        self.exchange_rates = exchange_rates if exchange_rates is not None \
+            else ExchangeRateTable()
         self.base_currency = base_currency
+        self.superficial_losses = superficial_losses
+        self.profiler = profiler if profiler is not None \
+            else Profiler(enabled=False)
 
     def calculate(
             self,
@@ -62,7 +379,240 @@ class Calculator():
         """
         Perform the calculations.
         """
+        tabulations = self.create_tabulations(initial_acb, initial_units_held)
+        tabulations['events'].extend(self.iter_events(tabulations, tax_year))
+
+        return tabulations
+
+    def iter_events(self, tabulations, tax_year=None):
+        """
+        Process the trades one at a time, yielding each event as it is
+        produced. The running totals are kept in the given tabulations.
+        """
+        tax_year = tax_year if tax_year is not None else date.today().year
+        start = year_start(tax_year)
+        stop = year_start(tax_year + 1)
+        trades, window = self.read_trades_ahead(
+            lambda trade: [(trade['major'], trade)]
+        )
+
+        # Trades are filtered by their timestamp, so that the trades of other
+        # years are skipped without converting their dates or amounts
+        for trade in trades:
+            if not start <= trade['timestamp'] < stop:
+                continue
+
+            event = self.process_trade(trade, tabulations)
+
+            if window is not None:
+                window.adjust(trade['major'], trade, event, tabulations)
+
+            yield event
+
+    def calculate_assets(
+            self,
+            assets,
+            tax_year=None,
+            initial_holdings=None,
+            on_year_end=None
+    ):
+        """
+        Perform the calculations for several assets in a single pass.
+
+        Crypto to crypto trades count towards both assets of the pair, when
+        both are among the given assets. Initial holdings map an asset to
+        its (acb, units held) pair. Returns the tabulations keyed by asset.
+        """
+        results = self.create_asset_tabulations(assets, initial_holdings)
+        events = self.iter_asset_events(results, tax_year, on_year_end)
+
+        for asset, event in events:
+            results[asset]['events'].append(event)
+
+        return results
+
+    def create_asset_tabulations(self, assets, initial_holdings=None):
+        """
+        Create the running tabulations for each of the assets.
+        """
+        initial_holdings = initial_holdings if initial_holdings else {}
+
+        return {
+            asset: self.create_tabulations(
+                *initial_holdings.get(asset, (None, None))
+            )
+            for asset in assets
+        }
+
+    def calculate_years(
+            self,
+            assets,
+            first_year,
+            last_year,
+            initial_holdings=None
+    ):
+        """
+        Perform the calculations for a range of tax years in a single pass
+        over the history.
+
+        Each year opens with the ACB and units held at the close of the year
+        before, and the initial holdings are the holdings before the first
+        trade. Returns the tabulations keyed by year, and then by asset.
+        """
+        results = self.create_asset_tabulations(assets, initial_holdings)
+        years = {}
+
+        def on_year_end(year, results, _):
+            if year >= first_year:
+                years[year] = {
+                    asset: dict(tabulations)
+                    for asset, tabulations in results.items()
+                }
+
+            for tabulations in results.values():
+                tabulations['events'] = []
+
+        events = self.iter_asset_events(
+            results,
+            last_year,
+            on_year_end,
+            first_year,
+        )
+
+        for asset, event in events:
+            results[asset]['events'].append(event)
+
+        years[last_year] = results
+
+        # The years before the first trade only have the initial holdings
+        return {
+            year: years[year] if year in years
+            else self.create_asset_tabulations(assets, initial_holdings)
+            for year in range(first_year, last_year + 1)
+        }
+
+    def iter_asset_events(
+            self,
+            results,
+            tax_year=None,
+            on_year_end=None,
+            first_year=None
+    ):
+        """
+        Process the trades one at a time for each asset in the results,
+        yielding (asset, event) pairs as they are produced.
+
+        When on_year_end is given, the trades before the tax year are
+        replayed to carry the holdings forward into it, without yielding
+        their events, unless they are from the first year onwards. After
+        each of those years, on_year_end is called with the year, the
+        results, and the timestamp of the last trade of each asset, and then
+        the yearly totals are reset.
+        """
         tax_year = tax_year if tax_year is not None else date.today().year
+        first_year = first_year if first_year is not None else tax_year
+        start = year_start(tax_year)
+        stop = year_start(tax_year + 1)
+        replay = on_year_end is not None
+        replay_year = None
+        last_timestamps = {}
+        trades, window = self.read_trades_ahead(
+            lambda trade: split_trade(trade, results)
+        )
+
+        for trade in trades:
+            timestamp = trade['timestamp']
+
+            if timestamp >= stop or (timestamp < start and not replay):
+                continue
+
+            year = tax_year if timestamp >= start else trade['dt'].year
+
+            if replay:
+                replay_year = year if replay_year is None else replay_year
+
+                while replay_year < year:
+                    on_year_end(replay_year, results, last_timestamps)
+                    self.reset_yearly_totals(results)
+                    replay_year += 1
+
+            for asset, asset_trade in split_trade(trade, results):
+                try:
+                    event = self.process_trade(asset_trade, results[asset])
+                except InsufficientUnitsError as err:
+                    err.asset = asset
+                    raise
+
+                if window is not None:
+                    window.adjust(asset, asset_trade, event, results[asset])
+
+                last_timestamps[asset] = trade['timestamp']
+
+                if year >= first_year:
+                    yield asset, event
+
+        while replay and replay_year is not None and replay_year < tax_year:
+            on_year_end(replay_year, results, last_timestamps)
+            self.reset_yearly_totals(results)
+            replay_year += 1
+
+    def build_acb_index(self, assets, initial_holdings=None):
+        """
+        Process every trade of the assets, across all tax years, building
+        an index of the holdings of each asset after each of its trades.
+        """
+        initial_holdings = initial_holdings if initial_holdings else {}
+        results = self.create_asset_tabulations(assets, initial_holdings)
+        index = ACBIndex()
+
+        for asset in assets:
+            index.start(asset, *initial_holdings.get(asset, (None, None)))
+
+        trades, window = self.read_trades_ahead(
+            lambda trade: split_trade(trade, results)
+        )
+
+        for trade in trades:
+            for asset, asset_trade in split_trade(trade, results):
+                try:
+                    event = self.process_trade(asset_trade, results[asset])
+                except InsufficientUnitsError as err:
+                    err.asset = asset
+                    raise
+
+                if window is not None:
+                    window.adjust(asset, asset_trade, event, results[asset])
+
+                index.add(asset, trade['timestamp'], event)
+
+        return index
+
+    def read_trades_ahead(self, split):
+        """
+        Get the trades to calculate, read ahead through a superficial loss
+        window when superficial losses are detected, and the window or None.
+        """
+        if not self.superficial_losses:
+            return self.trades, None
+
+        window = SuperficialLossWindow(self.trades, split)
+
+        return window, window
+
+    def reset_yearly_totals(self, results):
+        """
+        Reset the totals that are reported per tax year, keeping the ACB and
+        units held that carry forward.
+        """
+        for tabulations in results.values():
+            for key in YEARLY_TOTALS:
+                if key in tabulations:
+                    tabulations[key] = Decimal('0')
+
+    def create_tabulations(self, initial_acb=None, initial_units_held=None):
+        """
+        Create the running tabulations for an asset.
+        """
         tabulations = {
             'acb': initial_acb if initial_acb is not None else Decimal('0'),
             'units_held':
@@ -72,18 +622,11 @@ class Calculator():
             'capital_gains': Decimal('0'),
             'outlays': Decimal('0'),
             'proceeds': Decimal('0'),
+            'events': [],
         }
 
-        events = []
-
-        for trade in self.trades:
-            if not is_target_tax_year(trade['dt'], tax_year):
-                continue
-
-            event = self.process_trade(trade, tabulations)
-            events.append(event)
-
-        tabulations['events'] = events
+        if self.superficial_losses:
+            tabulations['superficial_losses'] = Decimal('0')
 
         return tabulations
 
@@ -91,26 +634,27 @@ class Calculator():
         """
         Perform calculations for an individual trade.
         """
-        self.convert_currency(trade)
+        self.profiler.count('trades processed')
+        trade = self.convert_currency(trade)
 
         if trade['type'] == 'buy':
             capital_gain = self.process_buy(trade, tabulations)
         elif trade['type'] == 'sell':
             capital_gain = self.process_sell(trade, tabulations)
 
-        event = {
-            'action': trade['type'],
-            'major': trade['major'],
-            'minor': trade['minor'],
-            'amount': trade['amount'],
-            'dt': trade['dt'],
-            'acb': tabulations['acb'],
-            'rate': trade['rate'],
-            'units_held': tabulations['units_held'],
-            'exchange_rate': trade['exchange_rate'],
-            'capital_gains': tabulations['capital_gains'],
-            'capital_gain': capital_gain,
-        }
+        event = Event(
+            action=trade['type'],
+            major=trade['major'],
+            minor=trade['minor'],
+            amount=trade['amount'],
+            dt=trade['dt'],
+            acb=tabulations['acb'],
+            rate=trade['rate'],
+            units_held=tabulations['units_held'],
+            exchange_rate=trade['exchange_rate'],
+            capital_gains=tabulations['capital_gains'],
+            capital_gain=capital_gain,
+        )
 
         return event
 
@@ -214,16 +758,33 @@ class Calculator():
     def convert_currency(self, trade):
         """
         Convert the foreign fiat values into the base currency using
-        the given exchange rates.
+        the given exchange rates, returning a converted view of the trade.
         """
+        self.profiler.count('currency conversions')
+
         if trade['minor'] == self.base_currency:
-            trade['exchange_rate'] = 1
-            return
+            return ConvertedTrade(
+                trade,
+                1,
+                trade['rate'],
+                trade['value'],
+                trade['total'],
+            )
+
+        self.profiler.count('rate lookups')
+        exchange_rate = self.exchange_rates.get_rate(
+            trade['minor'],
+            trade['dt'],
+        )
 
-        date_string = trade['dt'].strftime('%Y/%m/%d')
-        trade['exchange_rate'] = \
-            self.exchange_rates[date_string][trade['minor']]
-        trade['rate'] = trade['rate'] / trade['exchange_rate']
-        trade['value'] = trade['value'] / trade['exchange_rate']
-        if trade['type'] == 'sell':
-            trade['total'] = trade['total'] / trade['exchange_rate']
+        if exchange_rate is None:
+            raise MissingExchangeRateError(trade['dt'], trade['minor'])
+
+        return ConvertedTrade(
+            trade,
+            exchange_rate,
+            trade['rate'] / exchange_rate,
+            trade['value'] / exchange_rate,
+            trade['total'] / exchange_rate if trade['type'] == 'sell'
+            else trade['total'],
+        )
@@ -0,0 +1,282 @@
+"""
+Year end checkpoints of the holdings of each asset.
+
+A checkpoint records the ACB and units held of an asset at the end of a tax
+year, so that the following year can be calculated without replaying the
+whole trade history. Each checkpoint is tied to a fingerprint of the inputs
+it was calculated from, and is ignored once any of those inputs change.
+
+Only the inputs that a checkpoint depends on are fingerprinted: the trades
+and exchange rates up to the end of its year. The rows of each input are
+hashed by day in a single scan, so that adding trades to the current year
+leaves the checkpoints of the earlier years valid. The hashes of the days
+are kept with the checkpoints, along with the size, modification time and
+inode of the file, and a file is only scanned again once those change.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+import hashlib
+import json
+import os
+
+from .exchange_rates import FILL_NEAREST, parse_date_ordinal
+from .files import atomic_write, file_stat
+from .parsers import find_parser
+from .scanner import iter_rows
+
+
+def fingerprint_inputs(filenames, *options):
+    """
+    Get a fingerprint of the input files, from their paths, sizes,
+    modification times and inodes, and any options that change the results
+    calculated from them.
+
+    The order of the files does not matter, since the trades are sorted.
+    """
+    file_keys = [
+        json.dumps([os.path.abspath(filename)] + file_stat(filename))
+        for filename in filenames
+    ]
+    fingerprint = hashlib.sha256()
+
+    for value in sorted(file_keys) + [str(option) for option in options]:
+        fingerprint.update(value.encode())
+        fingerprint.update(b'\n')
+
+    return fingerprint.hexdigest()
+
+
+def hash_days(rows, row_day):
+    """
+    Hash rows of bytes fields separately for each day, getting the hex
+    digests by ordinal day. The rows of a day are hashed in the order they
+    are in.
+    """
+    hashes = {}
+
+    for values in rows:
+        day = row_day(values)
+        day_hash = hashes.get(day)
+
+        if day_hash is None:
+            day_hash = hashes[day] = hashlib.sha256()
+
+        day_hash.update(b','.join(values))
+        day_hash.update(b'\n')
+
+    return {day: day_hash.hexdigest() for day, day_hash in hashes.items()}
+
+
+def trade_days(filename):
+    """
+    Hash the rows of a trade file by the local day of their timestamp.
+    """
+    rows = iter_rows(filename)
+    parser = find_parser(next(rows), encoded=True)
+
+    return hash_days(
+        rows,
+        lambda values: datetime.fromtimestamp(
+            parser.parse_timestamp(values)
+        ).toordinal(),
+    )
+
+
+def exchange_rate_days(filename):
+    """
+    Hash the rows of an exchange rate file by their date.
+    """
+    rows = iter_rows(filename)
+    date_index = next(rows).index(b'date')
+
+    return hash_days(
+        rows,
+        lambda values: parse_date_ordinal(values[date_index].decode()),
+    )
+
+
+class HistoryFingerprint():
+    """
+    Fingerprints of the trades and exchange rates up to the end of each
+    year, along with any options that change the results calculated from
+    them.
+
+    The order of the trade files does not matter, since the trades are
+    sorted. With the nearest fill policy, a missing rate can be filled from
+    a later day, so all of the exchange rates are part of every year.
+
+    The hashes of the days of each file are reused from the file days, by
+    path, while the stat of the file is unchanged, and are updated there
+    otherwise.
+    """
+    def __init__(
+            self,
+            trade_files,
+            exchange_rates=None,
+            fill=None,
+            options=(),
+            lookahead_days=0,
+            file_days=None,
+    ):
+        self.file_days = {} if file_days is None else file_days
+        self.changed = False
+        self.trade_days = [
+            self.days(filename, trade_days) for filename in trade_files
+        ]
+        self.rate_days = self.days(exchange_rates, exchange_rate_days) \
+            if exchange_rates else {}
+        self.all_rates = fill == FILL_NEAREST
+        self.options = [str(option) for option in options]
+        self.lookahead_days = lookahead_days
+
+    def year_end(self, year):
+        """
+        Get the fingerprint of the inputs up to the end of a year, and the
+        days after it that the calculation looks ahead by.
+        """
+        stop = date(year + 1, 1, 1).toordinal() + self.lookahead_days
+        file_digests = sorted(
+            self.digest(days, stop) for days in self.trade_days
+        )
+        rates_digest = self.digest(
+            self.rate_days,
+            None if self.all_rates else stop,
+        )
+        fingerprint = hashlib.sha256()
+
+        for value in file_digests + [rates_digest] + self.options:
+            fingerprint.update(value.encode())
+            fingerprint.update(b'\n')
+
+        return fingerprint.hexdigest()
+
+    def days(self, filename, hash_file_days):
+        """
+        Get the digests by ordinal day of a file, hashing its rows only if
+        the file changed since they were last hashed.
+        """
+        path = os.path.abspath(filename)
+        stat = file_stat(filename)
+        entry = self.file_days.get(path)
+
+        if entry is None or entry['stat'] != stat:
+            entry = self.file_days[path] = {
+                'stat': stat,
+                'days': hash_file_days(filename),
+            }
+            self.changed = True
+
+        return {int(day): digest for day, digest in entry['days'].items()}
+
+    def digest(self, days, stop):
+        """
+        Combine the digests of the days before the stop day, or of every
+        day when there is no stop.
+        """
+        file_hash = hashlib.sha256()
+
+        for day in sorted(days):
+            if stop is not None and day >= stop:
+                break
+
+            file_hash.update(str(day).encode())
+            file_hash.update(days[day].encode())
+
+        return file_hash.hexdigest()
+
+
+class CheckpointStore():
+    """
+    Checkpoints kept in a local JSON file, keyed by asset and year, along
+    with the hashes of the days of the input files they were fingerprinted
+    from.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.checkpoints = {}
+        self.file_days = {}
+
+        if os.path.exists(path):
+            with open(path, 'rt') as checkpoint_file:
+                stored = json.load(checkpoint_file)
+
+            self.checkpoints = stored.get('checkpoints', {})
+            self.file_days = stored.get('files', {})
+
+    def key(self, asset, year):
+        """
+        Get the key of the checkpoint for an asset at the end of a year.
+        """
+        return '{}/{}'.format(asset, year)
+
+    def load(self, asset, year, fingerprint):
+        """
+        Get the checkpoint for an asset at the end of a year, or None if
+        there is none for the same inputs.
+        """
+        checkpoint = self.checkpoints.get(self.key(asset, year))
+
+        if checkpoint is None or checkpoint['fingerprint'] != fingerprint:
+            return None
+
+        return {
+            'acb': Decimal(checkpoint['acb']),
+            'units_held': Decimal(checkpoint['units_held']),
+            'timestamp': checkpoint['timestamp'],
+        }
+
+    def load_holdings(self, assets, year, fingerprint):
+        """
+        Get the (acb, units held) of each asset at the end of a year, to
+        start the next year from, or None unless all of them are available.
+        """
+        holdings = {}
+
+        for asset in assets:
+            checkpoint = self.load(asset, year, fingerprint)
+
+            if checkpoint is None:
+                return None
+
+            holdings[asset] = (checkpoint['acb'], checkpoint['units_held'])
+
+        return holdings
+
+    def save(self, asset, year, tabulations, timestamp, fingerprint):
+        """
+        Record the holdings of an asset at the end of a year.
+        """
+        self.checkpoints[self.key(asset, year)] = {
+            'acb': str(tabulations['acb']),
+            'units_held': str(tabulations['units_held']),
+            'timestamp': timestamp,
+            'fingerprint': fingerprint,
+        }
+
+    def save_year(self, year, results, timestamps, fingerprint):
+        """
+        Record the holdings of all the assets in the results at the end of a
+        year, and write them to the file.
+        """
+        for asset, tabulations in results.items():
+            self.save(
+                asset,
+                year,
+                tabulations,
+                timestamps.get(asset),
+                fingerprint,
+            )
+
+        self.write()
+
+    def write(self):
+        """
+        Write the checkpoints to the file, replacing it atomically.
+        """
+        with atomic_write(self.path) as checkpoint_file:
+            json.dump(
+                {'checkpoints': self.checkpoints, 'files': self.file_days},
+                checkpoint_file,
+                indent=2,
+                sort_keys=True,
+            )
@@ -0,0 +1,471 @@
+"""
+Local SQLite store of the trades and the calculation results.
+
+The normalized trades of each file are loaded in bulk, in a single
+transaction per file, and indexed by asset, timestamp and source file. The
+events and totals of the calculations are written back by a result writer,
+so that other tools can query holdings, gains and histories with SQL rather
+than running the calculations again.
+
+Amounts are stored as text, so that they are exact, and dates as ISO 8601
+text. The database is in WAL mode, so it can be read while it is written.
+"""
+from decimal import Decimal
+from itertools import repeat
+import os
+import sqlite3
+
+from .dedupe import merge_file_trades
+from .records import Trade
+from .writers import (
+    DEFAULT_BATCH_SIZE,
+    EVENT_FIELDS,
+    TOTAL_FIELDS,
+    ResultWriter,
+    event_values,
+    iter_batches,
+)
+
+
+SCHEMA_VERSION = 1
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files (id),
+    type TEXT NOT NULL,
+    major TEXT NOT NULL,
+    minor TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    rate TEXT NOT NULL,
+    value TEXT NOT NULL,
+    total TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trades_major ON trades (major, timestamp);
+CREATE INDEX IF NOT EXISTS trades_minor ON trades (minor, timestamp);
+CREATE INDEX IF NOT EXISTS trades_file ON trades (file_id);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    asset TEXT NOT NULL,
+    tax_year INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    major TEXT NOT NULL,
+    minor TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    rate TEXT NOT NULL,
+    dt TEXT NOT NULL,
+    acb TEXT NOT NULL,
+    units_held TEXT NOT NULL,
+    capital_gain TEXT NOT NULL,
+    capital_gains TEXT NOT NULL,
+    exchange_rate TEXT
+);
+CREATE INDEX IF NOT EXISTS events_asset ON events (asset, tax_year, dt);
+CREATE TABLE IF NOT EXISTS tabulations (
+    asset TEXT NOT NULL,
+    tax_year INTEGER NOT NULL,
+    acb TEXT NOT NULL,
+    sum_acb_dispositions TEXT NOT NULL,
+    units_held TEXT NOT NULL,
+    outlays TEXT NOT NULL,
+    proceeds TEXT NOT NULL,
+    capital_gains TEXT NOT NULL,
+    superficial_losses TEXT,
+    PRIMARY KEY (asset, tax_year)
+);
+'''
+TRADE_COLUMNS = (
+    'type',
+    'major',
+    'minor',
+    'amount',
+    'rate',
+    'value',
+    'total',
+    'timestamp',
+)
+TABULATION_COLUMNS = tuple(field for field, _, _ in TOTAL_FIELDS) + (
+    'superficial_losses',
+)
+
+
+def trade_row(file_id, trade):
+    """
+    Get the values of a trade as a row of the trades table.
+    """
+    return (
+        file_id,
+        trade['type'],
+        trade['major'],
+        trade['minor'],
+        str(trade['amount']),
+        str(trade['rate']),
+        str(trade['value']),
+        str(trade['total']),
+        trade['timestamp'],
+    )
+
+
+def row_trade(row):
+    """
+    Get a trade from a row of the trades table.
+    """
+    return Trade(
+        row[0],
+        row[1],
+        row[2],
+        Decimal(row[3]),
+        Decimal(row[4]),
+        Decimal(row[5]),
+        Decimal(row[6]),
+        row[7],
+    )
+
+
+class TradeDatabase():
+    """
+    The trades and results, in a SQLite database file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(
+                'PRAGMA user_version = {}'.format(SCHEMA_VERSION)
+            )
+
+    def is_current(self, filename):
+        """
+        Check whether the trades of a file were loaded, and the file has not
+        changed since.
+        """
+        stat = os.stat(filename)
+        row = self.connection.execute(
+            'SELECT size, mtime_ns FROM files WHERE path = ?',
+            (os.path.abspath(filename),),
+        ).fetchone()
+
+        return row == (stat.st_size, stat.st_mtime_ns)
+
+    def loaded_size(self, filename):
+        """
+        Get the size the file had when its trades were loaded, or None if
+        they were never loaded.
+        """
+        row = self.connection.execute(
+            'SELECT size FROM files WHERE path = ?',
+            (os.path.abspath(filename),),
+        ).fetchone()
+
+        return row[0] if row is not None else None
+
+    def load_trades(
+            self,
+            filename,
+            trades,
+            batch_size=DEFAULT_BATCH_SIZE,
+            append=False,
+    ):
+        """
+        Load the trades of a file, replacing any trades loaded from it
+        before, or adding to them when appending, in a single transaction.
+        Returns the number of trades.
+        """
+        return self.load_file_trades(
+            [filename],
+            zip(repeat(filename), trades),
+            batch_size,
+            append,
+        )
+
+    def load_file_trades(
+            self,
+            filenames,
+            pairs,
+            batch_size=DEFAULT_BATCH_SIZE,
+            append=False,
+    ):
+        """
+        Load the trades of several files, from pairs of the file and the
+        trade, in a single transaction. Returns the number of trades.
+        """
+        file_ids = {}
+        count = 0
+
+        with self.connection:
+            for filename in filenames:
+                file_ids[filename] = self.replace_file(filename, append)
+
+            for batch in iter_batches(pairs, batch_size):
+                self.connection.executemany(
+                    'INSERT INTO trades (file_id, {}) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'.format(
+                        ', '.join(TRADE_COLUMNS),
+                    ),
+                    [
+                        trade_row(file_ids[filename], trade)
+                        for filename, trade in batch
+                    ],
+                )
+                count += len(batch)
+
+        return count
+
+    def replace_file(self, filename, append=False):
+        """
+        Record the current size and modification time of a file, removing
+        the trades loaded from it before unless appending. Returns the id
+        of the file.
+        """
+        stat = os.stat(filename)
+        path = os.path.abspath(filename)
+
+        if not append:
+            self.connection.execute(
+                'DELETE FROM trades WHERE file_id IN '
+                '(SELECT id FROM files WHERE path = ?)',
+                (path,),
+            )
+
+        self.connection.execute(
+            'INSERT INTO files (path, size, mtime_ns) VALUES (?, ?, ?) '
+            'ON CONFLICT (path) DO UPDATE SET '
+            'size = excluded.size, mtime_ns = excluded.mtime_ns',
+            (path, stat.st_size, stat.st_mtime_ns),
+        )
+
+        return self.connection.execute(
+            'SELECT id FROM files WHERE path = ?',
+            (path,),
+        ).fetchone()[0]
+
+    def iter_trades(self, asset=None, start=None, stop=None):
+        """
+        Get the trades of an asset, or of every asset, in chronological
+        order, from the start timestamp and before the stop timestamp.
+        """
+        conditions = []
+        parameters = []
+
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            parameters.append(start)
+
+        if stop is not None:
+            conditions.append('timestamp < ?')
+            parameters.append(stop)
+
+        columns = ', '.join(TRADE_COLUMNS)
+
+        if asset is None:
+            query = 'SELECT {}, id FROM trades WHERE {}'.format(
+                columns,
+                ' AND '.join(conditions) or '1',
+            )
+        else:
+            # A query for each side of the pair, so both use an index
+            where = ' AND '.join(conditions + ['{} = ?'])
+            query = (
+                'SELECT {0}, id FROM trades WHERE {1} UNION ALL '
+                'SELECT {0}, id FROM trades WHERE {2} AND major != ?'
+            ).format(
+                columns,
+                where.format('major'),
+                where.format('minor'),
+            )
+            parameters = parameters + [asset] + parameters + [asset, asset]
+
+        cursor = self.connection.execute(
+            '{} ORDER BY timestamp, id'.format(query),
+            parameters,
+        )
+
+        for row in cursor:
+            yield row_trade(row)
+
+    def tabulations(self, asset, tax_year):
+        """
+        Get the totals written for an asset and a tax year, or None.
+        """
+        row = self.connection.execute(
+            'SELECT {} FROM tabulations WHERE asset = ? AND tax_year = ?'
+            .format(', '.join(TABULATION_COLUMNS)),
+            (asset, tax_year),
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            column: Decimal(value)
+            for column, value in zip(TABULATION_COLUMNS, row)
+            if value is not None
+        }
+
+    def iter_events(self, asset, tax_year):
+        """
+        Get the events written for an asset and a tax year, in chronological
+        order, with their fields as they were written.
+        """
+        cursor = self.connection.execute(
+            'SELECT {} FROM events WHERE asset = ? AND tax_year = ? '
+            'ORDER BY dt, id'.format(', '.join(EVENT_FIELDS)),
+            (asset, tax_year),
+        )
+
+        for row in cursor:
+            yield dict(zip(EVENT_FIELDS, row))
+
+    def close(self):
+        """
+        Close the connection to the database.
+        """
+        self.connection.close()
+
+
+class DatabaseWriter(ResultWriter):
+    """
+    Writes the events and totals of the results to a trade database, for a
+    tax year, replacing the results written for the same asset and year
+    before. The asset is taken from the events when it is not given.
+
+    When appending, such as for the trades added since an incremental run,
+    the events are added to the ones written before, and the totals are
+    replaced with the running totals.
+    """
+    def __init__(
+            self,
+            path,
+            tax_year=None,
+            asset=None,
+            batch_size=DEFAULT_BATCH_SIZE,
+            append=False,
+    ):
+        self.database = TradeDatabase(path)
+        super(DatabaseWriter, self).__init__(
+            self.database.connection,
+            batch_size,
+        )
+        self.year = tax_year
+        self.asset = asset
+        self.append = append
+
+    def begin(self, asset):
+        if self.append:
+            return
+
+        self.fileobj.execute(
+            'DELETE FROM events WHERE asset = ? AND tax_year = ?',
+            (asset or self.asset, self.year),
+        )
+
+    def write_events(self, events, asset):
+        self.fileobj.executemany(
+            'INSERT INTO events (asset, tax_year, {}) VALUES ({})'.format(
+                ', '.join(EVENT_FIELDS),
+                ', '.join('?' for _ in range(len(EVENT_FIELDS) + 2)),
+            ),
+            [
+                (asset or self.asset, self.year) + tuple(
+                    event_values(event).values()
+                )
+                for event in events
+            ],
+        )
+
+    def end(self, tabulations, asset):
+        self.fileobj.execute(
+            'INSERT OR REPLACE INTO tabulations (asset, tax_year, {}) '
+            'VALUES ({})'.format(
+                ', '.join(TABULATION_COLUMNS),
+                ', '.join('?' for _ in range(len(TABULATION_COLUMNS) + 2)),
+            ),
+            (asset or self.asset, self.year) + tuple(
+                str(tabulations[column]) if column in tabulations else None
+                for column in TABULATION_COLUMNS
+            ),
+        )
+        self.fileobj.commit()
+
+    def close(self):
+        self.database.close()
+
+
+def load_trade_files(database, filenames, csv_reader, duplicates=None):
+    """
+    Load all of the trades of the CSV files into the database, skipping the
+    files that have not changed since they were loaded. Returns the number
+    of trades that were loaded.
+
+    With a duplicate filter, the trades that were already in another file
+    are not loaded, and the files are loaded together when any of them
+    changed, since the duplicates of a file depend on the other files.
+    """
+    if duplicates is not None:
+        if all(database.is_current(filename) for filename in filenames):
+            return 0
+
+        return database.load_file_trades(
+            filenames,
+            duplicates.filter_pairs(merge_file_trades(
+                [
+                    csv_reader.iter_sorted_trades(filename)
+                    for filename in filenames
+                ],
+                filenames,
+            )),
+        )
+
+    count = 0
+
+    for filename in filenames:
+        if not database.is_current(filename):
+            count += database.load_trades(
+                filename,
+                csv_reader.iter_trades(filename),
+            )
+
+    return count
+
+
+def append_trade_files(database, ranges, csv_reader):
+    """
+    Add the trades added to the CSV files since the incremental state to the
+    database, from the byte ranges of the added rows by file. Files that
+    were not loaded as they were in the state are loaded in full. Returns
+    the number of trades that were loaded.
+    """
+    count = 0
+
+    for filename, added_range in ranges.items():
+        if database.is_current(filename):
+            continue
+
+        if added_range is not None:
+            start, stop = added_range
+            previous_size = os.path.getsize(filename) - (stop - start)
+
+            if database.loaded_size(filename) == previous_size:
+                count += database.load_trades(
+                    filename,
+                    csv_reader.iter_trades_range(filename, start, stop),
+                    append=True,
+                )
+                continue
+
+        count += database.load_trades(
+            filename,
+            csv_reader.iter_trades(filename),
+        )
+
+    return count
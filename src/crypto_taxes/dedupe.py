@@ -0,0 +1,146 @@
+"""
+Removal of the trades that several trade files have in common.
+
+Exports downloaded for overlapping date ranges hold some of the same trades,
+which would otherwise be counted once for each file. The trades of the files
+are merged in chronological order, and each trade is fingerprinted by its
+type, pair, amount, rate and time. A trade is a duplicate when another file
+already had a trade with the same fingerprint, so that identical fills
+within a single file are all kept.
+
+Duplicates are at the same time, so the fingerprints are only kept for a
+window of time behind the merged stream, and the memory used stays bounded
+by the trades within the window rather than the length of the history.
+
+A filter is made once for a run and used for each pass over the trades,
+one pass at a time. Every pass starts from an empty window, and the counts
+of removed trades are those of the last pass, which are the same for every
+pass over the same files.
+"""
+from collections import Counter, deque
+import heapq
+from itertools import repeat
+import os
+
+
+# Seconds that fingerprints are kept for, behind the latest trade
+DEFAULT_WINDOW = 60 * 60
+
+
+def trade_fingerprint(trade):
+    """
+    Get the fields that identify a trade across exports.
+    """
+    return (
+        trade['type'],
+        trade['major'],
+        trade['minor'],
+        trade['amount'],
+        trade['rate'],
+        trade['timestamp'],
+    )
+
+
+class DuplicateFilter():
+    """
+    Drops the trades of a file that were already in another file, counting
+    the trades that were removed from each file.
+    """
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        # The file the fingerprint was first seen in, the number of trades
+        # with it in each file, and the number of them that were kept
+        self.seen = {}
+        self.expiry = deque()
+        self.removed = Counter()
+
+    def filter(self, trades):
+        """
+        Yield the trades that are not duplicates, from pairs of the file and
+        the trade in chronological order.
+        """
+        yield from (trade for _, trade in self.filter_pairs(trades))
+
+    def filter_pairs(self, trades):
+        """
+        Yield the pairs of the file and the trade that are not duplicates,
+        from pairs in chronological order, starting a new pass.
+        """
+        seen = self.seen = {}
+        expiry = self.expiry = deque()
+        self.removed = Counter()
+
+        for filename, trade in trades:
+            timestamp = trade['timestamp']
+
+            while expiry and expiry[0][0] < timestamp - self.window:
+                del seen[expiry.popleft()[1]]
+
+            fingerprint = trade_fingerprint(trade)
+            entry = seen.get(fingerprint)
+
+            if entry is None:
+                seen[fingerprint] = [filename, Counter({filename: 1}), 1]
+                expiry.append((timestamp, fingerprint))
+                yield filename, trade
+                continue
+
+            counts = entry[1]
+            counts[filename] += 1
+
+            # As many trades are kept as the file with the most of them has
+            if counts[filename] > entry[2]:
+                entry[2] += 1
+                yield filename, trade
+            else:
+                self.removed[filename, entry[0]] += 1
+
+    def total_removed(self):
+        """
+        Get the number of trades that were removed from all of the files.
+        """
+        return sum(self.removed.values())
+
+
+def unique_files(filenames):
+    """
+    Get the files without the ones that were given again, under the same
+    or another path, and the pairs of each repeated file and the file it
+    repeats.
+    """
+    paths = {}
+    unique = []
+    repeated = []
+
+    for filename in filenames:
+        path = os.path.realpath(filename)
+
+        if path in paths:
+            repeated.append((filename, paths[path]))
+        else:
+            paths[path] = filename
+            unique.append(filename)
+
+    return unique, repeated
+
+
+def merge_file_trades(streams, filenames):
+    """
+    Merge the streams of trades of the files, which are each in
+    chronological order, into pairs of the file and the trade.
+    """
+    return heapq.merge(
+        *[
+            zip(repeat(filename), stream)
+            for filename, stream in zip(filenames, streams)
+        ],
+        key=lambda pair: pair[1]['timestamp']
+    )
+
+
+def merge_unique_trades(streams, filenames, duplicates):
+    """
+    Merge the streams of trades of the files, which are each in
+    chronological order, dropping the duplicates with the filter.
+    """
+    return duplicates.filter(merge_file_trades(streams, filenames))
@@ -7,19 +7,48 @@ class InsufficientUnitsError(Exception):
     """
     Disposition of more units than held.
     """
-    def __init__(self, trade_date, sold_units, units_held):
+    def __init__(self, trade_date, sold_units, units_held, asset=None):
         self.trade_date = trade_date
         self.sold_units = sold_units
         self.units_held = units_held
-        super(InsufficientUnitsError, self).__init__()
+        self.asset = asset
+        # Keep the values in the arguments, so the error can be pickled back
+        # from a worker process
+        super(InsufficientUnitsError, self).__init__(
+            trade_date,
+            sold_units,
+            units_held,
+            asset,
+        )
 
     def __str__(self):
-        return 'Cannot sell {} units on {} when only holding {}'.format(
+        message = 'Cannot sell {} units on {} when only holding {}'.format(
             self.sold_units,
             self.trade_date,
             self.units_held,
         )
 
+        if self.asset is not None:
+            message = '{}: {}'.format(self.asset, message)
+
+        return message
+
+
+class MissingExchangeRateError(Exception):
+    """
+    No exchange rate for the currency on the date of a trade.
+    """
+    def __init__(self, trade_date, currency):
+        self.trade_date = trade_date
+        self.currency = currency
+        super(MissingExchangeRateError, self).__init__(trade_date, currency)
+
+    def __str__(self):
+        return 'No {} exchange rate for {}'.format(
+            self.currency,
+            self.trade_date.strftime('%Y/%m/%d'),
+        )
+
 
 class UnrecognizedFormatError(Exception):
     """
@@ -27,4 +56,6 @@ class UnrecognizedFormatError(Exception):
     """
     def __init__(self, header):
         self.header = header
-        super(UnrecognizedFormatError, self).__init__()
+        # Keep the header in the arguments, so the error can be pickled back
+        # from a worker process
+        super(UnrecognizedFormatError, self).__init__(header)
@@ -0,0 +1,197 @@
+"""
+Exchange rate lookup table.
+
+Rates are kept in an array for each currency, indexed by the ordinal day of
+the date, so looking up the rate for a trade is a subtraction and an index
+rather than formatting the date as a string. Dates without a rate, such as
+weekends and holidays, can be filled from the rates around them.
+"""
+import csv
+from datetime import datetime
+from decimal import Decimal
+
+
+FILL_NONE = 'none'
+FILL_PREVIOUS = 'previous'
+FILL_NEAREST = 'nearest'
+FILL_POLICIES = (FILL_NONE, FILL_PREVIOUS, FILL_NEAREST)
+
+DATE_FORMAT = '%Y/%m/%d'
+
+
+def parse_date_ordinal(date_string):
+    """
+    Get the ordinal day of a yyyy/mm/dd date string.
+    """
+    return datetime.strptime(date_string, DATE_FORMAT).toordinal()
+
+
+class ExchangeRateTable():
+    """
+    Exchange rates by currency and day, in units of the currency per unit
+    of the base currency.
+
+    With the previous fill policy, a day without a rate uses the rate of the
+    last day before it that has one, like the previous business day. With
+    the nearest policy, it uses the rate of the closest day, preferring the
+    earlier one when two are equally close.
+    """
+    def __init__(self, fill=FILL_NONE):
+        if fill not in FILL_POLICIES:
+            raise ValueError('Unknown fill policy: {}'.format(fill))
+
+        self.fill = fill
+        self.first_ordinal = None
+        self.rates = {}
+        self.filled = {}
+
+    @classmethod
+    def from_csv(cls, filename, fill=FILL_NONE):
+        """
+        Load the rates from a CSV file with date, currency and rate columns.
+        """
+        table = cls(fill)
+
+        with open(filename, 'rt') as csvfile:
+            table.add_all(
+                (
+                    parse_date_ordinal(row['date']),
+                    row['currency'].lower(),
+                    Decimal(row['rate']),
+                )
+                for row in csv.DictReader(csvfile)
+            )
+
+        return table
+
+    @classmethod
+    def from_dict(cls, exchange_rates, fill=FILL_NONE):
+        """
+        Load the rates from a dict of yyyy/mm/dd date strings to dicts of
+        currency to rate.
+        """
+        table = cls(fill)
+        table.add_all(
+            (parse_date_ordinal(date_string), currency, rate)
+            for date_string, currency_rates in exchange_rates.items()
+            for currency, rate in currency_rates.items()
+        )
+
+        return table
+
+    def add_all(self, rates):
+        """
+        Set the rates of (ordinal day, currency, rate) rows. The arrays are
+        moved back to the earliest of the days once, rather than once for
+        each earlier day, since rate files are often newest first.
+        """
+        rates = list(rates)
+
+        if rates:
+            self.start_at(min(ordinal for ordinal, _, _ in rates))
+
+        for ordinal, currency, rate in rates:
+            self.add(ordinal, currency, rate)
+
+    def add(self, ordinal, currency, rate):
+        """
+        Set the rate of a currency on a day.
+        """
+        self.start_at(ordinal)
+        currency_rates = self.rates.setdefault(currency, [])
+        index = ordinal - self.first_ordinal
+
+        if index >= len(currency_rates):
+            currency_rates.extend([None] * (index + 1 - len(currency_rates)))
+
+        currency_rates[index] = rate
+        self.filled.pop(currency, None)
+
+    def start_at(self, ordinal):
+        """
+        Move the first day of the arrays back to an ordinal day, if it is
+        before the current first day.
+        """
+        if self.first_ordinal is None:
+            self.first_ordinal = ordinal
+
+        if ordinal < self.first_ordinal:
+            shift = self.first_ordinal - ordinal
+            self.first_ordinal = ordinal
+
+            for currency_rates in self.rates.values():
+                currency_rates[:0] = [None] * shift
+
+            self.filled = {}
+
+    def get_rate(self, currency, trade_date):
+        """
+        Get the rate of a currency on the date of a trade, or None if there
+        is no rate for it.
+        """
+        return self.get_ordinal_rate(currency, trade_date.toordinal())
+
+    def get_ordinal_rate(self, currency, ordinal):
+        """
+        Get the rate of a currency on an ordinal day, or None if there is no
+        rate for it.
+        """
+        if currency not in self.rates:
+            return None
+
+        currency_rates = self.filled.get(currency)
+
+        if currency_rates is None:
+            currency_rates = self.fill_rates(self.rates[currency])
+            self.filled[currency] = currency_rates
+
+        index = ordinal - self.first_ordinal
+
+        if index < 0:
+            return currency_rates[0] if self.fill == FILL_NEAREST else None
+
+        if index >= len(currency_rates):
+            return currency_rates[-1] if self.fill != FILL_NONE else None
+
+        return currency_rates[index]
+
+    def fill_rates(self, currency_rates):
+        """
+        Fill the days without a rate, according to the fill policy.
+        """
+        if self.fill == FILL_NONE:
+            return currency_rates
+
+        filled = list(currency_rates)
+        previous = [None] * len(filled)
+        last = None
+
+        for index, rate in enumerate(filled):
+            if rate is not None:
+                last = index
+            previous[index] = last
+
+        if self.fill == FILL_PREVIOUS:
+            return [
+                filled[index] if index is not None else None
+                for index in previous
+            ]
+
+        following = None
+
+        for index in range(len(filled) - 1, -1, -1):
+            if currency_rates[index] is not None:
+                following = index
+                continue
+
+            before = previous[index]
+
+            if before is None or (
+                    following is not None
+                    and following - index < index - before
+            ):
+                filled[index] = currency_rates[following]
+            else:
+                filled[index] = currency_rates[before]
+
+        return filled
@@ -0,0 +1,53 @@
+"""
+Stats, hashing and atomic writes of the local files kept between runs.
+"""
+from contextlib import contextmanager
+import hashlib
+import os
+
+
+READ_SIZE = 1024 * 1024
+
+
+def file_stat(filename):
+    """
+    Get the size, modification time and inode of a file, which change
+    whenever the file is written or replaced, without reading it.
+    """
+    stat = os.stat(filename)
+
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def hash_range(fileobj, start, stop):
+    """
+    Get the hash of a byte range of a file.
+    """
+    range_hash = hashlib.sha256()
+    fileobj.seek(start)
+    remaining = stop - start
+
+    while remaining > 0:
+        block = fileobj.read(min(READ_SIZE, remaining))
+
+        if not block:
+            break
+
+        range_hash.update(block)
+        remaining -= len(block)
+
+    return range_hash.hexdigest()
+
+
+@contextmanager
+def atomic_write(path, mode='wt'):
+    """
+    Open a temporary file to write, which replaces the file at the path
+    once it is written, so that a partly written file is never read.
+    """
+    temporary_path = '{}.tmp'.format(path)
+
+    with open(temporary_path, mode) as fileobj:
+        yield fileobj
+
+    os.replace(temporary_path, path)
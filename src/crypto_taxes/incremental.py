@@ -0,0 +1,215 @@
+"""
+Incremental processing of trade files that grow over time.
+
+Exchange exports are downloaded again as new trades are made, so the new
+file is the old one with rows added, at the end for oldest first files, or
+after the header for newest first files. The state of each file is kept,
+along with the running tabulations, so that later runs only parse the rows
+that were added and continue the calculations from where they left off.
+
+Only the header and the bytes at the boundaries of the previous rows are
+hashed, so the time taken by a run depends on the rows that were added
+rather than the length of the history. An edit to a row far from both ends
+of a file is not noticed, so the state should be discarded after editing
+old rows by hand.
+"""
+from decimal import Decimal
+import json
+import os
+
+from .files import atomic_write, hash_range
+
+
+# The bytes at each end of the rows that are hashed, to check that the rows
+# of the previous run are still there
+DEFAULT_BOUNDARY_SIZE = 64 * 1024
+
+
+def boundary_hashes(fileobj, header_size, size, boundary_size):
+    """
+    Get the hashes of the header, and of the first and last bytes of the
+    rows after it, up to the boundary size.
+    """
+    length = min(boundary_size, size - header_size)
+
+    return {
+        'header_hash': hash_range(fileobj, 0, header_size),
+        'head_hash': hash_range(fileobj, header_size, header_size + length),
+        'tail_hash': hash_range(fileobj, size - length, size),
+        'boundary_size': length,
+    }
+
+
+def snapshot_file(filename, boundary_size=DEFAULT_BOUNDARY_SIZE):
+    """
+    Get the state of a file, used to find the rows added to it later. Only
+    the header and the bytes at the boundaries of the rows are read.
+    """
+    with open(filename, 'rb') as snapshot:
+        header_size = len(snapshot.readline())
+        size = os.fstat(snapshot.fileno()).st_size
+        state = {'size': size, 'header_size': header_size}
+        state.update(
+            boundary_hashes(snapshot, header_size, size, boundary_size)
+        )
+
+        return state
+
+
+def ends_row(fileobj, offset):
+    """
+    Check whether the byte before an offset of a file ends a row.
+    """
+    fileobj.seek(offset - 1)
+
+    return fileobj.read(1) == b'\n'
+
+
+def find_added_range(filename, previous):
+    """
+    Find the byte range of the rows added to a file since its previous
+    state. Returns None if the file was changed in any other way that shows
+    at the boundaries of its previous rows.
+    """
+    if 'tail_hash' not in previous:
+        return None
+
+    length = previous['boundary_size']
+    header_size = previous['header_size']
+
+    with open(filename, 'rb') as current:
+        size = os.fstat(current.fileno()).st_size
+
+        if size < previous['size'] or \
+                len(current.readline()) != header_size or \
+                hash_range(current, 0, header_size) != \
+                previous['header_hash']:
+            return None
+
+        if size == previous['size']:
+            return (size, size) if hash_range(
+                current,
+                size - length,
+                size,
+            ) == previous['tail_hash'] else None
+
+        # Rows appended to the end of the file
+        stop = previous['size']
+
+        if hash_range(current, stop - length, stop) == \
+                previous['tail_hash'] and \
+                hash_range(current, header_size, header_size + length) == \
+                previous['head_hash'] and ends_row(current, stop):
+            return stop, size
+
+        # Rows inserted after the header, for newest first files
+        body_start = size - (previous['size'] - header_size)
+
+        if hash_range(current, body_start, body_start + length) == \
+                previous['head_hash'] and \
+                hash_range(current, size - length, size) == \
+                previous['tail_hash'] and ends_row(current, body_start):
+            return header_size, body_start
+
+    return None
+
+
+def encode_tabulations(tabulations):
+    """
+    Convert tabulations to JSON values, leaving out the events.
+    """
+    return {
+        key: str(value)
+        for key, value in tabulations.items()
+        if key != 'events'
+    }
+
+
+def decode_tabulations(values):
+    """
+    Convert tabulations back from JSON values, with no events yet.
+    """
+    tabulations = {key: Decimal(value) for key, value in values.items()}
+    tabulations['events'] = []
+
+    return tabulations
+
+
+class IncrementalState():
+    """
+    The state of the trade files and the running tabulations, kept in a
+    local JSON file between runs.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+
+        if os.path.exists(path):
+            with open(path, 'rt') as state_file:
+                self.state = json.load(state_file)
+
+    def find_added_ranges(self, filenames, options):
+        """
+        Find the byte ranges of the rows added to each of the files.
+
+        Returns None if the state cannot be continued from, because the
+        options changed, or a file was removed or changed other than by
+        adding rows. New files are read in full.
+        """
+        if not self.state or self.state['options'] != options:
+            return None
+
+        files = self.state['files']
+
+        if set(files) - set(filenames):
+            return None
+
+        ranges = {}
+
+        for filename in filenames:
+            if filename not in files:
+                ranges[filename] = None
+                continue
+
+            added_range = find_added_range(filename, files[filename])
+
+            if added_range is None:
+                return None
+
+            ranges[filename] = added_range
+
+        return ranges
+
+    def results(self):
+        """
+        Get the running tabulations of each asset.
+        """
+        return {
+            asset: decode_tabulations(tabulations)
+            for asset, tabulations in self.state['results'].items()
+        }
+
+    def timestamp(self):
+        """
+        Get the timestamp of the last trade that was processed.
+        """
+        return self.state['timestamp']
+
+    def save(self, filenames, options, results, timestamp):
+        """
+        Record the state of the files and the tabulations, and write them to
+        the file, replacing it atomically.
+        """
+        self.state = {
+            'options': options,
+            'files': {
+                filename: snapshot_file(filename) for filename in filenames
+            },
+            'results': {
+                asset: encode_tabulations(tabulations)
+                for asset, tabulations in results.items()
+            },
+            'timestamp': timestamp,
+        }
+        with atomic_write(self.path) as state_file:
+            json.dump(self.state, state_file, indent=2, sort_keys=True)
@@ -0,0 +1,106 @@
+"""
+Parallel parsing of trade files.
+
+Each file is split into chunks of rows, on row boundaries, and the chunks
+are parsed in a pool of processes. A chunk comes back as a trade store,
+which is compact to send between processes, and the chunks of each file are
+joined back together in file order, to be served by a CSV reader like any
+other parsed file.
+
+Rows are assumed not to contain line breaks, as in the exchange exports.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from .calculator import CSVReader
+from .records import TradeStore
+
+
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def split_ranges(filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Split the rows of a CSV file into byte ranges of about the chunk size,
+    each starting and ending on a row boundary. There is always at least one
+    range, so that the header of an empty file is still checked.
+    """
+    ranges = []
+
+    with open(filename, 'rb') as csvfile:
+        start = len(csvfile.readline())
+        size = os.fstat(csvfile.fileno()).st_size
+
+        while True:
+            stop = min(start + chunk_size, size)
+
+            if stop < size:
+                # Move the end of the chunk to the end of its last row
+                csvfile.seek(stop - 1)
+                csvfile.readline()
+                stop = csvfile.tell()
+
+            ranges.append((start, stop))
+
+            if stop >= size:
+                return ranges
+
+            start = stop
+
+
+def parse_range(filename, start, stop):
+    """
+    Parse a byte range of a CSV file into a trade store, in a worker
+    process.
+    """
+    return TradeStore(CSVReader().iter_trades_range(filename, start, stop))
+
+
+def parse_files(
+        csv_reader,
+        filenames,
+        jobs=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    """
+    Parse the CSV files in a pool of processes, adding the trade store of
+    each file to the CSV reader.
+
+    Files that are in the cache of the reader are loaded from it instead,
+    and the files that are parsed are added to the cache.
+    """
+    pending = []
+
+    for filename in filenames:
+        store = None
+
+        if csv_reader.cache is not None:
+            store = csv_reader.cache.load(filename)
+
+        if store is None:
+            pending.append(filename)
+        else:
+            csv_reader.add_store(filename, store)
+
+    chunks = [
+        (filename, start, stop)
+        for filename in pending
+        for start, stop in split_ranges(filename, chunk_size)
+    ]
+
+    if not chunks:
+        return
+
+    stores = {filename: TradeStore() for filename in pending}
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        chunk_stores = executor.map(parse_range, *zip(*chunks))
+
+        for (filename, _, _), chunk_store in zip(chunks, chunk_stores):
+            stores[filename].extend_store(chunk_store)
+
+    for filename, store in stores.items():
+        if csv_reader.cache is not None:
+            csv_reader.cache.save(filename, store)
+
+        csv_reader.add_store(filename, store)
@@ -4,47 +4,245 @@ Parsers for exchange CSV files.
 The CSV export format is not consistent across all exchanges. These parsers
 take a row from any given CSV, and return the relevant fields in a normalized
 format.
+
+Each parser declares the columns of its header, and the column and the
+conversion of each field of a trade. From those, a row converter is built
+for the format, which reads the fields by position from the rows of a plain
+CSV reader. The trades keep the text of their amounts, which is only
+converted when an amount is first read. A matcher is built too, which
+checks the assets of a row from its raw text, so that rows for other assets
+are skipped before any of their fields are converted.
+
+Parsers can also be made for rows of bytes, as split by the scanner, in
+which case each field is decoded as part of its conversion.
 """
-from datetime import datetime
 from decimal import Decimal
+from operator import itemgetter
 
 from .exceptions import UnrecognizedFormatError
+from .records import LazyTrade
+
+
+PARSER_MAP = {}
+
+
+def register(parser_class):
+    """
+    Register a parser for the header of its format.
+    """
+    PARSER_MAP[','.join(parser_class.COLUMNS)] = parser_class
+
+    return parser_class
 
 
 def get_parser(reader):
     """
     Gets the right parser for this CSV.
     """
-    header = ','.join(reader.fieldnames)
+    return find_parser(reader.fieldnames)
+
+
+def find_parser(header, encoded=False):
+    """
+    Gets the right parser for the column names of a header row, for rows of
+    bytes when encoded.
+    """
+    if encoded and header:
+        header = [column.decode() for column in header]
+
+    header = ','.join(header) if header else ''
 
     if header not in PARSER_MAP:
         raise UnrecognizedFormatError(header)
 
-    return PARSER_MAP[header]()
+    return PARSER_MAP[header](encoded)
+
+
+# Conversions of text that work the same on bytes
+BYTES_CONVERSIONS = {
+    str.lower: bytes.lower,
+    str.upper: bytes.upper,
+    str.strip: bytes.strip,
+}
 
 
-class BitsoQCXParser():
+def decoded(conversion):
     """
-    Parser for Bitso & QuadrigaCX CSVs.
+    Get a conversion of the bytes of a field, decoding them first. The text
+    is kept as is when there is no conversion.
+    """
+    if conversion is None:
+        return bytes.decode
+
+    # Floats are parsed from bytes directly
+    if conversion is float:
+        return float
+
+    def convert(raw):
+        return conversion(raw.decode())
+
+    return convert
+
+
+def field_getter(parser_class, fields):
+    """
+    Get a function reading the columns of some fields from a row.
+    """
+    return itemgetter(*(
+        parser_class.COLUMNS.index(parser_class.FIELDS[field][0])
+        for field in fields
+    ))
+
+
+def decoded_values(getter):
+    """
+    Get a function reading values from a row of bytes as text.
+    """
+    def get_values(row):
+        return tuple(value.decode() for value in getter(row))
+
+    return get_values
+
+
+def field_conversion(conversion, encoded=False):
+    """
+    Get the conversion of a field, decoding it first when encoded.
+    """
+    if encoded:
+        return decoded(conversion)
+
+    return conversion or str
+
+
+def asset_matcher(conversion, encoded=False):
+    """
+    Get the conversion of an asset field compared against the asset matched.
+    Rows of bytes are matched against an encoded asset, without decoding the
+    assets of rows that do not match.
     """
+    if encoded and conversion in BYTES_CONVERSIONS:
+        return BYTES_CONVERSIONS[conversion]
+
+    convert = field_conversion(conversion, encoded)
+
+    if not encoded:
+        return convert
+
+    def match(raw):
+        return convert(raw).encode()
+
+    return match
+
+
+def compile_parser(parser_class, encoded=False):
+    """
+    Build the row converter and the asset matcher of a parser from its
+    declared columns and fields, for rows of bytes when encoded.
+    """
+    get_fields = field_getter(
+        parser_class,
+        ('type', 'major', 'minor', 'timestamp'),
+    )
+    get_assets = field_getter(parser_class, ('major', 'minor'))
+    convert_type, convert_major, convert_minor, convert_timestamp = (
+        field_conversion(parser_class.FIELDS[field][1], encoded)
+        for field in ('type', 'major', 'minor', 'timestamp')
+    )
+    match_major, match_minor = (
+        asset_matcher(parser_class.FIELDS[field][1], encoded)
+        for field in ('major', 'minor')
+    )
+
+    # The amounts keep their text, which is only decoded once the row matched
+    get_amounts = field_getter(parser_class, LazyTrade.AMOUNTS)
+    conversions = tuple(
+        parser_class.FIELDS[field][1] or str for field in LazyTrade.AMOUNTS
+    )
+
+    if encoded:
+        get_amounts = decoded_values(get_amounts)
+
+    def convert(row):
+        trade_type, major, minor, timestamp = get_fields(row)
+
+        return LazyTrade(
+            convert_type(trade_type),
+            convert_major(major),
+            convert_minor(minor),
+            get_amounts(row),
+            conversions,
+            convert_timestamp(timestamp),
+        )
+
+    def matches(row, asset):
+        major, minor = get_assets(row)
+
+        return match_major(major) == asset or match_minor(minor) == asset
+
+    return convert, matches
+
+
+class Parser():
+    """
+    Base for the parsers of exchange CSV formats.
+
+    COLUMNS are the column names of the header, in order. FIELDS map each
+    field of a trade to its column, and to a function converting the text
+    of the column, or None to keep the text.
+    """
+    COLUMNS = ()
+    FIELDS = {}
+    compiled = {}
+
+    def __init__(self, encoded=False):
+        key = (self.__class__, encoded)
+
+        if key not in Parser.compiled:
+            Parser.compiled[key] = compile_parser(self.__class__, encoded)
+
+        self.convert, self.matches = Parser.compiled[key]
+        column, conversion = self.FIELDS['timestamp']
+        self.timestamp_index = self.COLUMNS.index(column)
+        self.convert_timestamp = decoded(conversion) if encoded \
+            else conversion
+
     def parse_row(self, row):
         """
-        Return CSV fields in normalized format.
+        Return CSV fields in normalized format, from a row of a dict reader.
         """
-        return {
-            'type': row['type'],
-            'major': row['major'].lower(),
-            'minor': row['minor'].lower(),
-            'amount': Decimal(row['amount']),
-            'rate': Decimal(row['rate']),
-            'value': Decimal(row['value']),
-            'total': Decimal(row['total']),
-            'dt': datetime.fromtimestamp(float(row['timestamp'])),
-            'timestamp': float(row['timestamp']),
-        }
-
-
-PARSER_MAP = {
-    'type,major,minor,amount,rate,value,fee,total,timestamp,datetime':
-        BitsoQCXParser
-}
+        return self.convert([row[column] for column in self.COLUMNS])
+
+    def parse_values(self, values):
+        """
+        Return CSV fields in normalized format, from a row of a plain reader.
+        """
+        return self.convert(values)
+
+    def parse_timestamp(self, values):
+        """
+        Return only the timestamp of a row of a plain reader, for ordering.
+        """
+        value = values[self.timestamp_index]
+
+        if self.convert_timestamp is None:
+            return value
+
+        return self.convert_timestamp(value)
+
+
+@register
+class BitsoQCXParser(Parser):
+    """
+    Parser for Bitso & QuadrigaCX CSVs.
+    """
+    COLUMNS = (
+        'type', 'major', 'minor', 'amount', 'rate', 'value', 'fee', 'total',
+        'timestamp', 'datetime',
+    )
+    FIELDS = dict(
+        {field: (field, Decimal) for field in LazyTrade.AMOUNTS},
+        type=('type', None),
+        major=('major', str.lower),
+        minor=('minor', str.lower),
+        timestamp=('timestamp', float),
+    )
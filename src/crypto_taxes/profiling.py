@@ -0,0 +1,276 @@
+"""
+Profiling of the stages of a calculation.
+
+The trades are streamed through the stages, so the stages run interleaved
+rather than one after another. The profiler keeps a stack of the active
+stages, and time is only counted towards the innermost one, so that each
+stage reports its own time even when it is pulling trades through the
+stages before it.
+
+Memory is not measured per stage: the peak resident size of the whole
+process is read when each stage is left, so it includes the memory of every
+stage that ran before. It shows where in the run the peak was reached.
+
+A disabled profiler passes everything through untouched, so code can be
+instrumented unconditionally.
+"""
+from contextlib import contextmanager
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+def peak_rss():
+    """
+    Get the peak resident set size of the process so far, in bytes, or None
+    if it is not available on this platform.
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Stage():
+    """
+    The totals of a stage, and the peak resident size of the process when
+    the stage was last left.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rows = 0
+        self.process_peak_rss = None
+        self.first_start = None
+        self.last_stop = None
+
+    def to_dict(self):
+        """
+        Get the totals as a dict.
+        """
+        return {
+            'wall_seconds': self.wall,
+            'cpu_seconds': self.cpu,
+            'rows': self.rows,
+            'rows_per_second': self.rows / self.wall if self.wall else None,
+            'process_peak_rss_bytes': self.process_peak_rss,
+        }
+
+
+class Profiler():
+    """
+    Collects the time and rows of each stage, the peak memory of the process
+    at the end of each stage, and counters.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self.active = []
+        self.last_wall = None
+        self.last_cpu = None
+
+    def get_stage(self, name):
+        """
+        Get the totals of a stage, creating them when it is first used.
+        """
+        if name not in self.stages:
+            self.stages[name] = Stage(name)
+
+        return self.stages[name]
+
+    def switch(self):
+        """
+        Count the time since the last switch towards the innermost stage.
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        if self.active:
+            stage = self.active[-1]
+            stage.wall += wall - self.last_wall
+            stage.cpu += cpu - self.last_cpu
+            stage.last_stop = wall
+
+        self.last_wall = wall
+        self.last_cpu = cpu
+
+    def enter(self, name):
+        """
+        Make a stage the innermost active stage.
+        """
+        self.switch()
+        stage = self.get_stage(name)
+
+        if stage.first_start is None:
+            stage.first_start = self.last_wall
+
+        self.active.append(stage)
+
+    def exit(self):
+        """
+        Leave the innermost active stage.
+        """
+        self.switch()
+        stage = self.active.pop()
+        stage.process_peak_rss = peak_rss()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Count the time of a block of code towards a stage.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        self.enter(name)
+
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def iterate(self, name, iterable, counter=None):
+        """
+        Count the time spent getting each item of an iterable towards a
+        stage, and the items as the rows of the stage.
+        """
+        if not self.enabled:
+            return iterable
+
+        return self.iter_timed(name, iter(iterable), counter)
+
+    def iter_timed(self, name, iterator, counter):
+        """
+        Yield the items of an iterator, timing each one.
+        """
+        stage = self.get_stage(name)
+
+        while True:
+            self.enter(name)
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+
+            stage.rows += 1
+
+            if counter is not None:
+                self.count(counter)
+
+            yield item
+
+    def add_rows(self, name, rows):
+        """
+        Add to the rows of a stage, for stages timed as a block of code.
+        """
+        if self.enabled:
+            self.get_stage(name).rows += rows
+
+    def count(self, name, amount=1):
+        """
+        Add to a counter.
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dict(self):
+        """
+        Get the stages and counters as a dict.
+        """
+        return {
+            'stages': {
+                name: stage.to_dict() for name, stage in self.stages.items()
+            },
+            'counters': dict(self.counters),
+        }
+
+    def report(self, file=None, per_trade_counter=None):
+        """
+        Print a table of the stages and the counters. Counters can also be
+        shown per trade, relative to another counter.
+        """
+        file = file if file is not None else sys.stderr
+        print(
+            '{:<24}{:>12}{:>12}{:>12}{:>14}{:>18}'.format(
+                'Stage',
+                'Wall (s)',
+                'CPU (s)',
+                'Rows',
+                'Rows/s',
+                'Process peak RSS',
+            ),
+            file=file,
+        )
+
+        for stage in self.stages.values():
+            values = stage.to_dict()
+            print(
+                '{:<24}{:>12.3f}{:>12.3f}{:>12}{:>14}{:>18}'.format(
+                    stage.name,
+                    stage.wall,
+                    stage.cpu,
+                    stage.rows,
+                    '{:.0f}'.format(values['rows_per_second'])
+                    if values['rows_per_second'] else '-',
+                    '{:.1f}MB'.format(stage.process_peak_rss / 1024 / 1024)
+                    if stage.process_peak_rss else '-',
+                ),
+                file=file,
+            )
+
+        trades = self.counters.get(per_trade_counter)
+
+        for name, value in sorted(self.counters.items()):
+            line = '{:<24}{:>12}'.format(name, value)
+
+            if trades and name != per_trade_counter:
+                line += '{:>12.2f} per trade'.format(value / trades)
+
+            print(line, file=file)
+
+    def write_chrome_trace(self, path):
+        """
+        Write the stages in the Chrome trace event format, each on its own
+        row, spanning from when the stage first started to when it last
+        stopped.
+        """
+        starts = [
+            stage.first_start for stage in self.stages.values()
+            if stage.first_start is not None
+        ]
+        origin = min(starts) if starts else 0.0
+        events = []
+
+        for thread_id, stage in enumerate(self.stages.values()):
+            if stage.first_start is None:
+                continue
+
+            events.append({
+                'name': stage.name,
+                'ph': 'X',
+                'pid': 0,
+                'tid': thread_id,
+                'ts': (stage.first_start - origin) * 1e6,
+                'dur': (stage.last_stop - stage.first_start) * 1e6,
+                'args': stage.to_dict(),
+            })
+
+        with open(path, 'wt') as trace_file:
+            json.dump(
+                {'traceEvents': events, 'otherData': self.counters},
+                trace_file,
+            )
@@ -0,0 +1,540 @@
+"""
+Compact records for trades and events.
+
+Trades and events are slotted objects rather than dicts, and still support
+the mapping interface, so they can be used anywhere a trade or event dict
+is expected. The trade store keeps a whole history as columns of fixed
+point integers, which takes a small fraction of the memory of the records.
+"""
+from array import array
+from collections.abc import Mapping
+from datetime import datetime
+from decimal import Decimal
+from sys import intern
+
+
+# The range of the fixed point columns of the trade store. Amounts outside
+# it are kept as decimals, marked by the overflow exponent.
+MAX_COEFFICIENT = 2 ** 63 - 1
+MIN_EXPONENT = -127
+MAX_EXPONENT = 127
+OVERFLOW_EXPONENT = -128
+
+
+def decimal_fixed_point(value):
+    """
+    Get the coefficient and exponent of a Decimal amount, or None if they
+    do not fit in the fixed point columns.
+    """
+    exponent = value.as_tuple().exponent
+
+    if not isinstance(exponent, int) or \
+            not MIN_EXPONENT <= exponent <= MAX_EXPONENT:
+        return None
+
+    coefficient = int(value.scaleb(-exponent))
+
+    if abs(coefficient) > MAX_COEFFICIENT:
+        return None
+
+    return coefficient, exponent
+
+
+def parse_fixed_point(text):
+    """
+    Get the coefficient and exponent of the text of a plain decimal amount,
+    the same as for the Decimal of the text, without converting it. None is
+    returned for any other text, or if they do not fit in the fixed point
+    columns.
+    """
+    whole, _, fraction = text.strip().partition('.')
+    digits = whole + fraction
+    unsigned = digits[1:] if digits[:1] in ('+', '-') else digits
+
+    if not unsigned.isdecimal() or len(fraction) > -MIN_EXPONENT:
+        return None
+
+    coefficient = int(digits)
+
+    if abs(coefficient) > MAX_COEFFICIENT:
+        return None
+
+    return coefficient, -len(fraction)
+
+
+class Record(Mapping):
+    """
+    Base for slotted records which can be read like dicts.
+    """
+    __slots__ = ()
+    FIELDS = ()
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, dict(self))
+
+
+class Trade(Record):
+    """
+    A trade in the normalized format.
+
+    The date is derived from the timestamp when it is first used.
+    """
+    __slots__ = (
+        'type',
+        'major',
+        'minor',
+        'amount',
+        'rate',
+        'value',
+        'total',
+        'timestamp',
+        'cached_dt',
+    )
+    FIELDS = (
+        'type',
+        'major',
+        'minor',
+        'amount',
+        'rate',
+        'value',
+        'total',
+        'dt',
+        'timestamp',
+    )
+
+    def __init__(
+            self,
+            trade_type,
+            major,
+            minor,
+            amount,
+            rate,
+            value,
+            total,
+            timestamp,
+    ):
+        self.type = intern(trade_type)
+        self.major = intern(major)
+        self.minor = intern(minor)
+        self.amount = amount
+        self.rate = rate
+        self.value = value
+        self.total = total
+        self.timestamp = timestamp
+        self.cached_dt = None
+
+    @property
+    def dt(self):
+        """
+        The local date and time of the trade.
+        """
+        if self.cached_dt is None:
+            self.cached_dt = datetime.fromtimestamp(self.timestamp)
+
+        return self.cached_dt
+
+    def __setitem__(self, key, value):
+        if key == 'dt' or key not in self.FIELDS:
+            raise KeyError(key)
+
+        setattr(self, key, value)
+
+
+def lazy_field(name, index):
+    """
+    Make a property for an amount of a lazy trade, which converts the text
+    of the amount when it is first read, and keeps it in the slot of the
+    trade.
+    """
+    slot = getattr(Trade, name)
+
+    def get(self):
+        value = slot.__get__(self)
+
+        if value is None:
+            value = self.conversions[index](self.raw[index])
+            slot.__set__(self, value)
+
+        return value
+
+    def set(self, value):
+        slot.__set__(self, value)
+
+    return property(get, set)
+
+
+class LazyTrade(Trade):
+    """
+    A trade parsed from a CSV row, which keeps the text of its amounts and
+    converts each one when it is first read.
+
+    The type, assets and timestamp are converted right away, since trades
+    are filtered and ordered by them, so trades that are skipped never pay
+    for converting their amounts.
+    """
+    __slots__ = ('raw', 'conversions')
+    AMOUNTS = ('amount', 'rate', 'value', 'total')
+
+    amount = lazy_field('amount', 0)
+    rate = lazy_field('rate', 1)
+    value = lazy_field('value', 2)
+    total = lazy_field('total', 3)
+
+    def __init__(
+            self,
+            trade_type,
+            major,
+            minor,
+            raw,
+            conversions,
+            timestamp,
+    ):
+        super(LazyTrade, self).__init__(
+            trade_type,
+            major,
+            minor,
+            None,
+            None,
+            None,
+            None,
+            timestamp,
+        )
+        self.raw = raw
+        self.conversions = conversions
+
+    def unconverted(self, field):
+        """
+        Get the text of an amount that is converted to a Decimal, if it has
+        not been converted yet, or else None.
+        """
+        index = self.AMOUNTS.index(field)
+
+        if getattr(Trade, field).__get__(self) is not None or \
+                self.conversions[index] is not Decimal:
+            return None
+
+        return self.raw[index]
+
+
+class ConvertedTrade(Record):
+    """
+    A view of a trade with its rate, value and total converted into the
+    base currency.
+
+    The trade itself is left unchanged, so the same trades can be shared by
+    several calculations at once. The other fields are read from the trade,
+    which can be a record or a dict.
+    """
+    __slots__ = ('trade', 'rate', 'value', 'total', 'exchange_rate')
+    FIELDS = Trade.FIELDS + ('exchange_rate',)
+    CONVERTED = frozenset(__slots__[1:])
+
+    def __init__(self, trade, exchange_rate, rate, value, total):
+        self.trade = trade
+        self.exchange_rate = exchange_rate
+        self.rate = rate
+        self.value = value
+        self.total = total
+
+    def __getitem__(self, key):
+        if key in self.CONVERTED:
+            return getattr(self, key)
+
+        return self.trade[key]
+
+
+class Event(Record):
+    """
+    The result of processing a trade.
+    """
+    __slots__ = (
+        'action',
+        'major',
+        'minor',
+        'amount',
+        'dt',
+        'acb',
+        'rate',
+        'units_held',
+        'exchange_rate',
+        'capital_gains',
+        'capital_gain',
+    )
+    FIELDS = __slots__
+
+    def __init__(
+            self,
+            action,
+            major,
+            minor,
+            amount,
+            dt,
+            acb,
+            rate,
+            units_held,
+            exchange_rate,
+            capital_gains,
+            capital_gain,
+    ):
+        self.action = action
+        self.major = major
+        self.minor = minor
+        self.amount = amount
+        self.dt = dt
+        self.acb = acb
+        self.rate = rate
+        self.units_held = units_held
+        self.exchange_rate = exchange_rate
+        self.capital_gains = capital_gains
+        self.capital_gain = capital_gain
+
+
+class TradeStore():
+    """
+    Column store of trades.
+
+    Asset, currency and type codes are interned into a table, and stored as
+    indexes into it. Decimal amounts are stored as fixed point integers with
+    an exponent per value, so they come back exactly as they were parsed,
+    including trailing zeros. The rare amounts with too many digits to fit
+    are kept as decimals instead, by field and index.
+    """
+    DECIMAL_FIELDS = ('amount', 'rate', 'value', 'total')
+
+    def __init__(self, trades=None):
+        self.codes = []
+        self.code_indexes = {}
+        self.types = array('H')
+        self.majors = array('H')
+        self.minors = array('H')
+        self.timestamps = array('d')
+        self.coefficients = {}
+        self.exponents = {}
+        self.decimals = {}
+
+        for field in self.DECIMAL_FIELDS:
+            self.coefficients[field] = array('q')
+            self.exponents[field] = array('b')
+
+        if trades is not None:
+            self.extend(trades)
+
+    @classmethod
+    def from_columns(cls, codes, columns, decimals=()):
+        """
+        Create a store from a code table and named columns, as returned by
+        the columns method, and the amounts kept as decimals, as returned by
+        the overflow method.
+        """
+        store = cls()
+        store.decimals = {
+            (field, index): Decimal(value) for field, index, value in decimals
+        }
+        store.codes = [intern(code) for code in codes]
+        store.code_indexes = {
+            code: index for index, code in enumerate(store.codes)
+        }
+
+        for name, column in columns:
+            if '.' in name:
+                group, field = name.split('.')
+                getattr(store, group)[field] = column
+            else:
+                setattr(store, name, column)
+
+        return store
+
+    def columns(self):
+        """
+        Get the columns of the store, by name.
+        """
+        columns = [
+            ('types', self.types),
+            ('majors', self.majors),
+            ('minors', self.minors),
+            ('timestamps', self.timestamps),
+        ]
+
+        for field in self.DECIMAL_FIELDS:
+            columns.append(
+                ('coefficients.{}'.format(field), self.coefficients[field])
+            )
+            columns.append(
+                ('exponents.{}'.format(field), self.exponents[field])
+            )
+
+        return columns
+
+    def overflow(self):
+        """
+        Get the amounts that are kept as decimals, as the field, the index
+        and the text of each amount.
+        """
+        return [
+            [field, index, str(value)]
+            for (field, index), value in sorted(self.decimals.items())
+        ]
+
+    def code(self, value):
+        """
+        Get the index of a code in the table, adding it if it is new.
+        """
+        if value not in self.code_indexes:
+            self.code_indexes[value] = len(self.codes)
+            self.codes.append(intern(value))
+
+        return self.code_indexes[value]
+
+    def append(self, trade):
+        """
+        Add a trade to the end of the store. The amounts of lazy trades that
+        were not read yet are taken from their text, so they are left
+        unconverted.
+        """
+        index = len(self)
+        self.types.append(self.code(trade['type']))
+        self.majors.append(self.code(trade['major']))
+        self.minors.append(self.code(trade['minor']))
+        self.timestamps.append(trade['timestamp'])
+
+        for field in self.DECIMAL_FIELDS:
+            text = trade.unconverted(field) \
+                if isinstance(trade, LazyTrade) else None
+            fixed = parse_fixed_point(text) if text is not None else None
+
+            if fixed is None:
+                fixed = decimal_fixed_point(trade[field])
+
+            if fixed is None:
+                self.decimals[field, index] = trade[field]
+                fixed = (0, OVERFLOW_EXPONENT)
+
+            self.coefficients[field].append(fixed[0])
+            self.exponents[field].append(fixed[1])
+
+    def extend(self, trades):
+        """
+        Add several trades to the end of the store.
+        """
+        for trade in trades:
+            self.append(trade)
+
+    def extend_store(self, other):
+        """
+        Add the trades of another store to the end of the store, without
+        building them as records.
+        """
+        codes = [self.code(code) for code in other.codes]
+        offset = len(self)
+
+        for (field, index), value in other.decimals.items():
+            self.decimals[field, index + offset] = value
+
+        for name in ('types', 'majors', 'minors'):
+            getattr(self, name).extend(
+                codes[index] for index in getattr(other, name)
+            )
+
+        self.timestamps.extend(other.timestamps)
+
+        for field in self.DECIMAL_FIELDS:
+            self.coefficients[field].extend(other.coefficients[field])
+            self.exponents[field].extend(other.exponents[field])
+
+    def reverse(self):
+        """
+        Reverse the order of the trades of the store, in place.
+        """
+        last = len(self) - 1
+        self.decimals = {
+            (field, last - index): value
+            for (field, index), value in self.decimals.items()
+        }
+
+        for _, column in self.columns():
+            column.reverse()
+
+    def decimal(self, field, index):
+        """
+        Get a decimal field of a trade back from its fixed point value.
+        """
+        if self.exponents[field][index] == OVERFLOW_EXPONENT:
+            return self.decimals[field, index]
+
+        return Decimal(self.coefficients[field][index]).scaleb(
+            self.exponents[field][index]
+        )
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+
+        codes = self.codes
+
+        return Trade(
+            codes[self.types[index]],
+            codes[self.majors[index]],
+            codes[self.minors[index]],
+            self.decimal('amount', index),
+            self.decimal('rate', index),
+            self.decimal('value', index),
+            self.decimal('total', index),
+            self.timestamps[index],
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def iter_trades(self, target_asset=None, reverse=False):
+        """
+        Stream the trades for an asset, comparing codes so that the trades
+        for other assets are never built.
+        """
+        indexes = range(len(self))
+
+        if reverse:
+            indexes = reversed(indexes)
+
+        if target_asset is None:
+            for index in indexes:
+                yield self[index]
+            return
+
+        code = self.code_indexes.get(target_asset)
+
+        if code is None:
+            return
+
+        majors = self.majors
+        minors = self.minors
+
+        for index in indexes:
+            if majors[index] == code or minors[index] == code:
+                yield self[index]
+
+    def nbytes(self):
+        """
+        Get the approximate memory used by the columns, in bytes.
+        """
+        columns = [column for _, column in self.columns()]
+
+        return sum(column.itemsize * len(column) for column in columns)
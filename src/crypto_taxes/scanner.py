@@ -0,0 +1,138 @@
+"""
+Memory mapped scanning of CSV files.
+
+The file is mapped into memory rather than read through a text stream, and
+the rows are found by searching its bytes. Rows are split into fields as
+bytes, so that text is only decoded for the fields a parser actually reads,
+and rows that are filtered out by asset are never decoded at all. Rows
+with quoted fields, which exchange exports rarely have, are split by the csv
+module instead. Pages that were scanned are released as the scan goes, so
+that the resident size stays bounded however large the file is.
+"""
+from contextlib import contextmanager
+import csv
+import mmap
+import os
+
+
+DEFAULT_RELEASE_SIZE = 4 * 1024 * 1024
+
+
+@contextmanager
+def map_file(filename):
+    """
+    Map a file into memory, read only. An empty file, which cannot be
+    mapped, is empty bytes instead.
+    """
+    with open(filename, 'rb') as fileobj:
+        if os.fstat(fileobj.fileno()).st_size == 0:
+            yield b''
+            return
+
+        mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def split_row(line):
+    """
+    Split a line of a CSV file into its fields, as bytes.
+    """
+    if b'"' in line:
+        return [
+            field.encode() for field in next(csv.reader([line.decode()]), [])
+        ]
+
+    return line.rstrip(b'\r\n').split(b',')
+
+
+def release(mapped, start, stop):
+    """
+    Drop the pages between two offsets of a mapped file from memory, once
+    they have been scanned, so that the resident size of the process stays
+    bounded for very large files. The pages are read from the file again if
+    they are used again. Returns the page boundary released up to.
+    """
+    start -= start % mmap.PAGESIZE
+    stop -= stop % mmap.PAGESIZE
+
+    if stop > start and hasattr(mapped, 'madvise') and \
+            hasattr(mmap, 'MADV_DONTNEED'):
+        mapped.madvise(mmap.MADV_DONTNEED, start, stop - start)
+
+    return stop
+
+
+def iter_lines(mapped, start, stop, release_size=DEFAULT_RELEASE_SIZE):
+    """
+    Yield the non blank lines between two offsets, which must be on line
+    boundaries.
+    """
+    released = start
+    mapped.seek(start)
+    readline = mapped.readline
+
+    while start < stop:
+        line = readline()
+        start += len(line)
+
+        if line.strip():
+            yield line
+
+        if start - released >= release_size:
+            released = release(mapped, released, start)
+
+
+def iter_lines_reversed(
+        mapped,
+        start,
+        stop,
+        release_size=DEFAULT_RELEASE_SIZE
+):
+    """
+    Yield the non blank lines between two offsets from the last to the
+    first, searching backwards from the stop.
+    """
+    released = stop
+
+    while stop > start:
+        # The line ending at the stop may end with its own newline
+        begin = max(mapped.rfind(b'\n', start, stop - 1) + 1, start)
+        line = mapped[begin:stop]
+        stop = begin
+
+        if line.strip():
+            yield line
+
+        if released - stop >= release_size:
+            # Round up, to keep the page of the next line
+            page = stop + (-stop % mmap.PAGESIZE)
+            release(mapped, page, released)
+            released = page
+
+
+def iter_rows(filename, start=None, stop=None, reverse=False):
+    """
+    Yield the header row of a CSV file, and then the rows in a byte range of
+    the file, which must start and end on row boundaries, with the fields as
+    bytes. The rows are yielded from the last to the first when reversed.
+    """
+    with map_file(filename) as mapped:
+        header_end = mapped.find(b'\n')
+        header_end = len(mapped) if header_end < 0 else header_end + 1
+
+        yield split_row(mapped[:header_end])
+
+        start = header_end if start is None else max(start, header_end)
+        stop = len(mapped) if stop is None else stop
+
+        if start >= stop:
+            return
+        lines = iter_lines_reversed(mapped, start, stop) if reverse \
+            else iter_lines(mapped, start, stop)
+
+        for line in lines:
+            yield split_row(line)
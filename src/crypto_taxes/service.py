@@ -0,0 +1,355 @@
+"""
+Resident calculation service with an HTTP/JSON API.
+
+The service keeps the trades, the exchange rates, the calculated results and
+the year end holdings of each asset in memory between requests, so that a
+query only calculates what it has not calculated already, starting from the
+holdings at the end of the previous year when they are known. Calculations
+run in a bounded pool of worker threads, keeping the event loop responsive,
+and requests wait for a free slot once too many are queued. The threads only
+let requests overlap with each other: the Decimal calculations hold the GIL,
+so they use a single CPU between them however many workers there are.
+
+Endpoints:
+
+    GET  /assets                            the assets that were traded
+    GET  /tabulations?asset=btc&year=2018   the totals of a tax year
+    GET  /events?asset=btc&year=2018        the events of a tax year
+    POST /trades {"trades": [...]}          add trades, as JSON objects
+"""
+import asyncio
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from http import HTTPStatus
+import json
+import threading
+from urllib.parse import parse_qsl, urlsplit
+
+from .arguments import DEFAULT_WORKERS
+from .calculator import Calculator, year_start
+from .exceptions import InsufficientUnitsError, MissingExchangeRateError
+from .exchange_rates import ExchangeRateTable
+from .records import Trade
+from .sorting import trade_timestamp
+from .writers import event_values, total_values
+
+
+DEFAULT_MAX_PENDING = 64
+TRADE_TYPES = ('buy', 'sell')
+
+
+def parse_trade(values):
+    """
+    Create a trade from its JSON values, with amounts as strings.
+    """
+    if values['type'] not in TRADE_TYPES:
+        raise ValueError('Unknown trade type: {}'.format(values['type']))
+
+    return Trade(
+        values['type'],
+        values['major'].lower(),
+        values['minor'].lower(),
+        Decimal(values['amount']),
+        Decimal(values['rate']),
+        Decimal(values['value']),
+        Decimal(values['total']),
+        float(values['timestamp']),
+    )
+
+
+class CalculationService():
+    """
+    Calculations of the tax years of any asset, kept warm in memory.
+
+    The trades are replaced rather than changed when trades are added, so a
+    calculation in progress keeps using the trades it started with, and its
+    result is only kept if no trades were added in the meantime.
+    """
+    def __init__(
+            self,
+            trades=None,
+            exchange_rates=None,
+            base_currency='cad',
+            workers=DEFAULT_WORKERS,
+            max_pending=DEFAULT_MAX_PENDING,
+    ):
+        self.exchange_rates = exchange_rates if exchange_rates is not None \
+            else ExchangeRateTable()
+        self.base_currency = base_currency
+        self.trades = []
+        self.timestamps = []
+        self.version = 0
+        self.results = {}
+        self.checkpoints = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(workers)
+        self.max_pending = max_pending
+        self.slots = None
+
+        if trades is not None:
+            self.add_trades(trades)
+
+    def add_trades(self, trades):
+        """
+        Add trades, dropping the results and year end holdings of the
+        assets they affect from their year onwards.
+        """
+        trades = list(trades)
+
+        if not trades:
+            return 0
+
+        assets = set()
+
+        for trade in trades:
+            assets.update((trade['major'], trade['minor']))
+
+        first_year = min(trade['dt'].year for trade in trades)
+
+        with self.lock:
+            # Both lists are already sorted, which the sort takes advantage
+            # of, and trades with equal timestamps keep their order.
+            merged = sorted(self.trades + trades, key=trade_timestamp)
+            self.trades = merged
+            self.timestamps = [trade['timestamp'] for trade in merged]
+            self.version += 1
+
+            for cache in (self.results, self.checkpoints):
+                for asset, year in list(cache):
+                    if asset in assets and year >= first_year:
+                        del cache[asset, year]
+
+        return len(trades)
+
+    def assets(self):
+        """
+        Get the assets that were traded.
+        """
+        with self.lock:
+            return sorted({trade['major'] for trade in self.trades})
+
+    def calculate(self, asset, year):
+        """
+        Get the tabulations of an asset for a tax year, calculating them if
+        they are not calculated yet.
+        """
+        with self.lock:
+            if (asset, year) in self.results:
+                return self.results[asset, year]
+
+            trades = self.trades
+            timestamps = self.timestamps
+            version = self.version
+            holdings = self.checkpoints.get((asset, year - 1))
+
+        start = bisect_left(timestamps, year_start(year))
+        stop = bisect_left(timestamps, year_start(year + 1))
+        checkpoints = {}
+
+        def on_year_end(end_year, results, _):
+            checkpoints[asset, end_year] = (
+                results[asset]['acb'],
+                results[asset]['units_held'],
+            )
+
+        if holdings is not None or start == 0:
+            # Start the year from the holdings at the end of the last one
+            calculator = Calculator(
+                iter(trades[start:stop]),
+                self.exchange_rates,
+                self.base_currency,
+            )
+            results = calculator.calculate_assets(
+                [asset],
+                year,
+                {asset: holdings} if holdings is not None else None,
+            )
+        else:
+            calculator = Calculator(
+                iter(trades[:stop]),
+                self.exchange_rates,
+                self.base_currency,
+            )
+            results = calculator.calculate_assets(
+                [asset],
+                year,
+                on_year_end=on_year_end,
+            )
+
+        tabulations = results[asset]
+        checkpoints[asset, year] = (
+            tabulations['acb'],
+            tabulations['units_held'],
+        )
+
+        with self.lock:
+            if self.version == version:
+                self.results[asset, year] = tabulations
+                self.checkpoints.update(checkpoints)
+
+        return tabulations
+
+    async def run(self, function, *args):
+        """
+        Run a function in the worker pool, waiting for a slot if too many
+        are already queued.
+        """
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_pending)
+
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+
+            return await loop.run_in_executor(self.executor, function, *args)
+
+    async def handle(self, method, path, query, body):
+        """
+        Handle a request, returning the status and the JSON response.
+        """
+        try:
+            if method == 'GET' and path == '/assets':
+                return HTTPStatus.OK, {'assets': self.assets()}
+
+            if method == 'GET' and path in ('/tabulations', '/events'):
+                asset = query['asset'].lower()
+                tabulations = await self.run(
+                    self.calculate,
+                    asset,
+                    int(query['year']),
+                )
+
+                if path == '/events':
+                    return HTTPStatus.OK, {'events': [
+                        event_values(event)
+                        for event in tabulations['events']
+                    ]}
+
+                return HTTPStatus.OK, total_values(tabulations)
+
+            if method == 'POST' and path == '/trades':
+                trades = [parse_trade(values) for values in body['trades']]
+                added = await self.run(self.add_trades, trades)
+
+                return HTTPStatus.OK, {'added': added}
+
+        except (KeyError, TypeError, ValueError, InvalidOperation) as err:
+            return HTTPStatus.BAD_REQUEST, {
+                'error': 'Invalid request: {!r}'.format(err),
+            }
+        except (InsufficientUnitsError, MissingExchangeRateError) as err:
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {'error': str(err)}
+
+        return HTTPStatus.NOT_FOUND, {'error': 'Not found'}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve a single HTTP request on a connection.
+        """
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode().split()
+            headers = {}
+
+            while True:
+                line = await reader.readline()
+
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+                name, _, value = line.decode().partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0))
+            body = await reader.readexactly(length) if length else b''
+            url = urlsplit(target)
+            status, response = await self.handle(
+                method,
+                url.path,
+                dict(parse_qsl(url.query)),
+                json.loads(body) if body else {},
+            )
+        except asyncio.IncompleteReadError:
+            # The client disconnected before sending the whole body
+            writer.close()
+            return
+        except ValueError:
+            status = HTTPStatus.BAD_REQUEST
+            response = {'error': 'Malformed request'}
+
+        data = json.dumps(response).encode()
+        writer.write(
+            'HTTP/1.1 {} {}\r\n'
+            'Content-Type: application/json\r\n'
+            'Content-Length: {}\r\n'
+            'Connection: close\r\n\r\n'.format(
+                status.value,
+                status.phrase,
+                len(data),
+            ).encode() + data
+        )
+        await writer.drain()
+        writer.close()
+
+    async def serve(self, host, port):
+        """
+        Serve the HTTP API until cancelled.
+        """
+        server = await asyncio.start_server(
+            self.handle_connection,
+            host,
+            port,
+        )
+
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        """
+        Shut down the worker pool.
+        """
+        self.executor.shutdown()
+
+
+class LocalClient():
+    """
+    Client that calls a service in the same process, without a network, for
+    tests and embedding. Responses go through JSON like they would over
+    HTTP.
+    """
+    def __init__(self, service):
+        self.service = service
+        self.loop = asyncio.new_event_loop()
+
+    def request(self, method, path, query=None, body=None):
+        """
+        Make a request, returning the status code and the JSON response.
+        """
+        status, response = self.loop.run_until_complete(self.service.handle(
+            method,
+            path,
+            query if query is not None else {},
+            json.loads(json.dumps(body)) if body is not None else {},
+        ))
+
+        return status.value, json.loads(json.dumps(response))
+
+    def get(self, path, **query):
+        """
+        Make a GET request with query parameters.
+        """
+        return self.request('GET', path, {
+            name: str(value) for name, value in query.items()
+        })
+
+    def post(self, path, body):
+        """
+        Make a POST request with a JSON body.
+        """
+        return self.request('POST', path, body=body)
+
+    def close(self):
+        """
+        Close the event loop of the client.
+        """
+        self.loop.close()
@@ -0,0 +1,153 @@
+"""
+Sorting of trades by time.
+
+The exchange exports are already ordered by time, usually newest first, so
+each file can be streamed in chronological order, and the files merged,
+without holding the whole trade history in memory.
+"""
+import heapq
+import pickle
+from tempfile import TemporaryFile
+
+
+ASCENDING = 'ascending'
+DESCENDING = 'descending'
+UNORDERED = 'unordered'
+
+DEFAULT_RUN_SIZE = 100000
+
+
+def trade_timestamp(trade):
+    """
+    Sort key for trades.
+    """
+    return trade['timestamp']
+
+
+def detect_order(timestamps):
+    """
+    Detect whether the timestamps are ascending, descending, or unordered.
+
+    Equal timestamps are allowed in either order. A sequence where all the
+    timestamps are equal is considered ascending.
+    """
+    ascending = True
+    descending = True
+    previous = None
+
+    for timestamp in timestamps:
+        if previous is not None:
+            if timestamp < previous:
+                ascending = False
+            elif timestamp > previous:
+                descending = False
+
+            if not ascending and not descending:
+                return UNORDERED
+
+        previous = timestamp
+
+    return ASCENDING if ascending else DESCENDING
+
+
+def reverse_runs(trades):
+    """
+    Reverse the order within each run of trades with equal timestamps.
+
+    A newest first file read backwards is oldest first, but the trades at
+    the same time come out backwards too. Reversing the runs restores their
+    file order, matching a stable sort of the whole file.
+    """
+    run = []
+
+    for trade in trades:
+        if run and run[-1]['timestamp'] != trade['timestamp']:
+            yield from reversed(run)
+            run = []
+
+        run.append(trade)
+
+    yield from reversed(run)
+
+
+def sort_trades(trades):
+    """
+    Sort a list of trades read from a single file, the same way that the
+    file would be streamed in chronological order.
+    """
+    order = detect_order(trade['timestamp'] for trade in trades)
+
+    if order == DESCENDING:
+        return list(reverse_runs(reversed(trades)))
+
+    if order == UNORDERED:
+        return sorted(trades, key=trade_timestamp)
+
+    return trades
+
+
+def external_sort(trades, run_size=DEFAULT_RUN_SIZE):
+    """
+    Sort a stream of trades by timestamp, holding at most run_size trades in
+    memory. Sorted runs are spilled to temporary files and merged.
+    """
+    runs = []
+    run = []
+
+    try:
+        for trade in trades:
+            run.append(trade)
+
+            if len(run) >= run_size:
+                runs.append(spill_run(run))
+                run = []
+
+        if not runs:
+            run.sort(key=trade_timestamp)
+            yield from run
+            return
+
+        if run:
+            runs.append(spill_run(run))
+
+        yield from heapq.merge(*map(iter_run, runs), key=trade_timestamp)
+
+    finally:
+        for run_file in runs:
+            run_file.close()
+
+
+def spill_run(run):
+    """
+    Sort a run of trades and write it to a temporary file.
+    """
+    run.sort(key=trade_timestamp)
+    run_file = TemporaryFile()
+
+    for trade in run:
+        pickle.dump(trade, run_file, pickle.HIGHEST_PROTOCOL)
+
+    return run_file
+
+
+def iter_run(run_file):
+    """
+    Read back the trades from a spilled run.
+    """
+    run_file.seek(0)
+
+    while True:
+        try:
+            yield pickle.load(run_file)
+        except EOFError:
+            return
+
+
+def merge_trades(streams):
+    """
+    Merge several streams of trades that are each in chronological order.
+
+    Trades with equal timestamps keep the order of the streams, the same as
+    a stable sort of the streams concatenated together.
+    """
+    return heapq.merge(*streams, key=trade_timestamp)
@@ -0,0 +1,168 @@
+"""
+Detection of superficial losses.
+
+A loss on the disposition of an asset is superficial when the same asset is
+acquired in the period from 30 days before to 30 days after it, and is still
+held at the end of that period. The part of the loss for the units that were
+replaced is denied, and added to the ACB of the units held instead.
+
+The trades are read ahead of the calculation by the length of the period.
+Each asset keeps running sums of the units bought and of the change in units
+held by its trades in the window, so that the acquisitions around a sale,
+and the holdings at the end of its period, are found with binary searches
+rather than by scanning the trades again for each sale.
+"""
+from bisect import bisect_left, bisect_right
+from collections import deque
+from decimal import Decimal
+
+
+ZERO = Decimal('0')
+DEFAULT_DAYS = 30
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Trades that fell out of the window are dropped in batches of this size
+TRIM_SIZE = 4096
+
+
+class AssetWindow():
+    """
+    The trades of a single asset that are within the window, as running sums
+    of the units bought and the change in units held, by timestamp.
+    """
+    def __init__(self):
+        self.timestamps = []
+        self.bought = [ZERO]
+        self.net = [ZERO]
+        self.offset = 0
+
+    def add(self, timestamp, bought, net):
+        """
+        Add a trade, returning its position among all of the trades of the
+        asset.
+        """
+        self.timestamps.append(timestamp)
+        self.bought.append(self.bought[-1] + bought)
+        self.net.append(self.net[-1] + net)
+
+        return self.offset + len(self.timestamps) - 1
+
+    def trim(self, timestamp):
+        """
+        Drop the trades before a timestamp, once there are enough of them.
+        """
+        stop = bisect_left(self.timestamps, timestamp)
+
+        if stop >= TRIM_SIZE:
+            del self.timestamps[:stop]
+            del self.bought[:stop]
+            del self.net[:stop]
+            self.offset += stop
+
+    def replaced_units(self, position, period, units_sold, units_held):
+        """
+        Get the units of a sale that were replaced within the period around
+        it, given the units held right after the sale.
+        """
+        timestamp = self.timestamps[position - self.offset]
+        self.trim(timestamp - period)
+        index = position - self.offset
+        start = bisect_left(self.timestamps, timestamp - period)
+        stop = bisect_right(self.timestamps, timestamp + period)
+
+        acquired = self.bought[stop] - self.bought[start]
+        held = units_held + self.net[stop] - self.net[index + 1]
+
+        return max(min(units_sold, acquired, held), ZERO)
+
+
+class SuperficialLossWindow():
+    """
+    Reads the trades ahead of the calculation, so that the losses of sales
+    can be checked against the trades in the period around them.
+
+    The trades are split into the trades of each asset with the given split
+    function, like they are for the calculation.
+    """
+    def __init__(self, trades, split, days=DEFAULT_DAYS):
+        self.trades = iter(trades)
+        self.split = split
+        self.period = days * SECONDS_PER_DAY
+        self.windows = {}
+        self.pending = deque()
+        self.last_timestamp = None
+        self.exhausted = False
+        self.positions = {}
+
+    def __iter__(self):
+        while self.pending or self.read():
+            timestamp = self.pending[0][0]['timestamp']
+
+            while not self.exhausted and \
+                    self.last_timestamp <= timestamp + self.period:
+                self.read()
+
+            trade, self.positions = self.pending.popleft()
+
+            yield trade
+
+    def read(self):
+        """
+        Read the next trade into the windows of its assets, returning False
+        when there are no more trades.
+        """
+        trade = next(self.trades, None)
+
+        if trade is None:
+            self.exhausted = True
+            return False
+
+        positions = {}
+
+        for asset, asset_trade in self.split(trade):
+            if asset not in self.windows:
+                self.windows[asset] = AssetWindow()
+
+            if asset_trade['type'] == 'buy':
+                bought = net = asset_trade['total']
+            else:
+                bought = ZERO
+                net = -asset_trade['amount']
+
+            positions[asset] = self.windows[asset].add(
+                trade['timestamp'],
+                bought,
+                net,
+            )
+
+        self.last_timestamp = trade['timestamp']
+        self.pending.append((trade, positions))
+
+        return True
+
+    def adjust(self, asset, trade, event, tabulations):
+        """
+        Deny the superficial part of the loss of a sale of an asset, of the
+        trade that was last read from the window, adding it to the ACB and
+        updating the event.
+        """
+        if trade['type'] != 'sell' or event['capital_gain'] >= 0:
+            return
+
+        units = self.windows[asset].replaced_units(
+            self.positions[asset],
+            self.period,
+            trade['amount'],
+            tabulations['units_held'],
+        )
+
+        if units <= 0:
+            return
+
+        denied = -event['capital_gain'] * units / trade['amount']
+        tabulations['acb'] += denied
+        tabulations['capital_gains'] += denied
+        tabulations['superficial_losses'] += denied
+        event.acb = tabulations['acb']
+        event.capital_gain += denied
+        event.capital_gains = tabulations['capital_gains']
@@ -0,0 +1,203 @@
+"""
+Trade history that recalculates only what changed.
+
+The timeline keeps the events of every trade, and snapshots of the running
+tabulations of each asset every so many trades. When trades are added or
+removed anywhere in the history, such as from a corrected export, the
+calculation restarts from the last snapshot before the earliest change, and
+only the trades from there on are processed again. The totals are running
+totals over the whole history, rather than per tax year.
+"""
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from .calculator import Calculator, split_trade
+from .exceptions import InsufficientUnitsError
+
+
+DEFAULT_INTERVAL = 1000
+
+# An event that changed, where the old or new event is None when the event
+# was added or removed
+EventChange = namedtuple('EventChange', ['asset', 'old', 'new'])
+
+
+def copy_state(results):
+    """
+    Copy the running tabulations of each asset, without their events.
+    """
+    return {
+        asset: {
+            key: value for key, value in tabulations.items()
+            if key != 'events'
+        }
+        for asset, tabulations in results.items()
+    }
+
+
+class Timeline():
+    """
+    The trades and events of the assets, in chronological order, with
+    snapshots of the running tabulations.
+    """
+    def __init__(
+            self,
+            assets,
+            exchange_rates=None,
+            base_currency='cad',
+            initial_holdings=None,
+            interval=DEFAULT_INTERVAL,
+    ):
+        self.calculator = Calculator(None, exchange_rates, base_currency)
+        self.assets = list(assets)
+        self.interval = interval
+        self.trades = []
+        self.timestamps = []
+        self.events = []
+        initial = self.calculator.create_asset_tabulations(
+            self.assets,
+            initial_holdings,
+        )
+        self.snapshots = [(0, copy_state(initial))]
+        self.state = copy_state(initial)
+
+    def find_trade(self, trade, taken=()):
+        """
+        Get the position of a trade equal to the given one, other than the
+        positions already taken.
+        """
+        position = bisect_left(self.timestamps, trade['timestamp'])
+        stop = bisect_right(self.timestamps, trade['timestamp'])
+
+        for index in range(position, stop):
+            if index not in taken and dict(self.trades[index]) == dict(trade):
+                return index
+
+        raise ValueError('Trade not found: {!r}'.format(dict(trade)))
+
+    def update(self, added=(), removed=()):
+        """
+        Add and remove trades, and recalculate from the last snapshot before
+        the earliest change. Trades that are added at the same time as
+        existing ones go after them. Returns the changes to the events.
+
+        Nothing is changed if the new history cannot be calculated.
+        """
+        removed_positions = set()
+
+        # Identical trades are each removed from a position of their own
+        for trade in removed:
+            removed_positions.add(self.find_trade(trade, removed_positions))
+
+        added = sorted(added, key=lambda trade: trade['timestamp'])
+        start = min(
+            list(removed_positions) + [
+                bisect_right(self.timestamps, trade['timestamp'])
+                for trade in added
+            ],
+            default=len(self.trades),
+        )
+        index = bisect_right([i for i, _ in self.snapshots], start) - 1
+        restart, state = self.snapshots[index]
+
+        suffix = [
+            trade for position, trade in enumerate(
+                self.trades[restart:],
+                restart,
+            )
+            if position not in removed_positions
+        ]
+
+        # Both are sorted, and the sort is stable, so added trades go after
+        # the existing trades at the same time
+        suffix = sorted(suffix + added, key=lambda trade: trade['timestamp'])
+        events, snapshots, final_state = self.calculate(
+            restart,
+            suffix,
+            state,
+        )
+        changes = self.compare(
+            self.trades[start:],
+            self.events[start:],
+            suffix[start - restart:],
+            events[start - restart:],
+        )
+
+        del self.snapshots[index + 1:]
+        self.snapshots.extend(snapshots)
+        self.trades[restart:] = suffix
+        self.timestamps[restart:] = [trade['timestamp'] for trade in suffix]
+        self.events[restart:] = events
+        self.state = final_state
+
+        return changes
+
+    def calculate(self, restart, trades, state):
+        """
+        Process trades from a snapshot, getting the events of each trade,
+        the snapshots taken along the way, and the final state.
+        """
+        results = copy_state(state)
+        events = []
+        snapshots = []
+
+        for position, trade in enumerate(trades, restart):
+            if position > restart and position % self.interval == 0:
+                snapshots.append((position, copy_state(results)))
+
+            trade_events = []
+
+            for asset, asset_trade in split_trade(trade, results):
+                try:
+                    event = self.calculator.process_trade(
+                        asset_trade,
+                        results[asset],
+                    )
+                except InsufficientUnitsError as err:
+                    err.asset = asset
+                    raise
+
+                trade_events.append((asset, event))
+
+            events.append(trade_events)
+
+        return events, snapshots, results
+
+    def compare(self, old_trades, old_events, new_trades, new_events):
+        """
+        Get the changes between the events of the old and new trades, which
+        are matched by identity.
+        """
+        old = {
+            (id(trade), asset): event
+            for trade, trade_events in zip(old_trades, old_events)
+            for asset, event in trade_events
+        }
+        changes = []
+
+        for trade, trade_events in zip(new_trades, new_events):
+            for asset, event in trade_events:
+                old_event = old.pop((id(trade), asset), None)
+
+                if old_event is None or old_event != event:
+                    changes.append(EventChange(asset, old_event, event))
+
+        for (_, asset), event in old.items():
+            changes.append(EventChange(asset, event, None))
+
+        return changes
+
+    def tabulations(self, asset):
+        """
+        Get the running tabulations of an asset after all of the trades,
+        with all of its events.
+        """
+        tabulations = dict(self.state[asset])
+        tabulations['events'] = [
+            event
+            for trade_events in self.events
+            for event_asset, event in trade_events
+            if event_asset == asset
+        ]
+
+        return tabulations
@@ -0,0 +1,389 @@
+"""
+Vectorized ACB engine using NumPy.
+
+Under the average cost method, a buy adds its cost to the ACB, and a sell
+scales the ACB by the fraction of units that are still held. The ACB is a
+linear recurrence over the trades, acb[k] = ratio[k] * acb[k-1] + cost[k],
+which is solved for a whole block of trades with cumulative sums and
+products.
+
+Units are tracked as int64 fixed point values with 8 decimal places, so
+selling all of the units held resets the ACB to exactly zero. Amounts of
+units with more decimal places, such as those of trades mirrored from the
+rate of another pair, are rounded to the nearest 0.00000001, so the units
+held agree with the Decimal calculator to within that much per such trade.
+Amounts of money are float64, and agree with the Decimal calculator to
+within floating point tolerance.
+The fields of each trade are read once, and the columns are converted and
+combined as arrays, so the only per trade Decimal work left is for the units
+and the events of the tax year.
+
+NumPy is an optional dependency, only needed for this engine.
+"""
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_EVEN
+from itertools import repeat
+from operator import attrgetter, itemgetter
+
+from .calculator import Calculator, year_start
+from .exceptions import InsufficientUnitsError, MissingExchangeRateError
+from .records import Event, Trade
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+UNIT_DECIMAL_PLACES = 8
+UNIT_SCALE = 10 ** UNIT_DECIMAL_PLACES
+
+# The recurrence is solved in blocks, carrying the ACB between them, so the
+# cumulative product of the sell ratios cannot underflow.
+BLOCK_SIZE = 1024
+MIN_PRODUCT = 1e-200
+
+# The stored fields of a trade, without the date derived from the timestamp
+TRADE_FIELDS = tuple(field for field in Trade.FIELDS if field != 'dt')
+TYPE, MAJOR, MINOR, AMOUNT, RATE, VALUE, TOTAL, TIMESTAMP = range(
+    len(TRADE_FIELDS)
+)
+get_record_fields = attrgetter(*TRADE_FIELDS)
+get_dict_fields = itemgetter(*TRADE_FIELDS)
+
+
+def trade_fields(trade):
+    """
+    Get the fields of a trade as a tuple, reading the slots of trade records
+    directly rather than through the mapping interface.
+    """
+    try:
+        return get_record_fields(trade)
+    except AttributeError:
+        return get_dict_fields(trade)
+
+
+def float_column(fields, index):
+    """
+    Get a field of the trades as an array of floats.
+    """
+    return np.fromiter(
+        map(float, map(itemgetter(index), fields)),
+        dtype=float,
+        count=len(fields),
+    )
+
+
+def to_fixed(units):
+    """
+    Convert units of an asset to a fixed point integer, rounding any
+    further decimal places to the nearest, with ties to even.
+    """
+    return int(
+        units.scaleb(UNIT_DECIMAL_PLACES).to_integral_value(ROUND_HALF_EVEN)
+    )
+
+
+def from_fixed(fixed):
+    """
+    Convert a fixed point integer back to units of an asset.
+    """
+    return Decimal(int(fixed)).scaleb(-UNIT_DECIMAL_PLACES)
+
+
+def to_decimal(value):
+    """
+    Convert a float amount of money back to a Decimal.
+    """
+    return Decimal(repr(float(value)))
+
+
+def to_decimals(values):
+    """
+    Convert an array of float amounts of money back to Decimals.
+    """
+    return map(Decimal, map(repr, values.tolist()))
+
+
+def solve_acb(ratios, costs, initial_acb):
+    """
+    Solve acb[k] = ratios[k] * acb[k-1] + costs[k] for a block of trades
+    where none of the ratios are zero.
+    """
+    products = np.cumprod(ratios)
+
+    if products[-1] < MIN_PRODUCT:
+        acb = np.empty(len(ratios))
+        previous = initial_acb
+
+        for index, (ratio, cost) in enumerate(zip(ratios, costs)):
+            previous = ratio * previous + cost
+            acb[index] = previous
+
+        return acb
+
+    return products * (initial_acb + np.cumsum(costs / products))
+
+
+class VectorizedCalculator(Calculator):
+    """
+    Calculator that computes the ACB, units held and capital gains for a
+    whole asset history with NumPy arrays.
+
+    The trades must all be for a single asset, with mirrored crypto to
+    crypto trades already split out.
+    """
+    def __init__(self, trades=None, exchange_rates=None, base_currency='cad'):
+        if np is None:
+            raise ImportError('The vectorized engine requires NumPy')
+
+        super(VectorizedCalculator, self).__init__(
+            trades,
+            exchange_rates,
+            base_currency,
+        )
+
+    def calculate(
+            self,
+            tax_year=None,
+            initial_acb=None,
+            initial_units_held=None,
+            include_events=True,
+    ):
+        """
+        Perform the calculations, returning the same tabulations as the
+        Decimal calculator.
+        """
+        tabulations = self.create_tabulations(initial_acb, initial_units_held)
+        tax_year = tax_year if tax_year is not None else date.today().year
+        start = year_start(tax_year)
+        stop = year_start(tax_year + 1)
+
+        # The same bounds as the Decimal calculator, by timestamp
+        fields = [
+            values for values in map(trade_fields, self.trades)
+            if start <= values[TIMESTAMP] < stop
+        ]
+
+        if not fields:
+            return tabulations
+
+        exchange_rates = self.get_exchange_rates(fields)
+        columns = self.build_columns(fields, exchange_rates)
+        initial_fixed = to_fixed(tabulations['units_held'])
+        results = self.compute(
+            columns,
+            float(tabulations['acb']),
+            initial_fixed,
+        )
+
+        self.check_units(fields, results, initial_fixed)
+
+        tabulations['acb'] = to_decimal(results['acb'][-1])
+        tabulations['units_held'] = from_fixed(results['units_held'][-1])
+        tabulations['sum_acb_dispositions'] = to_decimal(
+            results['acb_dispositions'].sum()
+        )
+        tabulations['capital_gains'] = to_decimal(
+            results['capital_gains'][-1]
+        )
+        tabulations['outlays'] = to_decimal(
+            columns['costs'][columns['is_buy']].sum()
+        )
+        tabulations['proceeds'] = to_decimal(
+            columns['proceeds'][~columns['is_buy']].sum()
+        )
+
+        if include_events:
+            tabulations['events'] = self.build_events(
+                fields,
+                exchange_rates,
+                results,
+            )
+
+        return tabulations
+
+    def get_exchange_rates(self, fields):
+        """
+        Get the exchange rate of each trade into the base currency, which is
+        1 for the trades in the base currency.
+        """
+        exchange_rates = []
+
+        for values in fields:
+            if values[MINOR] == self.base_currency:
+                exchange_rates.append(1)
+                continue
+
+            trade_date = datetime.fromtimestamp(values[TIMESTAMP])
+            exchange_rate = self.exchange_rates.get_rate(
+                values[MINOR],
+                trade_date,
+            )
+
+            if exchange_rate is None:
+                raise MissingExchangeRateError(trade_date, values[MINOR])
+
+            exchange_rates.append(exchange_rate)
+
+        return exchange_rates
+
+    def build_columns(self, fields, exchange_rates):
+        """
+        Gather the fields of the trades into arrays, converted into the base
+        currency.
+        """
+        count = len(fields)
+        is_buy = np.fromiter(
+            (values[TYPE] == 'buy' for values in fields),
+            dtype=bool,
+            count=count,
+        )
+        units = np.fromiter(
+            (
+                to_fixed(values[TOTAL] if values[TYPE] == 'buy'
+                         else values[AMOUNT])
+                for values in fields
+            ),
+            dtype=np.int64,
+            count=count,
+        )
+        divisors = np.fromiter(
+            map(float, exchange_rates),
+            dtype=float,
+            count=count,
+        )
+        amounts = float_column(fields, AMOUNT)
+        rates = float_column(fields, RATE) / divisors
+        values = float_column(fields, VALUE) / divisors
+
+        # The total of a buy is in units of the asset, and is not converted
+        totals = np.where(
+            is_buy,
+            0.0,
+            float_column(fields, TOTAL) / divisors,
+        )
+
+        return {
+            'is_buy': is_buy,
+            'units': units,
+            'costs': np.where(is_buy, amounts * rates, 0.0),
+            'proceeds': np.where(is_buy, 0.0, values),
+            'net_proceeds': np.where(
+                is_buy,
+                0.0,
+                rates * amounts - (values - totals),
+            ),
+        }
+
+    def compute(self, columns, initial_acb, initial_units_held):
+        """
+        Compute the running ACB, units held and capital gains arrays.
+        """
+        is_buy = columns['is_buy']
+        deltas = np.where(is_buy, columns['units'], -columns['units'])
+        units_held = initial_units_held + np.cumsum(deltas)
+        units_before = np.concatenate(([initial_units_held], units_held[:-1]))
+
+        ratios = np.ones(len(deltas))
+        sells = ~is_buy & (units_before > 0)
+        ratios[sells] = units_held[sells] / units_before[sells]
+
+        acb = np.empty(len(deltas))
+        previous = initial_acb
+        resets = np.flatnonzero(ratios <= 0)
+        start = 0
+
+        for stop in list(resets) + [len(deltas)]:
+            for block in range(start, stop, BLOCK_SIZE):
+                block_end = min(block + BLOCK_SIZE, stop)
+                acb[block:block_end] = solve_acb(
+                    ratios[block:block_end],
+                    columns['costs'][block:block_end],
+                    previous,
+                )
+                previous = acb[block_end - 1]
+
+            if stop < len(deltas):
+                # Selling every unit held leaves no cost base
+                acb[stop] = 0.0
+                previous = 0.0
+
+            start = stop + 1
+
+        acb_before = np.concatenate(([initial_acb], acb[:-1]))
+        acb_dispositions = np.zeros(len(deltas))
+        acb_dispositions[sells] = acb_before[sells] \
+            * (columns['units'][sells] / units_before[sells])
+        capital_gain = np.where(
+            is_buy,
+            0.0,
+            columns['net_proceeds'] - acb_dispositions,
+        )
+
+        return {
+            'acb': acb,
+            'units_held': units_held,
+            'acb_dispositions': acb_dispositions,
+            'capital_gain': capital_gain,
+            'capital_gains': np.cumsum(capital_gain),
+        }
+
+    def check_units(self, fields, results, initial_units_held):
+        """
+        Raise for the first sell of more units than were held.
+        """
+        oversold = np.flatnonzero(results['units_held'] < 0)
+
+        if len(oversold):
+            index = oversold[0]
+            held = results['units_held'][index - 1] if index \
+                else initial_units_held
+            raise InsufficientUnitsError(
+                datetime.fromtimestamp(fields[index][TIMESTAMP]),
+                fields[index][AMOUNT],
+                from_fixed(held),
+            )
+
+    def build_events(self, fields, exchange_rates, results):
+        """
+        Build the events for the trades of the tax year from the computed
+        arrays, converting whole columns to Python values at a time.
+        """
+        rates = [
+            values[RATE] if values[MINOR] == self.base_currency
+            else values[RATE] / exchange_rate
+            for values, exchange_rate in zip(fields, exchange_rates)
+        ]
+        rows = zip(
+            fields,
+            rates,
+            exchange_rates,
+            map(datetime.fromtimestamp, map(itemgetter(TIMESTAMP), fields)),
+            to_decimals(results['acb']),
+            map(
+                Decimal.scaleb,
+                map(Decimal, results['units_held'].tolist()),
+                repeat(-UNIT_DECIMAL_PLACES),
+            ),
+            to_decimals(results['capital_gains']),
+            to_decimals(results['capital_gain']),
+        )
+
+        return [
+            Event(
+                action=values[TYPE],
+                major=values[MAJOR],
+                minor=values[MINOR],
+                amount=values[AMOUNT],
+                dt=dt,
+                acb=acb,
+                rate=rate,
+                units_held=units_held,
+                exchange_rate=exchange_rate,
+                capital_gains=gains,
+                capital_gain=gain,
+            )
+            for values, rate, exchange_rate, dt, acb, units_held, gains, gain
+            in rows
+        ]
@@ -0,0 +1,163 @@
+"""
+What if scenarios of hypothetical trades, for planning tax loss harvesting.
+
+The tabulations of each asset, as calculated up to now, are the base of
+every scenario. A scenario forks only the tabulations of the assets its
+trades touch, copying them when they are first changed, so the history is
+never replayed and the other assets are shared with the base. Batches of
+scenarios can be evaluated in a pool of processes, each one evaluating a
+chunk of the scenarios from its own copy of the base.
+
+Hypothetical trades are assumed to come after the trades of the base.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+import os
+
+from .calculator import Calculator, split_trade
+from .exceptions import InsufficientUnitsError, MissingExchangeRateError
+from .records import Trade
+
+
+# The result of a scenario. The tabulations of the assets that were not
+# traded are the tabulations of the base, and must not be changed. The error
+# is set instead when the trades of the scenario cannot be calculated.
+ScenarioResult = namedtuple(
+    'ScenarioResult',
+    ['capital_gains', 'tabulations', 'error'],
+)
+
+
+def hypothetical_sell(asset, units, price, when, minor, commission=None):
+    """
+    Make a hypothetical sale of units of an asset at a price per unit in the
+    minor currency, at a datetime, less an optional commission.
+    """
+    units = Decimal(units)
+    value = units * Decimal(price)
+    commission = Decimal(commission) if commission is not None \
+        else Decimal('0')
+
+    return Trade(
+        'sell',
+        asset,
+        minor,
+        units,
+        Decimal(price),
+        value,
+        value - commission,
+        when.timestamp() if isinstance(when, datetime) else when,
+    )
+
+
+def fork(tabulations):
+    """
+    Copy the running totals of tabulations, without the events.
+    """
+    return {
+        key: value for key, value in tabulations.items() if key != 'events'
+    }
+
+
+def evaluate_chunk(engine, scenarios):
+    """
+    Evaluate a chunk of scenarios, in a worker process.
+    """
+    return [engine.evaluate(scenario) for scenario in scenarios]
+
+
+class WhatIfEngine():
+    """
+    Evaluates scenarios of hypothetical trades from the tabulations of the
+    assets, keyed by asset, as calculated by the calculator.
+    """
+    def __init__(self, results, exchange_rates=None, base_currency='cad'):
+        self.base = {
+            asset: fork(tabulations) for asset, tabulations in results.items()
+        }
+        self.calculator = Calculator(None, exchange_rates, base_currency)
+
+    def __getstate__(self):
+        # Only the base and the calculator's settings go to worker processes
+        return {
+            'base': self.base,
+            'exchange_rates': self.calculator.exchange_rates,
+            'base_currency': self.calculator.base_currency,
+        }
+
+    def __setstate__(self, state):
+        self.base = state['base']
+        self.calculator = Calculator(
+            None,
+            state['exchange_rates'],
+            state['base_currency'],
+        )
+
+    def evaluate(self, trades):
+        """
+        Evaluate a scenario of hypothetical trades, getting the capital
+        gains of all of the assets after them.
+        """
+        forked = {}
+
+        try:
+            for trade in sorted(trades, key=lambda trade: trade['timestamp']):
+                for asset, asset_trade in split_trade(trade, self.base):
+                    if asset not in forked:
+                        forked[asset] = fork(self.base[asset])
+
+                    try:
+                        self.calculator.process_trade(
+                            asset_trade,
+                            forked[asset],
+                        )
+                    except InsufficientUnitsError as err:
+                        err.asset = asset
+                        raise
+        except (InsufficientUnitsError, MissingExchangeRateError) as err:
+            return ScenarioResult(None, None, err)
+
+        tabulations = dict(self.base)
+        tabulations.update(forked)
+
+        return ScenarioResult(
+            sum(
+                (totals['capital_gains'] for totals in tabulations.values()),
+                Decimal('0'),
+            ),
+            tabulations,
+            None,
+        )
+
+    def evaluate_batch(self, scenarios, jobs=1):
+        """
+        Evaluate scenarios of hypothetical trades, in order, in a pool of
+        processes when there is more than one job. All of the processes are
+        used when jobs is None.
+        """
+        scenarios = list(scenarios)
+        jobs = jobs if jobs is not None else os.cpu_count() or 1
+
+        if jobs <= 1 or len(scenarios) <= 1:
+            return evaluate_chunk(self, scenarios)
+
+        chunk_size = -(-len(scenarios) // jobs)
+        chunks = [
+            scenarios[start:start + chunk_size]
+            for start in range(0, len(scenarios), chunk_size)
+        ]
+        results = []
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            chunk_results = executor.map(
+                evaluate_chunk,
+                [self] * len(chunks),
+                chunks,
+            )
+
+            for chunk_result in chunk_results:
+                results.extend(chunk_result)
+
+        return results
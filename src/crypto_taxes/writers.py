@@ -0,0 +1,300 @@
+"""
+Writers for the calculation results.
+
+Events are written in batches as they are produced, rather than formatted
+and printed one at a time, so that writing millions of events to a file or
+a pipe keeps up with the calculation. The CSV writer produces the same
+output as the report printed by the command line script.
+
+PyArrow is an optional dependency, only needed for the Parquet writer.
+"""
+import csv
+from itertools import chain, islice
+import json
+from operator import attrgetter
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+EVENT_FIELDS = (
+    'action',
+    'major',
+    'minor',
+    'amount',
+    'rate',
+    'dt',
+    'acb',
+    'units_held',
+    'capital_gain',
+    'capital_gains',
+    'exchange_rate',
+)
+EVENT_HEADER = (
+    'Action',
+    'Major',
+    'Minor',
+    'Amount',
+    'Rate',
+    'Date',
+    'Adjusted Cost Base',
+    'Units Held',
+    'Capital Gain',
+    'Total Capital Gains',
+    'Exchange Rate',
+)
+TOTAL_FIELDS = (
+    ('acb', 'ACB', '{}'),
+    ('sum_acb_dispositions', 'Sum ACB Dispositions', '{}'),
+    ('units_held', 'Units Held', '{}'),
+    ('outlays', 'Outlays', '${}'),
+    ('proceeds', 'Proceeds', '${}'),
+    ('capital_gains', 'Capital gains', '${}'),
+)
+# Totals that are only in the tabulations of some calculations
+OPTIONAL_TOTAL_FIELDS = (
+    ('superficial_losses', 'Superficial losses denied', '${}'),
+)
+
+# Events are slotted records, so their fields are read as attributes
+get_event_fields = attrgetter(*EVENT_FIELDS)
+
+
+def iter_batches(events, batch_size):
+    """
+    Split a stream of events into lists of at most the batch size.
+    """
+    events = iter(events)
+
+    while True:
+        batch = list(islice(events, batch_size))
+
+        if not batch:
+            return
+
+        yield batch
+
+
+def event_values(event):
+    """
+    Get the fields of an event as JSON values, with amounts as strings so
+    that they are exact.
+    """
+    values = {}
+
+    for field, value in zip(EVENT_FIELDS, get_event_fields(event)):
+        if field == 'dt':
+            value = value.isoformat()
+        elif value is not None:
+            value = str(value)
+
+        values[field] = value
+
+    return values
+
+
+def total_fields(tabulations):
+    """
+    Get the fields, labels and templates of the totals of tabulations.
+    """
+    return TOTAL_FIELDS + tuple(
+        total for total in OPTIONAL_TOTAL_FIELDS if total[0] in tabulations
+    )
+
+
+def total_values(tabulations):
+    """
+    Get the totals of tabulations as JSON values, with amounts as strings.
+    """
+    return {
+        field: str(tabulations[field])
+        for field, _, _ in total_fields(tabulations)
+    }
+
+
+class ResultWriter():
+    """
+    Base for the writers of the results.
+
+    A result is written as its events, in batches, followed by its totals.
+    Several results can be written one after the other, for several assets.
+    """
+    def __init__(self, fileobj, batch_size=DEFAULT_BATCH_SIZE):
+        self.fileobj = fileobj
+        self.batch_size = batch_size
+        self.year = None
+
+    def begin_year(self, year):
+        """
+        Start writing the results of a tax year, when several years are
+        written one after the other.
+        """
+        self.year = year
+
+    def write_result(self, result, asset=None):
+        """
+        Write a result, with its events already calculated. Returns the
+        number of events written.
+        """
+        return self.write_stream(result['events'], result, asset)
+
+    def write_stream(self, events, tabulations, asset=None):
+        """
+        Write the events as they are produced, and then the totals of the
+        tabulations, which are only final once the events are exhausted.
+
+        Nothing is written until the first batch of events is produced, so
+        a calculation that fails within it leaves no partial result. Returns
+        the number of events written.
+        """
+        batches = iter_batches(events, self.batch_size)
+        first = list(islice(batches, 1))
+        written = 0
+        self.begin(asset)
+
+        for batch in chain(first, batches):
+            self.write_events(batch, asset)
+            written += len(batch)
+
+        self.end(tabulations, asset)
+
+        return written
+
+    def begin(self, asset):
+        """
+        Start writing the result of an asset.
+        """
+
+    def write_events(self, events, asset):
+        """
+        Write a batch of events.
+        """
+        raise NotImplementedError
+
+    def end(self, tabulations, asset):
+        """
+        Finish writing the result of an asset, with its totals.
+        """
+
+    def close(self):
+        """
+        Flush everything that was written.
+        """
+        self.fileobj.flush()
+
+
+class CSVWriter(ResultWriter):
+    """
+    Writes the results as the CSV report, with a header row for the events
+    and a line for each total.
+    """
+    def __init__(self, fileobj, batch_size=DEFAULT_BATCH_SIZE):
+        super(CSVWriter, self).__init__(fileobj, batch_size)
+        self.writer = csv.writer(fileobj, lineterminator='\n')
+
+    def begin_year(self, year):
+        super(CSVWriter, self).begin_year(year)
+        self.writer.writerow(('Tax Year', year))
+
+    def begin(self, asset):
+        if asset is not None:
+            self.writer.writerow(('Asset', asset))
+
+        self.writer.writerow(EVENT_HEADER)
+
+    def write_events(self, events, asset):
+        self.writer.writerows(map(get_event_fields, events))
+
+    def end(self, tabulations, asset):
+        self.fileobj.write('-------\n' + ''.join(
+            '{},{}\n'.format(label, template.format(tabulations[field]))
+            for field, label, template in total_fields(tabulations)
+        ))
+
+
+class JSONLinesWriter(ResultWriter):
+    """
+    Writes the results as JSON Lines, with an object for each event and
+    for the totals of each asset. Amounts are strings, so they are exact.
+    When several tax years are written, the objects have the year too.
+    """
+    def record(self, record, asset):
+        """
+        Get the values that identify a record.
+        """
+        values = {'record': record, 'asset': asset}
+
+        if self.year is not None:
+            values['year'] = self.year
+
+        return values
+
+    def write_events(self, events, asset):
+        lines = []
+
+        for event in events:
+            values = self.record('event', asset)
+            values.update(event_values(event))
+            lines.append(json.dumps(values))
+
+        self.fileobj.write('\n'.join(lines) + '\n')
+
+    def end(self, tabulations, asset):
+        values = self.record('totals', asset)
+        values.update(total_values(tabulations))
+        self.fileobj.write(json.dumps(values) + '\n')
+
+
+class ParquetWriter(ResultWriter):
+    """
+    Writes the events of the results to a Parquet file, one row group per
+    batch. Amounts are strings, so they are exact. The totals are not
+    written, since the file only holds the events.
+    """
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        if pyarrow is None:
+            raise ImportError('The Parquet writer requires PyArrow')
+
+        self.schema = pyarrow.schema(
+            [('asset', pyarrow.string())] + [
+                (field, pyarrow.timestamp('us'))
+                if field == 'dt' else (field, pyarrow.string())
+                for field in EVENT_FIELDS
+            ]
+        )
+        writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        super(ParquetWriter, self).__init__(writer, batch_size)
+
+    def write_events(self, events, asset):
+        columns = list(zip(*map(get_event_fields, events)))
+        arrays = [pyarrow.array([asset] * len(events), pyarrow.string())]
+
+        for field, column in zip(EVENT_FIELDS, columns):
+            if field == 'dt':
+                arrays.append(pyarrow.array(column, pyarrow.timestamp('us')))
+            else:
+                arrays.append(pyarrow.array(
+                    [None if value is None else str(value)
+                     for value in column],
+                    pyarrow.string(),
+                ))
+
+        self.fileobj.write_table(
+            pyarrow.Table.from_arrays(arrays, schema=self.schema)
+        )
+
+    def close(self):
+        self.fileobj.close()
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'jsonl': JSONLinesWriter,
+    'parquet': ParquetWriter,
+}
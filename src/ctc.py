@@ -2,21 +2,52 @@
 """
 Crypto tax calculator.
 """
-import argparse
+import asyncio
 from collections import namedtuple
-import csv
-from decimal import Decimal
-from sys import stderr
-
-from crypto_taxes.calculator import Calculator, CSVReader
+import cProfile
+from contextlib import ExitStack, contextmanager
+from datetime import date, datetime, time, timedelta
+from sys import stderr, stdout
+
+from crypto_taxes.acb_index import ACBIndex
+from crypto_taxes.arguments import FILE_FORMATS, parse_args, parse_assets
+from crypto_taxes.cache import TradeCache
+from crypto_taxes.calculator import Calculator, CSVReader, split_trade
+from crypto_taxes.checkpoints import (
+    CheckpointStore,
+    HistoryFingerprint,
+    fingerprint_inputs,
+)
+from crypto_taxes.database import (
+    DatabaseWriter,
+    append_trade_files,
+    load_trade_files,
+)
+from crypto_taxes.dedupe import (
+    DuplicateFilter,
+    merge_unique_trades,
+    unique_files,
+)
 from crypto_taxes.exceptions import (
     InsufficientUnitsError,
     UnrecognizedFormatError
 )
-
-
-DEFAULT_BASE_CURRENCY = 'cad'
-DEFAULT_ASSET = 'btc'
+from crypto_taxes.exchange_rates import (
+    FILL_NONE,
+    ExchangeRateTable,
+)
+from crypto_taxes.incremental import IncrementalState
+from crypto_taxes.parallel import parse_files
+from crypto_taxes.profiling import Profiler
+from crypto_taxes.service import CalculationService
+from crypto_taxes.writers import (
+    DEFAULT_BUFFER_SIZE,
+    WRITERS,
+    ParquetWriter,
+)
+from crypto_taxes.sorting import merge_trades, sort_trades
+from crypto_taxes.superficial import DEFAULT_DAYS as SUPERFICIAL_LOSS_DAYS
+from crypto_taxes.vectorized import VectorizedCalculator
 
 
 def main():
@@ -24,9 +55,491 @@ def main():
     Main entry point from CLI.
     """
     args = parse_args()
+    profiler = Profiler(
+        enabled=bool(args.profile or args.profile_stats or args.profile_trace)
+    )
+    stats = cProfile.Profile() if args.profile_stats else None
+
+    if stats is not None:
+        stats.enable()
+
+    try:
+        with open_writer(args) as writer:
+            run(args, profiler, writer)
+    finally:
+        if stats is not None:
+            stats.disable()
+            stats.dump_stats(args.profile_stats)
+
+        if args.profile:
+            profiler.report(stderr, per_trade_counter='trades processed')
+
+        if args.profile_trace:
+            profiler.write_chrome_trace(args.profile_trace)
+
+
+def run(args, profiler, writer):
+    """
+    Run the calculations for the command line arguments, with the stages
+    instrumented by the profiler, writing the results with the writer.
+    """
+    assets = parse_assets(args)
+    single_asset = assets[0] if assets and len(assets) == 1 else None
+    check_options(args, single_asset)
+
+    if args.dedupe:
+        skip_repeated_files(args)
+
+    duplicates = duplicate_filter(args)
+    csv_reader = CSVReader(
+        TradeCache(args.cache_dir, args.cache_size) if args.cache else None,
+        profiler,
+    )
+
+    with profiler.stage('exchange rates'):
+        exchange_rates = read_exchange_rates(
+            args.exchange_rates,
+            args.exchange_rate_fill,
+        )
+
+    if args.serve:
+        serve(args, exchange_rates, csv_reader, duplicates)
+        return
+
+    index_queried = args.as_of or args.gains_between
+
+    if index_queried and args.acb_index and print_saved_index(args):
+        return
+
+    if args.state:
+        with profiler.stage('incremental'):
+            if run_incremental(
+                    args,
+                    single_asset,
+                    exchange_rates,
+                    csv_reader,
+                    writer,
+            ):
+                return
+
+    if args.format == 'sqlite':
+        with profiler.stage('load'), handle_unrecognized_format():
+            profiler.add_rows('load', load_trade_files(
+                writer.database,
+                args.trades,
+                csv_reader,
+                duplicates,
+            ))
+
+    summary = validate_trade_files(
+        args,
+        single_asset,
+        csv_reader,
+        exchange_rates,
+        profiler,
+        duplicates,
+    )
+
+    if duplicates is not None:
+        print_duplicates(duplicates)
+
+    if assets is None:
+        assets = sorted(summary['assets'])
+
+    # The trades are streamed a second time for the calculations, rather than
+    # being kept in memory from the validation.
+    calculator = Calculator(
+        profiler.iterate(
+            'sort',
+            iter_trade_files(
+                args.trades,
+                single_asset,
+                csv_reader,
+                duplicates,
+            ),
+        ),
+        exchange_rates,
+        args.base_currency,
+        args.superficial_losses,
+        profiler,
+    )
+
+    if index_queried:
+        query_acb_index(args, assets, single_asset, calculator)
+    elif args.tax_years:
+        write_years(args, assets, single_asset, calculator, writer, profiler)
+    elif args.engine == 'numpy':
+        write_vectorized(
+            args,
+            single_asset,
+            exchange_rates,
+            csv_reader,
+            duplicates,
+            writer,
+            profiler,
+        )
+    else:
+        results = write_tax_year(
+            args,
+            assets,
+            single_asset,
+            calculator,
+            writer,
+            profiler,
+        )
+
+        if args.state:
+            IncrementalState(args.state).save(
+                state_files(args),
+                state_options(args, assets),
+                results,
+                summary['timestamp'],
+            )
+
+
+def check_options(args, single_asset):
+    """
+    Exit with an error message when options that cannot be used together
+    were given.
+    """
+    if single_asset is None:
+        if args.initial_acb or args.initial_units_held:
+            print(
+                'The --initial-acb and --initial-units-held options can only '
+                'be used with a single asset.',
+                file=stderr
+            )
+            raise SystemExit
+
+    if args.engine == 'numpy' and single_asset is None:
+        print(
+            'The numpy engine can only be used with a single asset.',
+            file=stderr
+        )
+        raise SystemExit
+
+    if args.state and args.engine == 'numpy':
+        print(
+            'The --state option cannot be used with the numpy engine.',
+            file=stderr
+        )
+        raise SystemExit
+
+    if args.superficial_losses and (args.state or args.engine == 'numpy'):
+        print(
+            'The --superficial-losses option cannot be used with --state or '
+            'the numpy engine.',
+            file=stderr
+        )
+        raise SystemExit
+
+    if args.dedupe and args.state:
+        print(
+            'The --dedupe option cannot be used with --state.',
+            file=stderr
+        )
+        raise SystemExit
+
+    if args.tax_years and (
+            args.tax_year is not None or args.checkpoints or args.state
+            or args.engine == 'numpy'
+    ):
+        print(
+            'The --tax-years option cannot be used with --tax-year, '
+            '--checkpoints, --state or the numpy engine.',
+            file=stderr
+        )
+        raise SystemExit
+
+
+def skip_repeated_files(args):
+    """
+    Remove the trade files that were given more than once, under the same
+    or another path, from the arguments.
+    """
+    args.trades, repeated = unique_files(args.trades)
+
+    for filename, first in repeated:
+        print(
+            'Skipped {}, the same file as {}'.format(filename, first),
+            file=stderr
+        )
+
+
+def validate_trade_files(
+        args,
+        single_asset,
+        csv_reader,
+        exchange_rates,
+        profiler,
+        duplicates=None,
+):
+    """
+    Stream the trades of the files, dropping the trades that are in several
+    files with the duplicate filter, and exiting when exchange rates are
+    missing. Returns a summary of the assets, the timestamp of the last
+    trade and the number of trades.
+    """
+    summary = {'assets': set(), 'timestamp': None, 'trades': 0}
+
+    with handle_unrecognized_format():
+        if args.jobs > 1:
+            with profiler.stage('parse'):
+                parse_files(csv_reader, args.trades, args.jobs)
+
+        trades = profiler.iterate(
+            'sort',
+            iter_trade_files(
+                args.trades,
+                single_asset,
+                csv_reader,
+                duplicates,
+            ),
+        )
+
+        with profiler.stage('validate'):
+            validate_exchange_rates(
+                summarize_trades(trades, summary),
+                exchange_rates,
+                args.base_currency,
+                profiler,
+            )
+
+        profiler.add_rows('validate', summary['trades'])
+
+    return summary
+
+
+def print_saved_index(args):
+    """
+    Print the holdings and gains that were asked for from the saved ACB
+    index, when it matches the inputs. Returns whether it did.
+    """
+    index = ACBIndex.load(args.acb_index, index_fingerprint(args))
+
+    if index is None:
+        return False
+
+    print_index_queries(args, index)
+
+    return True
+
+
+def query_acb_index(args, assets, single_asset, calculator):
+    """
+    Build the ACB index of the whole history, saving it when it has a path,
+    and print the holdings and gains that were asked for.
+    """
+    initial_holdings = {
+        single_asset: (args.initial_acb, args.initial_units_held),
+    }
+
+    with handle_insufficient_units():
+        index = calculator.build_acb_index(assets, initial_holdings)
+
+    if args.acb_index:
+        index.fingerprint = index_fingerprint(args)
+        index.save(args.acb_index)
+
+    print_index_queries(args, index)
+
+
+def write_vectorized(
+        args,
+        single_asset,
+        exchange_rates,
+        csv_reader,
+        duplicates,
+        writer,
+        profiler,
+):
+    """
+    Calculate the tax year of a single asset with the vectorized NumPy
+    engine, and write its events and totals.
+    """
+    with handle_insufficient_units():
+        with profiler.stage('calculate'):
+            result = calculate_vectorized(
+                args,
+                single_asset,
+                exchange_rates,
+                csv_reader,
+                duplicates,
+            )
+
+    with profiler.stage('output'):
+        profiler.add_rows('output', writer.write_result(result))
+
+
+def write_tax_year(args, assets, single_asset, calculator, writer, profiler):
+    """
+    Calculate the tax year of the assets, starting from the checkpoints of
+    the year before when they are kept, and write the events and totals.
+    Returns the tabulations of each asset.
+    """
+    tax_year = args.tax_year if args.tax_year is not None \
+        else date.today().year
+    initial_holdings = {
+        single_asset: (args.initial_acb, args.initial_units_held),
+    }
+    on_year_end = None
+
+    if args.checkpoints:
+        initial_holdings, on_year_end = load_checkpoints(
+            args,
+            assets,
+            tax_year,
+            initial_holdings,
+        )
+
+    results = calculator.create_asset_tabulations(assets, initial_holdings)
+    events = profiler.iterate(
+        'calculate',
+        calculator.iter_asset_events(results, tax_year, on_year_end),
+    )
+
+    with handle_insufficient_units():
+        if single_asset is not None:
+            with profiler.stage('output'):
+                profiler.add_rows('output', writer.write_stream(
+                    (event for _, event in events),
+                    results[single_asset],
+                ))
+        else:
+            for asset, event in events:
+                results[asset]['events'].append(event)
+
+    if single_asset is None:
+        with profiler.stage('output'):
+            profiler.add_rows(
+                'output',
+                write_asset_results(assets, results, writer),
+            )
+
+    return results
+
+
+def run_incremental(args, single_asset, exchange_rates, csv_reader, writer):
+    """
+    Process only the trades added to the files since the saved state,
+    continuing from the saved tabulations, and print the new events and the
+    updated totals.
+
+    Returns False when the state cannot be continued from, and all of the
+    trades need to be processed again.
+    """
+    state = IncrementalState(args.state)
+    options = state_options(args, parse_assets(args))
+    ranges = state.find_added_ranges(state_files(args), options)
+
+    if ranges is None:
+        return False
+
+    with handle_unrecognized_format():
+        trades = merge_trades([
+            sort_trades(read_added_trades(
+                csv_reader,
+                filename,
+                ranges[filename],
+                single_asset,
+            ))
+            for filename in args.trades
+        ])
+        trades = list(trades)
+
+    results = state.results()
+    timestamp = state.timestamp()
+
+    for trade in trades:
+        if timestamp is not None and trade['timestamp'] < timestamp:
+            # A trade was added before the ones already processed
+            return False
+
+        if single_asset is None and trade['major'] not in results:
+            return False
+
+    validate_exchange_rates(trades, exchange_rates, args.base_currency)
+
+    if args.format == 'sqlite':
+        # Only the events of the added trades are written, after the ones
+        # of the earlier runs
+        writer.append = True
+        append_trade_files(
+            writer.database,
+            {filename: ranges[filename] for filename in args.trades},
+            csv_reader,
+        )
+
+    calculator = Calculator(iter(trades), exchange_rates, args.base_currency)
+    events = calculator.iter_asset_events(results, args.tax_year)
+
+    with handle_insufficient_units():
+        if single_asset is not None:
+            writer.write_stream(
+                (event for _, event in events),
+                results[single_asset],
+            )
+        else:
+            for asset, event in events:
+                results[asset]['events'].append(event)
+
+            write_asset_results(sorted(results), results, writer)
+
+    if trades:
+        timestamp = trades[-1]['timestamp']
+
+    state.save(state_files(args), options, results, timestamp)
+
+    return True
+
+
+def read_added_trades(csv_reader, filename, added_range, asset):
+    """
+    Read the trades added to a file, or all of them for a new file.
+    """
+    if added_range is None:
+        return csv_reader.read_trades(filename, asset)
+
+    start, stop = added_range
+
+    return list(csv_reader.iter_trades_range(filename, start, stop, asset))
+
+
+def state_files(args):
+    """
+    Get the input files tracked in the incremental state.
+    """
+    if args.exchange_rates:
+        return args.trades + [args.exchange_rates]
+
+    return list(args.trades)
 
+
+def state_options(args, assets):
+    """
+    Get the options that the incremental state was calculated with, which
+    must stay the same to continue from it.
+    """
+    return [
+        str(option) for option in (
+            args.tax_year if args.tax_year is not None
+            else date.today().year,
+            args.base_currency,
+            args.exchange_rate_fill,
+            ','.join(assets) if assets is not None else 'all',
+            args.initial_acb,
+            args.initial_units_held,
+        )
+    ]
+
+
+@contextmanager
+def handle_unrecognized_format():
+    """
+    Exit with an error message when a CSV format is not recognized.
+    """
     try:
-        trades = read_trade_files(args.trades, args.asset)
+        yield
     except UnrecognizedFormatError as err:
         print(
             'The CSV format could not be recognized: {}'.format(
@@ -36,157 +549,426 @@ def main():
         )
         raise SystemExit
 
-    exchange_rates = read_exchange_rates(args.exchange_rates)
 
-    trades.sort(key=lambda trade: trade['timestamp'])
+@contextmanager
+def handle_insufficient_units():
+    """
+    Exit with an error message when more units are sold than are held.
+    """
+    try:
+        yield
+    except InsufficientUnitsError as err:
+        print(
+            '{}\n\n'
+            'Consider using the --initial-acb and --initial-units-held '
+            'options if you have trades from prior years.'.format(
+                str(err),
+            ),
+            file=stderr
+        )
+        raise SystemExit
+
 
+def validate_exchange_rates(
+        trades,
+        exchange_rates,
+        base_currency,
+        profiler=None
+):
+    """
+    Exit with the list of missing exchange rates, if there are any.
+    """
     missing_exchange_rates = find_missing_exchange_rates(
         trades,
         exchange_rates,
-        args.base_currency
+        base_currency,
+        profiler,
     )
 
     if missing_exchange_rates:
         print_missing_exchange_rates(missing_exchange_rates)
         raise SystemExit
 
-    calculator = Calculator(
+
+def serve(args, exchange_rates, csv_reader, duplicates=None):
+    """
+    Run the calculation service, starting with the trades from the files
+    without the ones the duplicate filter drops, until interrupted.
+    """
+    host, _, port = args.serve.rpartition(':')
+
+    with handle_unrecognized_format():
+        trades = list(iter_trade_files(
+            args.trades,
+            None,
+            csv_reader,
+            duplicates,
+        ))
+
+    if duplicates is not None:
+        print_duplicates(duplicates)
+
+    service = CalculationService(
         trades,
         exchange_rates,
         args.base_currency,
+        args.workers,
+    )
+    print(
+        'Serving on {}:{} with {} trades'.format(
+            host or '127.0.0.1',
+            port,
+            len(trades),
+        ),
+        file=stderr
     )
 
     try:
-        result = calculator.calculate(
-            tax_year=args.tax_year,
-            initial_acb=args.initial_acb,
-            initial_units_held=args.initial_units_held,
+        asyncio.run(service.serve(host or '127.0.0.1', int(port)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+def index_fingerprint(args):
+    """
+    Get the fingerprint of the inputs and options an ACB index is built
+    from.
+    """
+    input_files = list(args.trades)
+
+    if args.exchange_rates:
+        input_files.append(args.exchange_rates)
+
+    return fingerprint_inputs(
+        input_files,
+        args.base_currency,
+        args.exchange_rate_fill,
+        args.asset,
+        args.assets,
+        args.initial_acb,
+        args.initial_units_held,
+        args.superficial_losses,
+        args.dedupe,
+    )
+
+
+def print_index_queries(args, index):
+    """
+    Print the holdings as of the end of each of the --as-of dates, and the
+    capital gains between the --gains-between dates, for each asset.
+    """
+    if args.as_of:
+        print('Asset,Date,ACB,Units Held,Capital Gains')
+
+        for asset in index.assets():
+            for day in parse_dates(args.as_of):
+                holdings = index.as_of(asset, end_of_day(day))
+                print('{},{},{},{},{}'.format(
+                    asset,
+                    day,
+                    holdings['acb'],
+                    holdings['units_held'],
+                    holdings['capital_gains'],
+                ))
+
+    if args.gains_between:
+        start, stop = parse_dates(args.gains_between)
+        print('Asset,Start,End,Capital Gains')
+
+        for asset in index.assets():
+            print('{},{},{},{}'.format(
+                asset,
+                start,
+                stop,
+                index.gains_between(
+                    asset,
+                    end_of_day(start - timedelta(days=1)),
+                    end_of_day(stop),
+                ),
+            ))
+
+
+def parse_dates(value):
+    """
+    Parse comma separated yyyy-mm-dd dates.
+    """
+    return [
+        datetime.strptime(part.strip(), '%Y-%m-%d').date()
+        for part in value.split(',')
+    ]
+
+
+def end_of_day(day):
+    """
+    Get the last moment of a day.
+    """
+    return datetime.combine(day, time.max)
+
+
+def write_asset_results(assets, results, writer):
+    """
+    Write the results of several assets, one after the other. Returns the
+    number of events written.
+    """
+    return sum(
+        writer.write_result(results[asset], asset) for asset in assets
+    )
+
+
+def write_years(args, assets, single_asset, calculator, writer, profiler):
+    """
+    Calculate a range of tax years in a single pass over the history, and
+    write the events and totals of each year.
+    """
+    first_year, last_year = args.tax_years
+    initial_holdings = {
+        single_asset: (args.initial_acb, args.initial_units_held),
+    }
+
+    with handle_insufficient_units(), profiler.stage('calculate'):
+        years = calculator.calculate_years(
+            assets,
+            first_year,
+            last_year,
+            initial_holdings,
         )
 
-    except InsufficientUnitsError as err:
+    with profiler.stage('output'):
+        for year, results in years.items():
+            writer.begin_year(year)
+
+            if single_asset is not None:
+                written = writer.write_result(results[single_asset])
+            else:
+                written = write_asset_results(assets, results, writer)
+
+            profiler.add_rows('output', written)
+
+
+@contextmanager
+def open_writer(args):
+    """
+    Open the writer of the results, in the output format, to the output
+    file or to stdout.
+    """
+    if args.format in FILE_FORMATS and not args.output:
         print(
-            '{}\n\n'
-            'Consider using the --initial-acb and --initial-units-held '
-            'options if you have trades from prior years.'.format(
-                str(err),
+            'The {} format can only be written with --output.'.format(
+                args.format,
             ),
-
             file=stderr
         )
         raise SystemExit
 
-    print_result(result)
-
-
-def parse_args():
+    with ExitStack() as stack:
+        if args.format == 'parquet':
+            writer = ParquetWriter(args.output)
+        elif args.format == 'sqlite':
+            # The results of a single asset are written without the asset
+            assets = parse_assets(args)
+            writer = DatabaseWriter(
+                args.output,
+                args.tax_year if args.tax_year is not None
+                else date.today().year,
+                assets[0] if assets and len(assets) == 1 else None,
+            )
+        else:
+            output_file = stdout
+
+            if args.output:
+                output_file = stack.enter_context(open(
+                    args.output,
+                    'wt',
+                    buffering=DEFAULT_BUFFER_SIZE,
+                    newline='',
+                ))
+
+            writer = WRITERS[args.format](output_file)
+
+        try:
+            yield writer
+        finally:
+            writer.close()
+
+
+def load_checkpoints(args, assets, tax_year, initial_holdings):
     """
-    Parse the command line arguments.
+    Get the holdings to start the tax year from, using the checkpoints of
+    the previous year when they match the inputs. Otherwise the history
+    will be replayed, so also get a callback that records the checkpoints
+    at the end of each year of the replay.
     """
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        '--base-currency',
-        default=DEFAULT_BASE_CURRENCY,
-        help="The base currency for calculations",
-        type=str,
-    )
-    parser.add_argument(
-        '--exchange-rates',
-        default=None,
-        help="Path to CSV file containing historical exchange rates",
-        type=str,
+    store = CheckpointStore(args.checkpoints)
+
+    # Superficial losses at the end of a year depend on the trades of the
+    # days after it
+    history = HistoryFingerprint(
+        args.trades,
+        args.exchange_rates,
+        args.exchange_rate_fill,
+        (
+            args.base_currency,
+            args.exchange_rate_fill,
+            args.initial_acb,
+            args.initial_units_held,
+            args.superficial_losses,
+            args.dedupe,
+        ),
+        SUPERFICIAL_LOSS_DAYS + 1 if args.superficial_losses else 0,
+        store.file_days,
     )
-    parser.add_argument(
-        '--initial-acb',
-        default=Decimal('0'),
-        help='The initial acb if prior trade history is not available',
-        type=Decimal,
+    holdings = store.load_holdings(
+        assets,
+        tax_year - 1,
+        history.year_end(tax_year - 1),
     )
-    parser.add_argument(
-        '--initial-units-held',
-        default=Decimal('0'),
-        help='The initial units held if prior trade history is not available',
-        type=Decimal,
-    )
-    parser.add_argument(
-        '--asset',
-        default=DEFAULT_ASSET,
-        help='The symbol of the crypto asset that was traded',
-        type=str,
-    )
-    parser.add_argument(
-        '--tax-year',
-        default=None,
-        help='The tax year to perform calculations for',
-        type=int,
+
+    if holdings is not None:
+        if history.changed:
+            store.write()
+
+        return holdings, None
+
+    def on_year_end(year, results, timestamps):
+        store.save_year(year, results, timestamps, history.year_end(year))
+
+    return initial_holdings, on_year_end
+
+
+def calculate_vectorized(
+        args,
+        asset,
+        exchange_rates,
+        csv_reader,
+        duplicates=None,
+):
+    """
+    Calculate a single asset with the vectorized NumPy engine, dropping the
+    trades that are in several files with the duplicate filter.
+    """
+    trades = [
+        asset_trade
+        for trade in iter_trade_files(
+            args.trades,
+            asset,
+            csv_reader,
+            duplicates,
+        )
+        for _, asset_trade in split_trade(trade, [asset])
+    ]
+    calculator = VectorizedCalculator(
+        iter(trades),
+        exchange_rates,
+        args.base_currency,
     )
-    parser.add_argument(
-        'trades',
-        help='Path to CSV file(s) containing trade history',
-        type=str,
-        nargs='+',
+
+    return calculator.calculate(
+        tax_year=args.tax_year,
+        initial_acb=args.initial_acb,
+        initial_units_held=args.initial_units_held,
     )
-    return parser.parse_args()
 
 
-def read_trade_files(filenames, asset):
+def iter_trade_files(filenames, asset, csv_reader=None, duplicates=None):
     """
-    Read the trade CSV files.
+    Stream the trades from the CSV files in chronological order, merging
+    the files together, and dropping the trades that were already in
+    another file when there is a duplicate filter.
     """
-    trades = []
+    csv_reader = csv_reader if csv_reader else CSVReader()
+    streams = [
+        csv_reader.iter_sorted_trades(filename, asset)
+        for filename in filenames
+    ]
 
-    for filename in filenames:
-        trades += read_trade_file(filename, asset)
+    if duplicates is not None:
+        return merge_unique_trades(streams, filenames, duplicates)
 
-    return trades
+    return merge_trades(streams)
 
 
-def read_trade_file(filename, target_asset):
+def duplicate_filter(args):
     """
-    Read the trades from a single CSV file.
+    Get a filter of the trades that are in several files, when they are
+    removed.
     """
-    csv_reader = CSVReader()
-    return csv_reader.read_trades(filename, target_asset)
+    return DuplicateFilter() if args.dedupe else None
 
 
-def read_exchange_rates(filename):
+def summarize_trades(trades, summary):
     """
-    Read exchange rates from CSV.
+    Pass the trades through, adding the major of each one to the assets of
+    the summary, and keeping the timestamp of the last one and the count.
     """
-    exchange_rates = {}
+    for trade in trades:
+        summary['assets'].add(trade['major'])
+        summary['timestamp'] = trade['timestamp']
+        summary['trades'] += 1
+        yield trade
 
-    if filename:
-        with open(filename, 'rt') as csvfile:
-            reader = csv.DictReader(csvfile)
 
-            for row in reader:
-                if not row['date'] in exchange_rates:
-                    exchange_rates[row['date']] = {}
-                    exchange_rates[row['date']][row['currency']] = \
-                        Decimal(row['rate'])
+def read_exchange_rates(filename, fill=FILL_NONE):
+    """
+    Read exchange rates from CSV.
+    """
+    if filename:
+        return ExchangeRateTable.from_csv(filename, fill)
 
-    return exchange_rates
+    return ExchangeRateTable(fill)
 
 
-def find_missing_exchange_rates(trades, exchange_rates, base_currency):
+def find_missing_exchange_rates(
+        trades,
+        exchange_rates,
+        base_currency,
+        profiler=None
+):
     """
-    Validate exchange rates are present for all trade dates.
+    Validate exchange rates are present for all trade dates, counting the
+    rate lookups with the profiler.
     """
     DateCurrencyPair = namedtuple('DateCurrencyPair', ['date', 'currency'])
+    profiler = profiler if profiler is not None else Profiler(enabled=False)
     missing = set()
 
     for trade in trades:
         if trade['minor'] == base_currency:
             continue
 
-        date_string = trade['dt'].strftime('%Y/%m/%d')
+        trade_date = trade['dt']
+        profiler.count('rate lookups')
 
-        if date_string not in exchange_rates or \
-                trade['minor'] not in exchange_rates[date_string]:
-            missing.add(DateCurrencyPair(date_string, trade['minor']))
+        if exchange_rates.get_rate(trade['minor'], trade_date) is None:
+            missing.add(DateCurrencyPair(
+                trade_date.strftime('%Y/%m/%d'),
+                trade['minor'],
+            ))
 
     return missing
 
 
+def print_duplicates(duplicates):
+    """
+    Print the number of duplicate trades that were removed from each file,
+    when any were.
+    """
+    if not duplicates.total_removed():
+        return
+
+    print(
+        'Removed {} duplicate trades'.format(duplicates.total_removed()),
+        file=stderr
+    )
+
+    for (filename, first), count in sorted(duplicates.removed.items()):
+        print(
+            '{} from {}, also in {}'.format(count, filename, first),
+            file=stderr
+        )
+
+
 def print_missing_exchange_rates(missing_exchange_rates):
     """
     Print the dates for which exchange rates are missing.
@@ -203,40 +985,5 @@ def print_missing_exchange_rates(missing_exchange_rates):
         )
 
 
-def print_result(result):
-    """
-    Print the calculation results.
-    """
-    print(
-        'Action,Major,Minor,Amount,Rate,Date,Adjusted Cost Base,Units Held,'
-        'Capital Gain,Total Capital Gains,Exchange Rate'
-    )
-
-    for event in result['events']:
-        print('{},{},{},{},{},{},{},{},{},{},{}'.format(
-            event['action'],
-            event['major'],
-            event['minor'],
-            event['amount'],
-            event['rate'],
-            event['dt'],
-            event['acb'],
-            event['units_held'],
-            event['capital_gain'],
-            event['capital_gains'],
-            event['exchange_rate'],
-        ))
-
-    print('-------')
-    print('ACB,{}'.format(result['acb']))
-    print('Sum ACB Dispositions,{}'.format(
-        result['sum_acb_dispositions']
-    ))
-    print('Units Held,{}'.format(result['units_held']))
-    print('Outlays,${}'.format(result['outlays']))
-    print('Proceeds,${}'.format(result['proceeds']))
-    print('Capital gains,${}'.format(result['capital_gains']))
-
-
 if __name__ == "__main__":
     main()
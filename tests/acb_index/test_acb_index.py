@@ -0,0 +1,89 @@
+"""
+Tests for the point in time index of the holdings of each asset.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from crypto_taxes.acb_index import ACBIndex
+from crypto_taxes.calculator import Calculator
+from crypto_taxes.records import Trade
+
+
+def create_trade(trade_type, amount, rate, when):
+    """
+    Create a btc trade in cad, without fees.
+    """
+    value = amount * rate
+
+    return Trade(
+        trade_type,
+        'btc',
+        'cad',
+        amount,
+        rate,
+        value,
+        amount if trade_type == 'buy' else value,
+        when.timestamp(),
+    )
+
+
+def build_index():
+    """
+    Build the index of a buy in 2017, and sells in 2018 and 2019.
+    """
+    trades = [
+        create_trade('buy', Decimal(4), Decimal(10), datetime(2017, 6, 1)),
+        create_trade('sell', Decimal(1), Decimal(30), datetime(2018, 6, 1)),
+        create_trade('sell', Decimal(1), Decimal(50), datetime(2019, 6, 1)),
+    ]
+
+    return Calculator(iter(trades)).build_acb_index(['btc'])
+
+
+def test_as_of():
+    """
+    The holdings are those after the last trade at or before the time.
+    """
+    index = build_index()
+
+    assert index.as_of('btc', datetime(2017, 1, 1)) == {
+        'acb': 0,
+        'units_held': 0,
+        'capital_gains': 0,
+    }
+    assert index.as_of('btc', datetime(2017, 6, 1))['units_held'] == 4
+    assert index.as_of('btc', datetime(2018, 12, 31)) == {
+        'acb': 30,
+        'units_held': 3,
+        'capital_gains': 20,
+    }
+
+
+def test_gains_between():
+    """
+    Capital gains accumulate across tax years.
+    """
+    index = build_index()
+
+    assert index.as_of('btc', datetime(2020, 1, 1))['capital_gains'] == 60
+    assert index.gains_between(
+        'btc',
+        datetime(2018, 12, 31),
+        datetime(2019, 12, 31),
+    ) == 40
+
+
+def test_save_and_load(tmpdir):
+    """
+    A saved index is only loaded for the same inputs.
+    """
+    path = str(tmpdir.join('index.json'))
+    index = build_index()
+    index.fingerprint = 'inputs'
+    index.save(path)
+
+    loaded = ACBIndex.load(path, 'inputs')
+
+    assert ACBIndex.load(path, 'other') is None
+    assert loaded.as_of('btc', datetime(2019, 12, 31)) == \
+        index.as_of('btc', datetime(2019, 12, 31))
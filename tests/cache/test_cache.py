@@ -0,0 +1,92 @@
+"""
+Tests for the cache of parsed trade files.
+"""
+import os
+
+from crypto_taxes.cache import TradeCache
+from crypto_taxes.calculator import CSVReader
+
+
+HEADER = 'type,major,minor,amount,rate,value,fee,total,timestamp,datetime\n'
+ROWS = [
+    'buy,btc,cad,1.50,100,150.00,0,1.50,1500000000,2017-07-14 02:40:00\n',
+    'buy,eth,cad,2,10,20,0,2,1500000100,2017-07-14 02:41:40\n',
+    'sell,btc,cad,0.5,200.0000000000000000000001,100,0,100,1500000200,'
+    '2017-07-14 02:43:20\n',
+]
+
+
+def write_trades(tmpdir, rows):
+    """
+    Write a Bitso trade file.
+    """
+    path = tmpdir.join('trades.csv')
+    path.write(HEADER + ''.join(rows))
+
+    return str(path)
+
+
+def test_cached_trades_match_parsed(tmpdir):
+    """
+    Trades read back from the cache are the same as the parsed trades.
+    """
+    filename = write_trades(tmpdir, ROWS)
+    cache = TradeCache(str(tmpdir.join('cache')))
+    parsed = CSVReader().read_trades(filename, 'btc')
+
+    CSVReader(cache).read_trades(filename, 'btc')
+    cached = CSVReader(cache).read_trades(filename, 'btc')
+
+    assert len(cache.index) == 1
+    assert [dict(trade) for trade in cached] == \
+        [dict(trade) for trade in parsed]
+    assert str(cached[0]['amount']) == '1.50'
+    assert str(cached[1]['rate']) == '200.0000000000000000000001'
+
+
+def test_changed_file_is_parsed_again(tmpdir):
+    """
+    A file that changed is not served from its old cache entry.
+    """
+    filename = write_trades(tmpdir, ROWS[:1])
+    cache = TradeCache(str(tmpdir.join('cache')))
+    CSVReader(cache).read_trades(filename)
+
+    write_trades(tmpdir, ROWS)
+
+    assert cache.load(filename) is None
+    assert len(CSVReader(cache).read_trades(filename)) == 3
+
+
+def test_least_recently_used_entries_are_evicted(tmpdir):
+    """
+    The oldest entries are removed once the cache is too large.
+    """
+    cache = TradeCache(str(tmpdir.join('cache')), max_size=0)
+    filename = write_trades(tmpdir, ROWS)
+
+    CSVReader(cache).read_trades(filename)
+
+    assert cache.index == {}
+    assert os.listdir(cache.directory) == ['index.json']
+
+
+def test_asset_trades_are_cached_on_their_own(tmpdir):
+    """
+    Reading the trades of one asset caches only the rows of that asset, in
+    the order of the file, even when the file is read backwards.
+    """
+    filename = write_trades(tmpdir, ROWS[::-1])
+    cache = TradeCache(str(tmpdir.join('cache')))
+
+    list(CSVReader(cache).iter_sorted_trades(filename, 'btc'))
+
+    assert cache.load(filename) is None
+    assert [trade['timestamp'] for trade in cache.load(filename, 'btc')] == \
+        [1500000200, 1500000000]
+    assert cache.load(filename, 'eth') is None
+
+    cached = list(CSVReader(cache).iter_sorted_trades(filename, 'btc'))
+
+    assert [trade['timestamp'] for trade in cached] == \
+        [1500000000, 1500000200]
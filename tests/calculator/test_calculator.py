@@ -1,6 +1,7 @@
+from datetime import datetime
 from decimal import Decimal
 
-from crypto_taxes.calculator import Calculator
+from crypto_taxes.calculator import Calculator, mirror_trade
 
 
 def test_process_buy_first():
@@ -82,3 +83,200 @@ def test_process_sell_partial():
     assert capital_gain == Decimal('3485')
     assert Decimal('50') == tabulations['units_held']
     assert Decimal('2505') == tabulations['acb']
+
+
+def test_mirror_trade_buy_is_disposition_of_minor():
+    """
+    Buying the major with a crypto minor is a sell of the minor.
+    """
+    trade = {
+        'type': 'buy',
+        'major': 'eth',
+        'minor': 'btc',
+        'amount': Decimal('2'),
+        'rate': Decimal('0.05'),
+        'value': Decimal('0.1'),
+        'total': Decimal('1.99'),
+        'dt': None,
+        'timestamp': 0.0,
+    }
+
+    mirrored = mirror_trade(trade)
+
+    assert mirrored['type'] == 'sell'
+    assert mirrored['major'] == 'btc'
+    assert mirrored['amount'] == Decimal('0.1')
+    assert mirrored['total'] == Decimal('0.1')
+    assert mirrored['rate'] == Decimal('1')
+
+
+def test_calculate_assets_crypto_pair():
+    """
+    A crypto to crypto trade counts towards both assets in one pass.
+
+    The btc is bought for 1000 cad, and half of it is traded for eth when
+    btc is worth 4000 cad (0.00025 btc per cad).
+    """
+    trades = [
+        {
+            'type': 'buy',
+            'major': 'btc',
+            'minor': 'cad',
+            'amount': Decimal('1'),
+            'rate': Decimal('1000'),
+            'value': Decimal('1000'),
+            'total': Decimal('1'),
+            'dt': datetime(2018, 1, 1),
+            'timestamp': datetime(2018, 1, 1).timestamp(),
+        },
+        {
+            'type': 'buy',
+            'major': 'eth',
+            'minor': 'btc',
+            'amount': Decimal('10'),
+            'rate': Decimal('0.05'),
+            'value': Decimal('0.5'),
+            'total': Decimal('10'),
+            'dt': datetime(2018, 2, 1),
+            'timestamp': datetime(2018, 2, 1).timestamp(),
+        },
+    ]
+    exchange_rates = {'2018/02/01': {'btc': Decimal('0.00025')}}
+
+    sut = Calculator(trades, exchange_rates)
+    results = sut.calculate_assets(['btc', 'eth'], tax_year=2018)
+
+    assert results['btc']['units_held'] == Decimal('0.5')
+    assert results['btc']['acb'] == Decimal('500')
+    assert results['btc']['capital_gains'] == Decimal('1500')
+    assert results['eth']['units_held'] == Decimal('10')
+    assert results['eth']['acb'] == Decimal('2000')
+    assert len(results['btc']['events']) == 2
+    assert len(results['eth']['events']) == 1
+
+
+def test_iter_events_streams_from_generator():
+    """
+    Events are produced one at a time from a generator of trades, with the
+    running totals kept in the tabulations.
+    """
+    def generate_trades():
+        for day in (1, 2):
+            yield {
+                'type': 'buy',
+                'major': 'btc',
+                'minor': 'cad',
+                'amount': Decimal('1'),
+                'rate': Decimal('100'),
+                'value': Decimal('100'),
+                'total': Decimal('1'),
+                'dt': datetime(2018, 1, day),
+                'timestamp': datetime(2018, 1, day).timestamp(),
+            }
+
+    sut = Calculator(generate_trades())
+    tabulations = sut.create_tabulations()
+    events = sut.iter_events(tabulations, tax_year=2018)
+
+    assert next(events)['acb'] == Decimal('100')
+    assert tabulations['units_held'] == Decimal('1')
+    assert next(events)['acb'] == Decimal('200')
+    assert tabulations['events'] == []
+
+
+def test_iter_asset_events_replays_earlier_years():
+    """
+    With a year end callback, the earlier years are replayed to carry the
+    holdings forward, and only the tax year's events are produced.
+    """
+    def make_buy(year):
+        return {
+            'type': 'buy',
+            'major': 'btc',
+            'minor': 'cad',
+            'amount': Decimal('1'),
+            'rate': Decimal('100'),
+            'value': Decimal('100'),
+            'total': Decimal('1'),
+            'dt': datetime(year, 6, 1),
+            'timestamp': datetime(year, 6, 1).timestamp(),
+        }
+
+    year_ends = []
+
+    def on_year_end(year, results, timestamps):
+        year_ends.append((year, results['btc']['acb'], timestamps['btc']))
+
+    sut = Calculator([make_buy(2015), make_buy(2017), make_buy(2018)])
+    results = sut.calculate_assets(['btc'], 2018, on_year_end=on_year_end)
+
+    assert [year for year, _, _ in year_ends] == [2015, 2016, 2017]
+    assert year_ends[-1][1] == Decimal('200')
+    assert year_ends[-1][2] == datetime(2017, 6, 1).timestamp()
+    assert results['btc']['acb'] == Decimal('300')
+    assert results['btc']['outlays'] == Decimal('100')
+    assert len(results['btc']['events']) == 1
+
+
+def test_calculate_years_carries_holdings_forward():
+    """
+    Each year in the range has its own events and totals, and opens with
+    the holdings at the close of the year before.
+    """
+    def make_buy(year):
+        return {
+            'type': 'buy',
+            'major': 'btc',
+            'minor': 'cad',
+            'amount': Decimal('1'),
+            'rate': Decimal('100'),
+            'value': Decimal('100'),
+            'total': Decimal('1'),
+            'dt': datetime(year, 6, 1),
+            'timestamp': datetime(year, 6, 1).timestamp(),
+        }
+
+    sut = Calculator([make_buy(2015), make_buy(2017), make_buy(2019)])
+    years = sut.calculate_years(['btc'], 2014, 2018)
+
+    assert list(years) == [2014, 2015, 2016, 2017, 2018]
+    assert [years[year]['btc']['acb'] for year in years] == [
+        Decimal(value) for value in (0, 100, 100, 200, 200)
+    ]
+    assert [years[year]['btc']['outlays'] for year in years] == [
+        Decimal(value) for value in (0, 100, 0, 100, 0)
+    ]
+    assert [len(years[year]['btc']['events']) for year in years] == [
+        0, 1, 0, 1, 0,
+    ]
+
+
+def test_calculations_share_trades_unchanged():
+    """
+    Currency conversion does not change the trades, so the same list can be
+    calculated again, for another base currency too.
+    """
+    dt = datetime(2018, 6, 1)
+    trade = {
+        'type': 'buy',
+        'major': 'btc',
+        'minor': 'usd',
+        'amount': Decimal('1'),
+        'rate': Decimal('100'),
+        'value': Decimal('100'),
+        'total': Decimal('1'),
+        'dt': dt,
+        'timestamp': dt.timestamp(),
+    }
+    trades = [trade]
+    exchange_rates = {'2018/06/01': {'usd': Decimal('0.8')}}
+    original = dict(trade)
+
+    for _ in range(2):
+        results = Calculator(trades, exchange_rates).calculate(2018)
+        assert results['acb'] == Decimal('125')
+
+    results = Calculator(trades, exchange_rates, 'usd').calculate(2018)
+
+    assert results['acb'] == Decimal('100')
+    assert trade == original
@@ -0,0 +1,121 @@
+"""
+Tests for the year end checkpoints.
+"""
+from decimal import Decimal
+import os
+
+from crypto_taxes.checkpoints import (
+    CheckpointStore,
+    HistoryFingerprint,
+    fingerprint_inputs,
+)
+
+
+def test_fingerprint_changes_with_file_contents(tmpdir):
+    """
+    The fingerprint changes when an input file is written, but not with
+    the order of the files.
+    """
+    first = tmpdir.join('first.csv')
+    second = tmpdir.join('second.csv')
+    first.write('a')
+    second.write('b')
+
+    fingerprint = fingerprint_inputs([str(first), str(second)], 'cad')
+
+    assert fingerprint == fingerprint_inputs([str(second), str(first)], 'cad')
+    assert fingerprint != fingerprint_inputs([str(first), str(second)], 'usd')
+
+    second.write('cc')
+
+    assert fingerprint != fingerprint_inputs([str(first), str(second)], 'cad')
+
+
+def test_history_fingerprint_only_covers_earlier_years(tmpdir):
+    """
+    Adding trades after the end of a year keeps its fingerprint, but
+    changing a trade before it does not.
+    """
+    header = 'type,major,minor,amount,rate,value,fee,total,timestamp,' \
+        'datetime\n'
+    row_2017 = 'buy,btc,cad,1,100,100,0,1,1500000000,2017-07-14 02:40:00\n'
+    row_2018 = 'sell,btc,cad,1,200,200,0,200,1530000000,2018-06-26 08:00:00\n'
+    trades = tmpdir.join('trades.csv')
+    trades.write(header + row_2017)
+
+    fingerprint = HistoryFingerprint([str(trades)], options=['cad'])
+
+    trades.write(header + row_2018 + row_2017)
+    appended = HistoryFingerprint([str(trades)], options=['cad'])
+
+    trades.write(header + row_2018 + row_2017.replace(',100,', ',101,'))
+    changed = HistoryFingerprint([str(trades)], options=['cad'])
+
+    assert appended.year_end(2017) == fingerprint.year_end(2017)
+    assert appended.year_end(2018) != fingerprint.year_end(2018)
+    assert changed.year_end(2017) != fingerprint.year_end(2017)
+
+
+def test_history_fingerprint_reuses_unchanged_files(tmpdir):
+    """
+    The days of a file are only hashed again once its stat changes.
+    """
+    header = 'type,major,minor,amount,rate,value,fee,total,timestamp,' \
+        'datetime\n'
+    row = 'buy,btc,cad,1,100,100,0,1,1500000000,2017-07-14 02:40:00\n'
+    trades = tmpdir.join('trades.csv')
+    trades.write(header + row)
+    file_days = {}
+
+    fingerprint = HistoryFingerprint([str(trades)], file_days=file_days)
+    mtime_ns = os.stat(str(trades)).st_mtime_ns
+
+    trades.write(header + row.replace(',100,', ',101,'))
+    os.utime(str(trades), ns=(mtime_ns, mtime_ns))
+    reused = HistoryFingerprint([str(trades)], file_days=file_days)
+
+    trades.write(header + row.replace(',100,', ',1010,'))
+    rehashed = HistoryFingerprint([str(trades)], file_days=file_days)
+
+    assert fingerprint.changed
+    assert not reused.changed
+    assert reused.year_end(2017) == fingerprint.year_end(2017)
+    assert rehashed.changed
+    assert rehashed.year_end(2017) != fingerprint.year_end(2017)
+
+
+def test_checkpoint_round_trip(tmpdir):
+    """
+    Saved checkpoints are loaded back from the file for the same inputs.
+    """
+    path = str(tmpdir.join('checkpoints.json'))
+    tabulations = {'acb': Decimal('1.5'), 'units_held': Decimal('0.25')}
+
+    store = CheckpointStore(path)
+    store.save_year(2017, {'btc': tabulations}, {'btc': 1514700000.0}, 'abc')
+
+    sut = CheckpointStore(path)
+
+    assert sut.load('btc', 2017, 'abc') == {
+        'acb': Decimal('1.5'),
+        'units_held': Decimal('0.25'),
+        'timestamp': 1514700000.0,
+    }
+    assert sut.load_holdings(['btc'], 2017, 'abc') == {
+        'btc': (Decimal('1.5'), Decimal('0.25')),
+    }
+
+
+def test_checkpoint_invalidated(tmpdir):
+    """
+    Checkpoints are not used when the inputs changed, or when any of the
+    assets has none.
+    """
+    path = str(tmpdir.join('checkpoints.json'))
+    tabulations = {'acb': Decimal('1'), 'units_held': Decimal('1')}
+
+    sut = CheckpointStore(path)
+    sut.save_year(2017, {'btc': tabulations}, {}, 'abc')
+
+    assert sut.load('btc', 2017, 'def') is None
+    assert sut.load_holdings(['btc', 'eth'], 2017, 'abc') is None
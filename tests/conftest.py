@@ -0,0 +1,66 @@
+"""
+Fixtures shared by the tests.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from crypto_taxes.records import Trade
+
+
+def create_trade(
+        trade_type='buy',
+        days=0,
+        amount='1',
+        rate='100',
+        fee='0',
+        **fields
+):
+    """
+    Make a trade of btc in cad, some days into 2018, with the fee taken as a
+    fraction of what was received. Any of the fields of the trade can be
+    given instead.
+    """
+    amount = Decimal(amount)
+    rate = Decimal(rate)
+    value = amount * rate
+    kept = 1 - Decimal(fee)
+
+    if 'total' in fields:
+        total = fields.pop('total')
+    elif trade_type == 'buy':
+        total = (amount * kept).quantize(Decimal('0.00000001'))
+    else:
+        total = value * kept
+
+    values = {
+        'type': trade_type,
+        'major': 'btc',
+        'minor': 'cad',
+        'amount': amount,
+        'rate': rate,
+        'value': value,
+        'total': total,
+        'timestamp': (datetime(2018, 1, 1) + timedelta(days=days)).timestamp(),
+    }
+    values.update(fields)
+
+    return Trade(
+        values['type'],
+        values['major'],
+        values['minor'],
+        values['amount'],
+        values['rate'],
+        values['value'],
+        values['total'],
+        values['timestamp'],
+    )
+
+
+@pytest.fixture(name='make_trade')
+def trade_factory():
+    """
+    The factory of trades for a test.
+    """
+    return create_trade
@@ -0,0 +1,108 @@
+"""
+Tests for the SQLite store of trades and results.
+"""
+from decimal import Decimal
+import os
+
+from crypto_taxes.calculator import Calculator, CSVReader
+from crypto_taxes.database import DatabaseWriter, TradeDatabase
+
+
+DEMO_DIR = os.path.join(
+    os.path.dirname(__file__),
+    os.pardir,
+    os.pardir,
+    'demo',
+)
+
+
+def test_load_trades(tmpdir):
+    """
+    The trades of a file are loaded once, and queried by asset in order.
+    """
+    filename = os.path.join(DEMO_DIR, 'bitso.csv')
+    trades = list(CSVReader().iter_trades(filename))
+    sut = TradeDatabase(str(tmpdir.join('trades.db')))
+
+    assert not sut.is_current(filename)
+    assert sut.load_trades(filename, trades, batch_size=3) == len(trades)
+    assert sut.is_current(filename)
+
+    # Loading the file again replaces its trades
+    sut.load_trades(filename, trades)
+    expected = sorted(
+        (dict(trade) for trade in trades if trade['major'] == 'eth'),
+        key=lambda trade: trade['timestamp'],
+    )
+
+    assert [dict(trade) for trade in sut.iter_trades('eth')] == expected
+    assert len(list(sut.iter_trades())) == len(trades)
+    assert list(sut.iter_trades('eth', start=expected[-1]['timestamp'] + 1)) \
+        == []
+
+    sut.close()
+
+
+def test_writer_round_trip(tmpdir):
+    """
+    The events and totals that are written can be read back, and writing
+    the same asset and year again replaces them.
+    """
+    filename = os.path.join(DEMO_DIR, 'qcx.csv')
+    path = str(tmpdir.join('results.db'))
+    trades = sorted(
+        CSVReader().iter_trades(filename, 'eth'),
+        key=lambda trade: trade['timestamp'],
+    )
+    result = Calculator(trades).calculate(2017)
+
+    for _ in range(2):
+        sut = DatabaseWriter(path, 2017, 'eth', batch_size=2)
+        sut.write_result(result)
+        sut.close()
+
+    database = TradeDatabase(path)
+    events = list(database.iter_events('eth', 2017))
+    tabulations = database.tabulations('eth', 2017)
+
+    assert len(events) == len(result['events'])
+    assert events[-1]['capital_gains'] == str(result['capital_gains'])
+    assert tabulations['units_held'] == result['units_held']
+    assert 'superficial_losses' not in tabulations
+    assert database.tabulations('eth', 2018) is None
+
+    database.close()
+
+
+def test_incremental_writes_append(tmpdir, make_trade):
+    """
+    Appending, as for the trades added since an incremental run, keeps the
+    events and trades written before.
+    """
+    filename = tmpdir.join('trades.csv')
+    filename.write('type,timestamp\n')
+    path = str(tmpdir.join('results.db'))
+    trades = [make_trade('buy', day) for day in range(4)]
+    trades.append(make_trade('sell', 4, '2', '200'))
+    results = Calculator(trades[:4]).calculate_assets(['btc'], 2018)
+
+    sut = DatabaseWriter(path, 2018, 'btc')
+    sut.write_result(results['btc'])
+    sut.database.load_trades(str(filename), trades[:4])
+    sut.close()
+
+    calculator = Calculator(trades[4:])
+    events = calculator.iter_asset_events(results, 2018)
+    sut = DatabaseWriter(path, 2018, 'btc', append=True)
+    sut.write_stream((event for _, event in events), results['btc'])
+    sut.database.load_trades(str(filename), trades[4:], append=True)
+    sut.close()
+
+    database = TradeDatabase(path)
+
+    assert len(list(database.iter_events('btc', 2018))) == 5
+    assert len(list(database.iter_trades('btc'))) == 5
+    assert database.tabulations('btc', 2018)['units_held'] == 2
+    assert database.loaded_size(str(filename)) == filename.size()
+
+    database.close()
@@ -0,0 +1,91 @@
+"""
+Tests for the removal of trades that are in several files.
+"""
+from decimal import Decimal
+
+from crypto_taxes.dedupe import (
+    DuplicateFilter,
+    merge_unique_trades,
+    unique_files,
+)
+
+
+def test_removes_trades_in_other_files(make_trade):
+    """
+    Trades that another file already had are removed and counted, but
+    identical trades within a file are all kept.
+    """
+    first = [
+        make_trade(timestamp=1),
+        make_trade(timestamp=1),
+        make_trade(timestamp=2),
+    ]
+    second = [
+        make_trade(timestamp=1),
+        make_trade(timestamp=2),
+        make_trade(amount='2.0', timestamp=2),
+    ]
+    sut = DuplicateFilter()
+
+    result = list(merge_unique_trades(
+        [iter(first), iter(second)],
+        ['first.csv', 'second.csv'],
+        sut,
+    ))
+
+    assert [(t['timestamp'], t['amount']) for t in result] == [
+        (1, Decimal('1')),
+        (1, Decimal('1')),
+        (2, Decimal('1')),
+        (2, Decimal('2')),
+    ]
+    assert sut.removed == {('second.csv', 'first.csv'): 2}
+    assert sut.total_removed() == 2
+
+
+def test_fingerprints_are_evicted(make_trade):
+    """
+    Only the fingerprints within the window behind the latest trade are
+    kept.
+    """
+    sut = DuplicateFilter(window=10)
+    trades = [
+        ('trades.csv', make_trade(timestamp=second))
+        for second in range(100)
+    ]
+
+    assert len(list(sut.filter(trades))) == 100
+    assert len(sut.seen) == 11
+    assert len(sut.expiry) == 11
+
+
+def test_each_pass_starts_a_new_window(make_trade):
+    """
+    A filter used for several passes over the same trades removes the same
+    trades each time, without adding up the counts of the passes.
+    """
+    sut = DuplicateFilter()
+    trades = [
+        ('first.csv', make_trade(timestamp=1)),
+        ('second.csv', make_trade(timestamp=1)),
+    ]
+
+    assert len(list(sut.filter(trades))) == 1
+    assert len(list(sut.filter(trades))) == 1
+    assert sut.removed == {('second.csv', 'first.csv'): 1}
+
+
+def test_repeated_files_are_removed(tmpdir):
+    """
+    A file given again under the same or another path is only kept once.
+    """
+    path = tmpdir.join('trades.csv')
+    path.write('')
+    other = tmpdir.join('other.csv')
+    other.write('')
+    again = str(tmpdir.join('.', 'trades.csv'))
+
+    assert unique_files([str(path), str(other), again, str(path)]) == (
+        [str(path), str(other)],
+        [(again, str(path)), (str(path), str(path))],
+    )
@@ -0,0 +1,111 @@
+"""
+Tests for the exchange rate lookup table.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from crypto_taxes.exchange_rates import (
+    FILL_NEAREST,
+    FILL_PREVIOUS,
+    ExchangeRateTable,
+)
+
+
+RATES = {
+    '2018/01/05': {'mxn': Decimal('15.5'), 'usd': Decimal('0.8')},
+    '2018/01/08': {'mxn': Decimal('15.8')},
+}
+
+
+def test_from_csv_reads_every_currency(tmpdir):
+    """
+    All the currencies on a date are read, not only the first one.
+    """
+    path = tmpdir.join('rates.csv')
+    path.write(
+        'date,currency,rate\n'
+        '2018/01/05,mxn,15.5\n'
+        '2018/01/05,usd,0.8\n'
+    )
+
+    sut = ExchangeRateTable.from_csv(str(path))
+
+    assert sut.get_rate('mxn', datetime(2018, 1, 5, 12)) == Decimal('15.5')
+    assert sut.get_rate('usd', datetime(2018, 1, 5, 12)) == Decimal('0.8')
+
+
+def test_from_csv_newest_first(tmpdir):
+    """
+    Rates in a file from the newest to the oldest are each on their day.
+    """
+    path = tmpdir.join('rates.csv')
+    path.write(
+        'date,currency,rate\n'
+        '2018/01/08,mxn,15.8\n'
+        '2018/01/05,usd,0.8\n'
+        '2018/01/05,mxn,15.5\n'
+    )
+
+    sut = ExchangeRateTable.from_csv(str(path))
+
+    assert sut.first_ordinal == date(2018, 1, 5).toordinal()
+    assert sut.get_rate('mxn', date(2018, 1, 8)) == Decimal('15.8')
+    assert sut.get_rate('mxn', date(2018, 1, 5)) == Decimal('15.5')
+    assert sut.get_rate('usd', date(2018, 1, 5)) == Decimal('0.8')
+
+
+def test_no_fill():
+    """
+    Without a fill policy, only dates with a rate are found.
+    """
+    sut = ExchangeRateTable.from_dict(RATES)
+
+    assert sut.get_rate('mxn', date(2018, 1, 8)) == Decimal('15.8')
+    assert sut.get_rate('mxn', date(2018, 1, 6)) is None
+    assert sut.get_rate('usd', date(2018, 1, 8)) is None
+    assert sut.get_rate('eur', date(2018, 1, 5)) is None
+    assert sut.get_rate('mxn', date(2018, 1, 9)) is None
+
+
+def test_fill_previous():
+    """
+    Dates without a rate use the last earlier date with one.
+    """
+    sut = ExchangeRateTable.from_dict(RATES, FILL_PREVIOUS)
+
+    assert sut.get_rate('mxn', date(2018, 1, 7)) == Decimal('15.5')
+    assert sut.get_rate('usd', date(2018, 1, 9)) == Decimal('0.8')
+    assert sut.get_rate('mxn', date(2018, 1, 4)) is None
+
+
+def test_fill_nearest():
+    """
+    Dates without a rate use the closest date with one, preferring the
+    earlier date on a tie.
+    """
+    sut = ExchangeRateTable.from_dict(RATES, FILL_NEAREST)
+
+    assert sut.get_rate('mxn', date(2018, 1, 6)) == Decimal('15.5')
+    assert sut.get_rate('mxn', date(2018, 1, 7)) == Decimal('15.8')
+    assert sut.get_rate('mxn', date(2018, 1, 1)) == Decimal('15.5')
+
+
+def test_add_earlier_date():
+    """
+    Adding a date before the first one keeps the existing rates.
+    """
+    sut = ExchangeRateTable.from_dict(RATES)
+    sut.add(date(2018, 1, 1).toordinal(), 'mxn', Decimal('15'))
+
+    assert sut.get_rate('mxn', date(2018, 1, 1)) == Decimal('15')
+    assert sut.get_rate('usd', date(2018, 1, 5)) == Decimal('0.8')
+
+
+def test_unknown_fill_policy():
+    """
+    Unknown fill policies are rejected.
+    """
+    with pytest.raises(ValueError):
+        ExchangeRateTable(fill='sideways')
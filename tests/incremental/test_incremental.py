@@ -0,0 +1,108 @@
+"""
+Tests for incremental processing of growing trade files.
+"""
+from decimal import Decimal
+
+from crypto_taxes.incremental import (
+    IncrementalState,
+    find_added_range,
+    snapshot_file,
+)
+
+
+HEADER = b'type,timestamp\n'
+
+
+def test_find_added_range_appended(tmpdir):
+    """
+    Rows appended to the end of the file are found.
+    """
+    path = tmpdir.join('trades.csv')
+    path.write_binary(HEADER + b'buy,1\n')
+    previous = snapshot_file(str(path))
+
+    path.write_binary(HEADER + b'buy,1\nsell,2\n')
+
+    start, stop = find_added_range(str(path), previous)
+
+    assert path.read_binary()[start:stop] == b'sell,2\n'
+
+
+def test_find_added_range_prepended(tmpdir):
+    """
+    Rows inserted after the header of a newest first file are found.
+    """
+    path = tmpdir.join('trades.csv')
+    path.write_binary(HEADER + b'buy,1\n')
+    previous = snapshot_file(str(path))
+
+    path.write_binary(HEADER + b'sell,3\nsell,2\nbuy,1\n')
+
+    start, stop = find_added_range(str(path), previous)
+
+    assert path.read_binary()[start:stop] == b'sell,3\nsell,2\n'
+
+
+def test_find_added_range_changed(tmpdir):
+    """
+    A file with existing rows changed has no added range.
+    """
+    path = tmpdir.join('trades.csv')
+    path.write_binary(HEADER + b'buy,1\nbuy,2\n')
+    previous = snapshot_file(str(path))
+
+    path.write_binary(HEADER + b'buy,1\nsell,2\nbuy,3\n')
+
+    assert find_added_range(str(path), previous) is None
+
+
+def test_find_added_range_hashes_boundaries(tmpdir):
+    """
+    Only the bytes at the boundaries of the previous rows are compared, so
+    a change at either end is noticed.
+    """
+    path = tmpdir.join('trades.csv')
+    path.write_binary(HEADER + b'buy,1\nbuy,2\nbuy,3\n')
+    previous = snapshot_file(str(path), boundary_size=6)
+
+    assert previous['boundary_size'] == 6
+
+    path.write_binary(HEADER + b'buy,1\nbuy,9\nbuy,3\nsell,4\n')
+
+    assert find_added_range(str(path), previous) == (
+        len(HEADER) + 18,
+        len(HEADER) + 25,
+    )
+
+    path.write_binary(HEADER + b'buy,1\nbuy,2\nbuy,8\nsell,4\n')
+
+    assert find_added_range(str(path), previous) is None
+
+
+def test_state_round_trip(tmpdir):
+    """
+    The tabulations are restored from the saved state, and only the added
+    rows are found while the options stay the same.
+    """
+    trades = tmpdir.join('trades.csv')
+    trades.write_binary(HEADER + b'buy,1\n')
+    path = str(tmpdir.join('state.json'))
+    results = {
+        'btc': {'acb': Decimal('10.5'), 'units_held': Decimal('1'),
+                'events': ['not saved']},
+    }
+
+    IncrementalState(path).save([str(trades)], ['2018'], results, 1.0)
+    trades.write_binary(HEADER + b'buy,1\nbuy,2\n')
+    sut = IncrementalState(path)
+
+    assert sut.results() == {
+        'btc': {'acb': Decimal('10.5'), 'units_held': Decimal('1'),
+                'events': []},
+    }
+    assert sut.timestamp() == 1.0
+    assert sut.find_added_ranges([str(trades)], ['2018']) == {
+        str(trades): (len(HEADER) + 6, len(HEADER) + 12),
+    }
+    assert sut.find_added_ranges([str(trades)], ['2019']) is None
+    assert sut.find_added_ranges([], ['2018']) is None
@@ -0,0 +1,63 @@
+"""
+Tests for parallel parsing of trade files.
+"""
+from crypto_taxes.calculator import CSVReader
+from crypto_taxes.parallel import parse_files, split_ranges
+
+
+HEADER = 'type,major,minor,amount,rate,value,fee,total,timestamp,datetime\n'
+ROW = '{},{},cad,1.5,100,150.0,0,1.5,{},2017-07-14 02:40:00\n'
+
+
+def write_trades(tmpdir, name, rows):
+    """
+    Write a Bitso trade file with a row for each type, major and timestamp.
+    """
+    path = tmpdir.join(name)
+    path.write(HEADER + ''.join(ROW.format(*row) for row in rows))
+
+    return str(path)
+
+
+def test_split_ranges_on_row_boundaries(tmpdir):
+    """
+    The chunks cover every row, and each one ends at the end of a row.
+    """
+    rows = [('buy', 'btc', 1500000000 + index) for index in range(10)]
+    filename = write_trades(tmpdir, 'trades.csv', rows)
+    contents = tmpdir.join('trades.csv').read_binary()
+
+    ranges = split_ranges(filename, chunk_size=100)
+
+    assert len(ranges) > 1
+    assert ranges[0][0] == len(HEADER)
+    assert ranges[-1][1] == len(contents)
+
+    for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+        assert stop == start
+        assert contents[stop - 1:stop] == b'\n'
+
+
+def test_parse_files_matches_sequential(tmpdir):
+    """
+    Files parsed in chunks by a pool of processes give the same trades as
+    parsing them one after another.
+    """
+    filenames = [
+        write_trades(tmpdir, 'old.csv', [
+            ('buy', 'btc', 1500000000 + index) for index in range(20)
+        ]),
+        write_trades(tmpdir, 'new.csv', [
+            ('sell', 'eth', 1500001000 - index) for index in range(20)
+        ]),
+    ]
+    csv_reader = CSVReader()
+
+    parse_files(csv_reader, filenames, jobs=2, chunk_size=200)
+
+    for filename in filenames:
+        assert [
+            dict(trade) for trade in csv_reader.iter_sorted_trades(filename)
+        ] == [
+            dict(trade) for trade in CSVReader().iter_sorted_trades(filename)
+        ]
@@ -66,3 +66,56 @@ def test_bitso_qcx_parse_row():
         'timestamp': float('1522889881.138')
     }
     assert expected == sut.parse_row(row)
+
+
+def test_register_parser():
+    """
+    A registered parser is found by its header, and converts rows by the
+    position of its columns.
+    """
+    @parsers.register
+    class ReorderedParser(parsers.Parser):
+        COLUMNS = ('when', 'pair', 'base', 'side', 'qty', 'price', 'cost')
+        FIELDS = {
+            'type': ('side', None),
+            'major': ('base', str.lower),
+            'minor': ('pair', str.lower),
+            'amount': ('qty', Decimal),
+            'rate': ('price', Decimal),
+            'value': ('cost', Decimal),
+            'total': ('qty', Decimal),
+            'timestamp': ('when', float),
+        }
+
+    try:
+        sut = parsers.find_parser(ReorderedParser.COLUMNS)
+        values = ['1522889881.0', 'CAD', 'BTC', 'sell', '1', '9000', '9000']
+
+        assert isinstance(sut, ReorderedParser)
+        assert sut.matches(values, 'btc')
+        assert not sut.matches(values, 'eth')
+
+        trade = sut.parse_values(values)
+        assert trade['major'] == 'btc'
+        assert trade['minor'] == 'cad'
+        assert trade['value'] == Decimal('9000')
+        assert sut.parse_timestamp(values) == 1522889881.0
+    finally:
+        del parsers.PARSER_MAP[','.join(ReorderedParser.COLUMNS)]
+
+
+def test_encoded_parser_converts_bytes():
+    """
+    A parser for rows of bytes matches assets without decoding, and makes
+    the same trades as a parser for text.
+    """
+    header = b'type,major,minor,amount,rate,value,fee,total,timestamp,datetime'
+    values = b'buy,ETH,mxn,2.0,6815.00,13630.0,0.02,1.98,1522889881.138,x'
+    sut = parsers.find_parser(header.split(b','), encoded=True)
+    text_parser = parsers.find_parser(header.decode().split(','))
+
+    assert sut.matches(values.split(b','), b'eth')
+    assert not sut.matches(values.split(b','), b'mxn2')
+    assert sut.parse_timestamp(values.split(b',')) == 1522889881.138
+    assert sut.parse_values(values.split(b',')) == \
+        text_parser.parse_values(values.decode().split(','))
@@ -0,0 +1,89 @@
+"""
+Tests for the profiling of the stages of a calculation.
+"""
+from decimal import Decimal
+import json
+import time
+
+from crypto_taxes.calculator import Calculator
+from crypto_taxes.profiling import Profiler
+
+
+def slow_rows(count):
+    """
+    Produce rows slowly.
+    """
+    for row in range(count):
+        time.sleep(0.01)
+        yield row
+
+
+def test_nested_stages_are_exclusive():
+    """
+    Time spent pulling rows through an inner stage is not counted towards
+    the outer stage that consumes them.
+    """
+    profiler = Profiler()
+    rows = profiler.iterate('parse', slow_rows(5), counter='rows parsed')
+
+    with profiler.stage('validate'):
+        assert list(rows) == [0, 1, 2, 3, 4]
+
+    stages = profiler.to_dict()['stages']
+
+    assert stages['parse']['rows'] == 5
+    assert stages['parse']['wall_seconds'] >= 0.05
+    assert stages['validate']['wall_seconds'] < 0.04
+    assert profiler.counters == {'rows parsed': 5}
+
+
+def test_disabled_profiler_passes_through():
+    """
+    A disabled profiler leaves the iterables untouched, and keeps nothing.
+    """
+    profiler = Profiler(enabled=False)
+    rows = [1, 2]
+    profiler.count('lookups')
+
+    with profiler.stage('validate'):
+        assert profiler.iterate('parse', rows) is rows
+    assert profiler.to_dict() == {'stages': {}, 'counters': {}}
+
+
+def test_chrome_trace(tmpdir):
+    """
+    The stages are written as complete trace events.
+    """
+    profiler = Profiler()
+
+    with profiler.stage('calculate'):
+        profiler.count('trades processed', 3)
+
+    path = str(tmpdir.join('trace.json'))
+    profiler.write_chrome_trace(path)
+
+    with open(path) as trace_file:
+        trace = json.load(trace_file)
+
+    assert [event['name'] for event in trace['traceEvents']] == \
+        ['calculate']
+    assert trace['traceEvents'][0]['ph'] == 'X'
+    assert trace['otherData'] == {'trades processed': 3}
+
+
+def test_calculator_counts_its_work(make_trade):
+    """
+    A calculator given a profiler counts the trades it processes and their
+    currency conversions.
+    """
+    profiler = Profiler()
+    trades = [make_trade('buy', 0), make_trade('sell', 1, minor='usd')]
+    exchange_rates = {'2018/01/02': {'usd': Decimal('0.8')}}
+
+    Calculator(trades, exchange_rates, profiler=profiler).calculate(2018)
+
+    assert profiler.counters == {
+        'trades processed': 2,
+        'currency conversions': 2,
+        'rate lookups': 1,
+    }
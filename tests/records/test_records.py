@@ -0,0 +1,191 @@
+"""
+Tests for the compact trade and event records.
+"""
+from datetime import datetime
+from decimal import Decimal
+import pickle
+import sys
+
+import pytest
+
+from crypto_taxes.records import Event, LazyTrade, TradeStore
+
+
+# The fields of a buy of eth in mxn, with a 1% commission
+MXN_TRADE = {
+    'amount': '2.00000000',
+    'major': 'eth',
+    'minor': 'mxn',
+    'rate': Decimal('6815.00'),
+    'value': Decimal('13630.00000000'),
+    'total': Decimal('1.98000000'),
+    'timestamp': 1522889881.138,
+}
+
+def test_trade_reads_like_a_dict(make_trade):
+    """
+    A trade can be read and compared like the normalized trade dict.
+    """
+    trade = make_trade(**MXN_TRADE)
+
+    assert trade['amount'] == Decimal('2.00000000')
+    assert trade['dt'] == datetime.fromtimestamp(1522889881.138)
+    assert 'exchange_rate' not in trade
+    assert dict(trade) == {
+        'type': 'buy',
+        'major': 'eth',
+        'minor': 'mxn',
+        'amount': Decimal('2.00000000'),
+        'rate': Decimal('6815.00'),
+        'value': Decimal('13630.00000000'),
+        'total': Decimal('1.98000000'),
+        'dt': datetime.fromtimestamp(1522889881.138),
+        'timestamp': 1522889881.138,
+    }
+
+
+def test_trade_set_item(make_trade):
+    """
+    The amounts can be set, but not the date or fields a trade does not
+    have.
+    """
+    trade = make_trade(**MXN_TRADE)
+    trade['rate'] = Decimal('454.33')
+
+    assert trade['rate'] == Decimal('454.33')
+
+    with pytest.raises(KeyError):
+        trade['dt'] = datetime(2018, 1, 1)
+
+    with pytest.raises(KeyError):
+        trade['exchange_rate'] = Decimal('15')
+
+
+def test_records_pickle(make_trade):
+    """
+    Trades and events survive pickling, for spilling and process pools.
+    """
+    trade = make_trade(**MXN_TRADE)
+    event = Event(
+        action='buy',
+        major='eth',
+        minor='mxn',
+        amount=Decimal('2'),
+        dt=datetime(2018, 1, 1),
+        acb=Decimal('10'),
+        rate=Decimal('5'),
+        units_held=Decimal('2'),
+        exchange_rate=1,
+        capital_gains=Decimal('0'),
+        capital_gain=Decimal('0'),
+    )
+
+    assert pickle.loads(pickle.dumps(trade)) == trade
+    assert pickle.loads(pickle.dumps(event)) == event
+
+
+def test_trade_store_round_trip(make_trade):
+    """
+    Trades come back out of the store exactly as they went in, including
+    trailing zeros and negative amounts.
+    """
+    trades = [
+        make_trade(**MXN_TRADE),
+        make_trade(**dict(MXN_TRADE, amount='-0.5', timestamp=1522889882)),
+        make_trade(**dict(MXN_TRADE, amount='0')),
+    ]
+
+    store = TradeStore(trades)
+
+    assert len(store) == 3
+    assert list(store) == trades
+    assert str(store[0]['rate']) == '6815.00'
+    assert store[-1]['amount'] == Decimal('0')
+    assert store.codes == ['buy', 'eth', 'mxn']
+
+
+def test_trade_store_keeps_long_amounts(make_trade):
+    """
+    Amounts with too many digits for the fixed point columns are kept as
+    decimals, also when stores are joined.
+    """
+    long_amount = '1234567890.1234567890123456789'
+    trades = [
+        make_trade(**MXN_TRADE),
+        make_trade(**dict(MXN_TRADE, amount=long_amount)),
+        make_trade(**dict(MXN_TRADE, amount='1E+200')),
+    ]
+
+    store = TradeStore(trades[:1])
+    store.extend_store(TradeStore(trades[1:]))
+
+    assert list(store) == trades
+    assert str(store[1]['amount']) == long_amount
+    assert store.overflow() == [
+        ['amount', 1, long_amount],
+        ['amount', 2, '1E+200'],
+    ]
+
+
+def test_trade_store_is_compact(make_trade):
+    """
+    The store takes a small fraction of the memory of the trade dicts.
+    """
+    trades = [
+        make_trade(**dict(MXN_TRADE, timestamp=1522889881 + i))
+        for i in range(100)
+    ]
+    dict_size = sum(
+        sys.getsizeof(dict(trade))
+        + sum(sys.getsizeof(value) for value in dict(trade).values())
+        for trade in trades
+    )
+
+    store = TradeStore(trades)
+
+    assert store.nbytes() * 10 < dict_size
+
+
+def test_lazy_trade_converts_amounts_when_read(make_trade):
+    """
+    A lazy trade converts the text of an amount when it is first read, and
+    reads like a trade with the converted amounts.
+    """
+    sut = LazyTrade(
+        'buy',
+        'eth',
+        'mxn',
+        ('2.00000000', '6815.00', '13630.00000000', '1.98000000'),
+        (Decimal,) * 4,
+        1522889881.138,
+    )
+
+    assert sut.raw[0] == '2.00000000'
+    assert sut['amount'] == Decimal('2.00000000')
+
+    sut['rate'] = Decimal('1')
+
+    assert dict(sut) == dict(make_trade(**MXN_TRADE), rate=Decimal('1'))
+    assert pickle.loads(pickle.dumps(sut)) == sut
+
+
+def test_trade_store_keeps_lazy_trades_unconverted():
+    """
+    Storing a lazy trade takes its amounts from their text, without
+    converting the amounts of the trade.
+    """
+    trade = LazyTrade(
+        'buy',
+        'eth',
+        'mxn',
+        ('2.00000000', '6815.00', '1E+3', '1.98000000'),
+        (Decimal,) * 4,
+        1522889881.138,
+    )
+
+    store = TradeStore([trade])
+
+    assert trade.unconverted('amount') == '2.00000000'
+    assert trade.unconverted('rate') == '6815.00'
+    assert str(store[0]['amount']) == '2.00000000'
+    assert str(store[0]['value']) == '1E+3'
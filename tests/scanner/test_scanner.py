@@ -0,0 +1,40 @@
+"""
+Tests for memory mapped scanning of CSV files.
+"""
+import mmap
+
+from crypto_taxes import scanner
+
+
+def test_iter_rows_splits_fields_as_bytes(tmpdir):
+    """
+    The header and rows are split into bytes, with quoted fields and blank
+    lines handled like the csv module does.
+    """
+    path = tmpdir.join('trades.csv')
+    path.write_binary(b'a,b\r\n1,"x, y"\r\n\r\n2,z\r\n')
+
+    rows = list(scanner.iter_rows(str(path)))
+    reversed_rows = list(scanner.iter_rows(str(path), reverse=True))
+
+    assert rows == [[b'a', b'b'], [b'1', b'x, y'], [b'2', b'z']]
+    assert reversed_rows == [rows[0], rows[2], rows[1]]
+
+
+def test_iter_lines_releasing_pages(tmpdir):
+    """
+    Lines are read the same both ways while scanned pages are released.
+    """
+    lines = [b'row %d\n' % index for index in range(mmap.PAGESIZE // 2)]
+    path = tmpdir.join('lines.csv')
+    path.write_binary(b''.join(lines))
+
+    with scanner.map_file(str(path)) as mapped:
+        stop = len(mapped)
+        forward = list(scanner.iter_lines(mapped, 0, stop, 1000))
+        backward = list(
+            scanner.iter_lines_reversed(mapped, 0, stop, 1000)
+        )
+
+    assert forward == lines
+    assert backward == lines[::-1]
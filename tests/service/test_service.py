@@ -0,0 +1,165 @@
+"""
+Tests for the resident calculation service.
+"""
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+
+from crypto_taxes.exchange_rates import ExchangeRateTable
+from crypto_taxes.service import (
+    CalculationService,
+    LocalClient,
+    parse_trade,
+)
+
+
+def trade_values(trade_type, amount, rate, date_string):
+    """
+    Create the JSON values of a btc trade in cad.
+    """
+    value = str(amount * rate)
+
+    return {
+        'type': trade_type,
+        'major': 'btc',
+        'minor': 'cad',
+        'amount': str(amount),
+        'rate': str(rate),
+        'value': value,
+        'total': str(amount) if trade_type == 'buy' else value,
+        'timestamp': datetime.strptime(date_string, '%Y-%m-%d').timestamp(),
+    }
+
+
+def test_tabulations_carry_holdings_between_years():
+    """
+    A tax year starts from the holdings at the end of the previous year.
+    """
+    client = LocalClient(CalculationService())
+    status, response = client.post('/trades', {'trades': [
+        trade_values('buy', 2, 100, '2017-03-01'),
+        trade_values('sell', 1, 300, '2018-03-01'),
+    ]})
+
+    assert (status, response) == (200, {'added': 2})
+
+    status, response = client.get('/tabulations', asset='btc', year=2018)
+
+    assert status == 200
+    assert Decimal(response['acb']) == 100
+    assert Decimal(response['units_held']) == 1
+    assert Decimal(response['capital_gains']) == 200
+
+    status, response = client.get('/events', asset='btc', year=2017)
+
+    assert [event['action'] for event in response['events']] == ['buy']
+    client.close()
+
+
+def test_added_trades_invalidate_later_years():
+    """
+    Adding a trade recalculates the years from the year of the trade.
+    """
+    service = CalculationService()
+    client = LocalClient(service)
+    client.post('/trades', {'trades': [
+        trade_values('buy', 1, 100, '2017-03-01'),
+    ]})
+    client.get('/tabulations', asset='btc', year=2018)
+
+    client.post('/trades', {'trades': [
+        trade_values('buy', 1, 200, '2017-06-01'),
+    ]})
+    status, response = client.get('/tabulations', asset='btc', year=2018)
+
+    assert Decimal(response['acb']) == 300
+    assert Decimal(response['units_held']) == 2
+    client.close()
+
+
+def test_recalculation_converts_trades_once():
+    """
+    Calculating a year again gives the same results, since the trades in
+    another currency are not changed by converting them.
+    """
+    values = trade_values('buy', 1, 100, '2017-03-01')
+    values['minor'] = 'usd'
+    service = CalculationService(
+        [parse_trade(values)],
+        ExchangeRateTable.from_dict({'2017/03/01': {'usd': Decimal('0.8')}}),
+    )
+
+    first = service.calculate('btc', 2017)
+    service.results.clear()
+    second = service.calculate('btc', 2017)
+
+    assert first['acb'] == second['acb'] == Decimal('125')
+    assert service.trades[0]['rate'] == 100
+    service.executor.shutdown()
+
+
+def test_errors():
+    """
+    Invalid requests and impossible calculations are reported.
+    """
+    client = LocalClient(CalculationService())
+    client.post('/trades', {'trades': [
+        trade_values('sell', 1, 100, '2017-03-01'),
+    ]})
+
+    assert client.get('/tabulations', asset='btc')[0] == 400
+    assert client.get('/tabulations', asset='btc', year=2017)[0] == 422
+    assert client.post('/trades', {'trades': [{'type': 'gift'}]})[0] == 400
+    assert client.get('/unknown')[0] == 404
+    client.close()
+
+
+class ClosingWriter():
+    """
+    Stream writer that records what was written, and whether it was closed.
+    """
+    def __init__(self):
+        self.data = b''
+        self.closed = False
+
+    def write(self, data):
+        """
+        Record the data written.
+        """
+        self.data += data
+
+    async def drain(self):
+        """
+        Nothing is buffered.
+        """
+
+    def close(self):
+        """
+        Record that the connection was closed.
+        """
+        self.closed = True
+
+
+def test_disconnect_during_body_closes_connection():
+    """
+    A client that disconnects before sending the whole body has its
+    connection closed, without a response.
+    """
+    service = CalculationService()
+    writer = ClosingWriter()
+
+    async def send_partial_request():
+        reader = asyncio.StreamReader()
+        reader.feed_data(
+            b'POST /trades HTTP/1.1\r\n'
+            b'Content-Length: 100\r\n\r\n'
+            b'{"trades": '
+        )
+        reader.feed_eof()
+        await service.handle_connection(reader, writer)
+
+    asyncio.run(send_partial_request())
+
+    assert writer.closed
+    assert writer.data == b''
+    service.close()
@@ -0,0 +1,62 @@
+"""
+Tests for sorting the trades by time.
+"""
+from crypto_taxes import sorting
+
+
+def make_trades(*timestamps):
+    """
+    Make minimal trades with the given timestamps, numbered in order.
+    """
+    return [
+        {'timestamp': timestamp, 'number': number}
+        for number, timestamp in enumerate(timestamps)
+    ]
+
+
+def test_detect_order():
+    """
+    Ascending, descending and unordered timestamps are detected.
+    """
+    assert sorting.detect_order([1, 2, 2, 3]) == sorting.ASCENDING
+    assert sorting.detect_order([3, 2, 2, 1]) == sorting.DESCENDING
+    assert sorting.detect_order([1, 3, 2]) == sorting.UNORDERED
+    assert sorting.detect_order([]) == sorting.ASCENDING
+
+
+def test_reverse_runs_keeps_order_of_equal_timestamps():
+    """
+    Trades at the same time, read backwards from a newest first file, are
+    put back into the order they appeared in the file.
+    """
+    file_trades = make_trades(3, 2, 2, 1)
+    backwards = list(reversed(file_trades))
+
+    result = [trade['number'] for trade in sorting.reverse_runs(backwards)]
+
+    assert result == [3, 1, 2, 0]
+
+
+def test_external_sort_spills_runs():
+    """
+    Trades are sorted across several spilled runs, and trades at the same
+    time keep their original order.
+    """
+    trades = make_trades(5, 1, 4, 1, 3, 2, 0)
+
+    result = list(sorting.external_sort(iter(trades), run_size=2))
+
+    assert [trade['timestamp'] for trade in result] == [0, 1, 1, 2, 3, 4, 5]
+    assert [trade['number'] for trade in result][1:3] == [1, 3]
+
+
+def test_merge_trades():
+    """
+    Ordered streams are merged by timestamp.
+    """
+    first = make_trades(1, 3, 5)
+    second = make_trades(2, 3, 4)
+
+    result = sorting.merge_trades([iter(first), iter(second)])
+
+    assert [trade['timestamp'] for trade in result] == [1, 2, 3, 3, 4, 5]
@@ -0,0 +1,44 @@
+"""
+Tests for the detection of superficial losses.
+"""
+from decimal import Decimal
+
+from crypto_taxes.calculator import Calculator
+
+
+def test_loss_denied_for_units_bought_back(make_trade):
+    """
+    The loss of the units that were bought back within 30 days, and still
+    held after 30 days, is denied and added to the ACB.
+    """
+    trades = [
+        make_trade('buy', 0, '10', '100'),
+        make_trade('sell', 40, '10', '50'),
+        make_trade('buy', 50, '5', '55'),
+    ]
+    sut = Calculator(trades, superficial_losses=True)
+    results = sut.calculate_assets(['btc'], 2018)['btc']
+
+    assert results['events'][1]['capital_gain'] == Decimal('-250')
+    assert results['events'][1]['acb'] == Decimal('250')
+    assert results['capital_gains'] == Decimal('-250')
+    assert results['superficial_losses'] == Decimal('250')
+    assert results['acb'] == Decimal('525')
+
+
+def test_loss_allowed_when_not_held_after_period(make_trade):
+    """
+    Units bought within 30 days before a loss, but sold with it, do not make
+    the loss superficial, and neither do units bought after the period.
+    """
+    trades = [
+        make_trade('buy', 0, '10', '100'),
+        make_trade('buy', 20, '5', '60'),
+        make_trade('sell', 40, '15', '50'),
+        make_trade('buy', 71, '5', '55'),
+    ]
+    sut = Calculator(trades, superficial_losses=True)
+    results = sut.calculate_assets(['btc'], 2018)['btc']
+
+    assert results['events'][2]['capital_gain'] == Decimal('-550')
+    assert results['superficial_losses'] == Decimal('0')
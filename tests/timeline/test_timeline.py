@@ -0,0 +1,78 @@
+"""
+Tests for recalculating the suffix of a trade history.
+"""
+from decimal import Decimal
+
+import pytest
+
+from crypto_taxes.exceptions import InsufficientUnitsError
+from crypto_taxes.timeline import Timeline
+
+
+def test_update_recalculates_suffix(make_trade):
+    """
+    A back dated trade only recalculates the trades after the snapshot
+    before it, and gives the same result as calculating from scratch.
+    """
+    trades = [make_trade('buy', day) for day in range(10)]
+    trades.append(make_trade('sell', 10, '5', '200'))
+    late_trade = make_trade('buy', 7.5, '1', '300')
+
+    sut = Timeline(['btc'], interval=4)
+    sut.update(added=trades)
+
+    processed = []
+    process_trade = sut.calculator.process_trade
+    sut.calculator.process_trade = \
+        lambda *args: processed.append(args) or process_trade(*args)
+
+    changes = sut.update(added=[late_trade])
+    expected = Timeline(['btc'])
+    expected.update(added=trades + [late_trade])
+
+    assert len(processed) == 11 - 8 + 1
+    assert [change.old is None for change in changes] == [
+        True, False, False, False,
+    ]
+    assert changes[0].new['rate'] == Decimal('300')
+    assert changes[-1].old['capital_gain'] == Decimal('500')
+    assert changes[-1].new['capital_gain'] < Decimal('500')
+    assert sut.tabulations('btc') == expected.tabulations('btc')
+
+
+def test_update_removes_and_keeps_history_on_error(make_trade):
+    """
+    Removed trades are reported, and a change that cannot be calculated
+    leaves the history as it was.
+    """
+    trades = [make_trade('buy', 0), make_trade('sell', 1)]
+    sut = Timeline(['btc'])
+    sut.update(added=trades)
+
+    with pytest.raises(InsufficientUnitsError):
+        sut.update(removed=[trades[0]])
+
+    assert sut.tabulations('btc')['units_held'] == Decimal('0')
+
+    changes = sut.update(removed=[trades[1]])
+
+    assert [(change.old['action'], change.new) for change in changes] == [
+        ('sell', None),
+    ]
+    assert sut.tabulations('btc')['units_held'] == Decimal('1')
+
+
+def test_update_removes_identical_trades(make_trade):
+    """
+    Each of several identical trades that are removed takes out a trade of
+    its own.
+    """
+    trades = [make_trade('buy', 0), make_trade('buy', 0), make_trade('buy', 0)]
+    sut = Timeline(['btc'])
+    sut.update(added=trades)
+
+    changes = sut.update(removed=trades[:2])
+
+    assert len([change for change in changes if change.new is None]) == 2
+    assert len(sut.trades) == 1
+    assert sut.tabulations('btc')['units_held'] == Decimal('1')
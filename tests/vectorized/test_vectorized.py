@@ -0,0 +1,125 @@
+"""
+Tests for the vectorized NumPy ACB engine.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+import random
+
+import pytest
+
+from crypto_taxes import vectorized
+from crypto_taxes.calculator import Calculator
+from crypto_taxes.exceptions import InsufficientUnitsError
+from crypto_taxes.records import Trade
+from crypto_taxes.vectorized import VectorizedCalculator
+
+# The engine module imports without NumPy, but cannot calculate
+pytest.importorskip('numpy')
+
+
+def make_history(make_trade, count, seed=1):
+    """
+    Make a random history of buys and sells with a 0.5% commission, that
+    never oversells, and sells everything part way through.
+    """
+    generator = random.Random(seed)
+    trades = []
+    held = Decimal('0')
+
+    for day in range(count):
+        if day == count // 2 and held:
+            trades.append(make_trade('sell', day, held, '9000', '0.005'))
+            held = Decimal('0')
+        elif held and generator.random() < 0.4:
+            amount = (held * Decimal(generator.random())).quantize(
+                Decimal('0.00000001')
+            )
+            trades.append(make_trade('sell', day, amount, '9000', '0.005'))
+            held -= amount
+        else:
+            trade = make_trade(
+                'buy',
+                day,
+                Decimal(generator.randint(1, 10**8)) / 10**8,
+                str(generator.randint(5000, 15000)),
+                '0.005',
+            )
+            trades.append(trade)
+            held += trade['total']
+
+    return trades
+
+
+@pytest.mark.parametrize('block_size', [7, 1024])
+def test_matches_decimal_calculator(monkeypatch, make_trade, block_size):
+    """
+    The vectorized engine agrees with the Decimal calculator, including
+    across the blocks that the recurrence is solved in.
+    """
+    monkeypatch.setattr(vectorized, 'BLOCK_SIZE', block_size)
+    trades = make_history(make_trade, 300)
+
+    expected = Calculator(trades).calculate(tax_year=2018)
+    result = VectorizedCalculator(trades).calculate(tax_year=2018)
+
+    assert result['units_held'] == expected['units_held']
+
+    for key in ('acb', 'capital_gains', 'outlays', 'proceeds',
+                'sum_acb_dispositions'):
+        assert float(result[key]) == pytest.approx(float(expected[key]))
+
+    for event, expected_event in zip(result['events'], expected['events']):
+        assert event['units_held'] == expected_event['units_held']
+        assert float(event['acb']) == pytest.approx(
+            float(expected_event['acb']),
+            abs=1e-6,
+        )
+
+
+def test_sell_all_resets_acb(make_trade):
+    """
+    Selling every unit held leaves an ACB of exactly zero.
+    """
+    trades = [
+        make_trade('buy', 0, '2', '100', '0.005'),
+        make_trade('sell', 1, '1.99', '200', '0.005'),
+    ]
+
+    result = VectorizedCalculator(trades).calculate(tax_year=2018)
+
+    assert result['acb'] == 0
+    assert result['units_held'] == 0
+
+
+def test_insufficient_units(make_trade):
+    """
+    Selling more units than held raises an error.
+    """
+    trades = [
+        make_trade('buy', 0, '1', '100', '0.005'),
+        make_trade('sell', 1, '2', '200', '0.005'),
+    ]
+
+    with pytest.raises(InsufficientUnitsError):
+        VectorizedCalculator(trades).calculate(tax_year=2018)
+
+
+def test_rounds_units_past_fixed_point(make_trade):
+    """
+    Units with more decimal places than the fixed point are rounded rather
+    than rejected.
+    """
+    trades = [
+        make_trade(
+            'buy',
+            0,
+            '1.123456789',
+            '100',
+            total=Decimal('1.123456789'),
+        ),
+        make_trade('sell', 1, '0.5', '200'),
+    ]
+
+    result = VectorizedCalculator(trades).calculate(tax_year=2018)
+
+    assert result['units_held'] == Decimal('0.62345679')
@@ -0,0 +1,76 @@
+"""
+Tests for what if scenarios of hypothetical trades.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from crypto_taxes.calculator import Calculator
+from crypto_taxes.exceptions import InsufficientUnitsError
+from crypto_taxes.whatif import WhatIfEngine, hypothetical_sell
+
+
+def make_engine():
+    """
+    Make an engine from holding 2 btc with an ACB of 200 and 10 eth with an
+    ACB of 1000, with a capital gain of 50 on eth so far.
+    """
+    trades = []
+
+    for asset, amount, rate in (('btc', 2, 100), ('eth', 11, 100)):
+        dt = datetime(2018, 1, 1)
+        trades.append({
+            'type': 'buy',
+            'major': asset,
+            'minor': 'cad',
+            'amount': Decimal(amount),
+            'rate': Decimal(rate),
+            'value': Decimal(amount * rate),
+            'total': Decimal(amount),
+            'dt': dt,
+            'timestamp': dt.timestamp(),
+        })
+
+    when = datetime(2018, 2, 1)
+    trades.append(hypothetical_sell('eth', 1, 150, when, 'cad'))
+    results = Calculator(trades).calculate_assets(['btc', 'eth'], 2018)
+
+    return WhatIfEngine(results)
+
+
+def test_evaluate_forks_touched_assets():
+    """
+    A scenario only changes the assets it trades, and not the base.
+    """
+    sut = make_engine()
+    when = datetime(2018, 12, 1)
+
+    result = sut.evaluate([hypothetical_sell('btc', 1, 60, when, 'cad', 1)])
+
+    assert result.error is None
+    assert result.tabulations['btc']['capital_gains'] == Decimal('-41')
+    assert result.tabulations['eth'] is sut.base['eth']
+    assert result.capital_gains == Decimal('9')
+    assert sut.base['btc']['units_held'] == Decimal('2')
+
+
+def test_evaluate_batch_in_processes():
+    """
+    Scenarios evaluated in a pool of processes give the same results in
+    order, and a scenario that cannot be calculated has an error.
+    """
+    sut = make_engine()
+    when = datetime(2018, 12, 1)
+    scenarios = [
+        [hypothetical_sell('btc', units, 80, when, 'cad')]
+        for units in ('0.5', '1', '3', '2')
+    ]
+
+    results = sut.evaluate_batch(scenarios, jobs=2)
+
+    assert [result.capital_gains for result in results] == [
+        Decimal('40'), Decimal('30'), None, Decimal('10'),
+    ]
+    assert isinstance(results[2].error, InsufficientUnitsError)
+    assert [result.tabulations for result in results] == [
+        result.tabulations for result in sut.evaluate_batch(scenarios)
+    ]
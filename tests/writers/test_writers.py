@@ -0,0 +1,127 @@
+"""
+Tests for the writers of the calculation results.
+"""
+from datetime import datetime
+from decimal import Decimal
+from io import StringIO
+import json
+
+import pytest
+
+from crypto_taxes.records import Event
+from crypto_taxes.writers import CSVWriter, JSONLinesWriter
+
+
+def create_result():
+    """
+    Create a result with a single buy.
+    """
+    event = Event(
+        action='buy',
+        major='btc',
+        minor='cad',
+        amount=Decimal('1.50'),
+        rate=Decimal('100'),
+        dt=datetime(2018, 1, 2, 3, 4, 5),
+        acb=Decimal('150.00'),
+        units_held=Decimal('1.50'),
+        exchange_rate=Decimal('1'),
+        capital_gains=Decimal('0'),
+        capital_gain=Decimal('0'),
+    )
+
+    return {
+        'events': [event],
+        'acb': Decimal('150.00'),
+        'sum_acb_dispositions': Decimal('0'),
+        'units_held': Decimal('1.50'),
+        'outlays': Decimal('150.00'),
+        'proceeds': Decimal('0'),
+        'capital_gains': Decimal('0'),
+    }
+
+
+def test_csv_writer():
+    """
+    The CSV writer writes the report, in batches.
+    """
+    output = StringIO()
+    result = create_result()
+    writer = CSVWriter(output, batch_size=1)
+    writer.write_stream(iter(result['events'] * 2), result, 'btc')
+
+    assert output.getvalue() == (
+        'Asset,btc\n'
+        'Action,Major,Minor,Amount,Rate,Date,Adjusted Cost Base,Units Held,'
+        'Capital Gain,Total Capital Gains,Exchange Rate\n'
+        'buy,btc,cad,1.50,100,2018-01-02 03:04:05,150.00,1.50,0,0,1\n'
+        'buy,btc,cad,1.50,100,2018-01-02 03:04:05,150.00,1.50,0,0,1\n'
+        '-------\n'
+        'ACB,150.00\n'
+        'Sum ACB Dispositions,0\n'
+        'Units Held,1.50\n'
+        'Outlays,$150.00\n'
+        'Proceeds,$0\n'
+        'Capital gains,$0\n'
+    )
+
+
+def test_failed_stream_writes_nothing():
+    """
+    A stream of events that fails within its first batch leaves no header.
+    """
+    output = StringIO()
+    result = create_result()
+
+    def iter_events():
+        yield result['events'][0]
+        raise ValueError('Failed')
+
+    with pytest.raises(ValueError):
+        CSVWriter(output, batch_size=2).write_stream(iter_events(), result)
+
+    assert output.getvalue() == ''
+
+
+def test_json_lines_writer():
+    """
+    The JSON Lines writer writes an object for each event and the totals,
+    with exact amounts.
+    """
+    output = StringIO()
+    JSONLinesWriter(output).write_result(create_result(), 'btc')
+    lines = output.getvalue().splitlines()
+    event, totals = [json.loads(line) for line in lines]
+
+    assert event['record'] == 'event'
+    assert event['amount'] == '1.50'
+    assert event['dt'] == '2018-01-02T03:04:05'
+    assert totals == {
+        'record': 'totals',
+        'asset': 'btc',
+        'acb': '150.00',
+        'sum_acb_dispositions': '0',
+        'units_held': '1.50',
+        'outlays': '150.00',
+        'proceeds': '0',
+        'capital_gains': '0',
+    }
+
+
+def test_parquet_writer(tmpdir):
+    """
+    The Parquet writer writes the events.
+    """
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    from crypto_taxes.writers import ParquetWriter
+
+    path = str(tmpdir.join('events.parquet'))
+    writer = ParquetWriter(path)
+    writer.write_result(create_result(), 'btc')
+    writer.close()
+
+    table = pyarrow.parquet.read_table(path)
+
+    assert table.column('amount').to_pylist() == ['1.50']
+    assert table.column('asset').to_pylist() == ['btc']